@@ -0,0 +1,233 @@
+import asyncio
+from datetime import datetime
+from typing import List, Optional, Tuple
+
+import asyncpg
+
+from application import interfaces
+from application.dataclasses import LoopInfo
+from application.dataclasses.common import (
+    CourseEdge,
+    CourseInfo,
+    LoopInfoRecord,
+    MaxFlowRecord,
+    MethodInfo,
+    PlatformInfo,
+)
+from connection_config import async_params, connection_params
+
+LOOP_QUERY = """select tm.name as method,
+       p_1.name as platform_from,
+       p_2.name as platform_to,
+       cur_1.name as currency_from,
+       cur_2.name as currency_to,
+       c.rule_number,
+       c.tax
+from loop_path lp
+inner join courses c on c.id = lp.edge
+inner join tran_methods tm on tm.id = c.method
+inner join platforms p_1 on p_1.id = c.platform_from
+inner join platforms p_2 on p_2.id = c.platform_to
+inner join currencies cur_1 on c.currency_from = cur_1.id
+inner join currencies cur_2 on c.currency_to = cur_2.id
+where loop_id = $1 order by step_number"""
+
+COURSES_QUERY = """select cur1.name as currency_from, cur2.name as currency_to, c.rate, c.tax
+from courses c
+inner join currencies cur1 on cur1.id = c.currency_from
+inner join currencies cur2 on cur2.id = c.currency_to
+inner join unnest($3::text[], $4::text[]) as pairs (currency_from, currency_to)
+    on pairs.currency_from = cur1.name and pairs.currency_to = cur2.name
+where c.platform_from = $1
+and c.method = $2"""
+
+COURSE_EDGES_QUERY = """select tm.name as method,
+       p_1.name as platform_from,
+       p_2.name as platform_to,
+       cur_1.name as currency_from,
+       cur_2.name as currency_to,
+       c.rule_number,
+       c.rate,
+       c.tax
+from courses c
+inner join tran_methods tm on tm.id = c.method
+inner join platforms p_1 on p_1.id = c.platform_from
+inner join platforms p_2 on p_2.id = c.platform_to
+inner join currencies cur_1 on c.currency_from = cur_1.id
+inner join currencies cur_2 on c.currency_to = cur_2.id
+where c.rate > 0"""
+
+INSERT_LOOP_INFO = """insert into loop_info (loop_id, spread, max_flow, loop_speed, frequency, added)
+values ($1, $2, $3, $4, 's', $5)"""
+
+INSERT_MAX_FLOW = """insert into loop_max_flow (loop_id, profit, amount, added)
+values ($1, $2, $3, $4)"""
+
+
+class AsyncPooledLoopsRepo(interfaces.AsyncLoopsRepo):
+    """
+    AsyncLoopsRepo on an asyncpg pool.
+
+    The pool is created on first use in the running event loop. asyncpg
+    prepares and caches every statement per connection by itself.
+    """
+
+    def __init__(
+            self,
+            min_size: int = async_params['min_size'],
+            max_size: int = async_params['max_size'],
+            timeout: float = async_params['timeout']
+    ):
+        self.min_size = min_size
+        self.max_size = max_size
+        self.timeout = timeout
+        self._pool: Optional[asyncpg.pool.Pool] = None
+        self._pool_lock: Optional[asyncio.Lock] = None
+
+    async def pool(self) -> asyncpg.pool.Pool:
+        if self._pool is None:
+            if self._pool_lock is None:
+                self._pool_lock = asyncio.Lock()
+            async with self._pool_lock:
+                if self._pool is None:
+                    self._pool = await asyncpg.create_pool(
+                        host=connection_params['host'],
+                        port=connection_params['port'],
+                        user=connection_params['user'],
+                        password=connection_params['password'],
+                        database=connection_params['dbname'],
+                        min_size=self.min_size,
+                        max_size=self.max_size,
+                        timeout=self.timeout
+                    )
+        return self._pool
+
+    async def close(self) -> None:
+        if self._pool is not None:
+            await self._pool.close()
+            self._pool = None
+
+    async def get_loop_by_id(self, loop_id: int) -> List[LoopInfo]:
+        rows = await (await self.pool()).fetch(LOOP_QUERY, loop_id)
+        return [
+            LoopInfo(
+                method=res['method'],
+                platform_from=res['platform_from'],
+                platform_to=res['platform_to'],
+                currency_from=res['currency_from'],
+                currency_to=res['currency_to'],
+                rule_id=res['rule_number'],
+                tax=res['tax']
+            )
+            for res in rows
+        ]
+
+    async def get_curses_by_currency_name(
+            self,
+            currency_from: str,
+            currency_to: str,
+            platform_id: int,
+            method_id: int
+    ) -> Optional[float]:
+        return await (await self.pool()).fetchrow(
+            """select c.rate, c.tax from courses c
+            inner join currencies cur1 on cur1.id = c.currency_from
+            inner join currencies cur2 on cur2.id = c.currency_to
+            where c.platform_from = $1
+            and c.method = $2
+            and cur1.name = $3
+            and cur2.name = $4""",
+            platform_id, method_id, currency_from, currency_to
+        )
+
+    async def get_courses_by_pairs(
+            self,
+            pairs: List[Tuple[str, str]],
+            platform_id: int,
+            method_id: int
+    ) -> List[CourseInfo]:
+        if not pairs:
+            return []
+        rows = await (await self.pool()).fetch(
+            COURSES_QUERY,
+            platform_id,
+            method_id,
+            [pair[0] for pair in pairs],
+            [pair[1] for pair in pairs]
+        )
+        return [
+            CourseInfo(
+                currency_from=res['currency_from'],
+                currency_to=res['currency_to'],
+                rate=res['rate'],
+                tax=res['tax']
+            )
+            for res in rows
+        ]
+
+    async def get_course_edges(self) -> List[CourseEdge]:
+        rows = await (await self.pool()).fetch(COURSE_EDGES_QUERY)
+        return [
+            CourseEdge(
+                method=res['method'],
+                platform_from=res['platform_from'],
+                platform_to=res['platform_to'],
+                currency_from=res['currency_from'],
+                currency_to=res['currency_to'],
+                rule_id=res['rule_number'],
+                rate=res['rate'],
+                tax=res['tax']
+            )
+            for res in rows
+        ]
+
+    async def get_active_loop_ids(self, platform_id: int, method_id: int) -> List[int]:
+        rows = await (await self.pool()).fetch(
+            """select lp.loop_id
+            from loop_path lp
+            inner join courses c on c.id = lp.edge
+            group by lp.loop_id
+            having bool_and(c.platform_from = $1 and c.method = $2)
+            order by lp.loop_id""",
+            platform_id, method_id
+        )
+        return [res[0] for res in rows]
+
+    async def save_loop_info(
+            self,
+            loop_id: int,
+            spread: float,
+            max_flow: float,
+            loop_speed: float,
+            added: datetime
+    ) -> None:
+        await (await self.pool()).execute(INSERT_LOOP_INFO, loop_id, spread, max_flow, loop_speed, added)
+
+    async def save_loop_infos(self, records: List[LoopInfoRecord]) -> None:
+        if not records:
+            return
+        await (await self.pool()).executemany(
+            INSERT_LOOP_INFO,
+            [(record.loop_id, record.spread, record.max_flow, record.loop_speed, record.added) for record in records]
+        )
+
+    async def save_max_flow(self, record: MaxFlowRecord) -> None:
+        await (await self.pool()).execute(INSERT_MAX_FLOW, record.loop_id, record.profit, record.amount, record.added)
+
+    async def check_status(self, key: str) -> bool:
+        status = await (await self.pool()).fetchval('select status from clients cl where cl.key = $1', key)
+        return status == 2
+
+    async def get_method_info(self, method_name: str) -> Optional[MethodInfo]:
+        res = await (await self.pool()).fetchrow('select id, name from tran_methods where name = $1', method_name)
+        return MethodInfo(
+            method_id=res[0],
+            method_name=res[1]
+        ) if res else None
+
+    async def get_platform_info(self, platform_name: str) -> Optional[PlatformInfo]:
+        res = await (await self.pool()).fetchrow('select id, name from platforms where name = $1', platform_name)
+        return PlatformInfo(
+            platform_id=res[0],
+            platform_name=res[1]
+        ) if res else None
@@ -0,0 +1,173 @@
+import logging
+import select
+import threading
+import time
+from typing import Any, Callable, Dict, Hashable, List, Optional
+
+import psycopg2
+
+from adapters.repositories.decorator import LoopsRepoDecorator
+from application import interfaces
+from application.dataclasses import LoopInfo
+from application.dataclasses.common import CacheStats, MethodInfo, PlatformInfo
+from application.services.ttl_cache import MISSING, TTLCache
+from connection_config import cache_params, connection_params
+
+logger = logging.getLogger(__name__)
+
+
+class CachedLoopsRepo(LoopsRepoDecorator):
+    """
+    LoopsRepo decorator caching metadata that rarely changes.
+
+    Methods, platforms, loop paths and client keys are cached with their own
+    ttl, unknown values are cached for `negative_ttl`. Courses and writes are
+    always passed to the wrapped repository.
+    """
+
+    def __init__(
+            self,
+            repo: interfaces.LoopsRepo,
+            method_ttl: float = cache_params['method_ttl'],
+            platform_ttl: float = cache_params['platform_ttl'],
+            loop_ttl: float = cache_params['loop_ttl'],
+            client_ttl: float = cache_params['client_ttl'],
+            negative_ttl: float = cache_params['negative_ttl'],
+            loop_maxsize: int = cache_params['loop_maxsize'],
+            client_maxsize: int = cache_params['client_maxsize'],
+            clock: Callable[[], float] = time.monotonic
+    ):
+        super().__init__(repo)
+        self.method_ttl = method_ttl
+        self.platform_ttl = platform_ttl
+        self.loop_ttl = loop_ttl
+        self.client_ttl = client_ttl
+        self.negative_ttl = negative_ttl
+        self._methods = TTLCache(clock=clock)
+        self._platforms = TTLCache(clock=clock)
+        self._loops = TTLCache(maxsize=loop_maxsize, clock=clock)
+        self._clients = TTLCache(maxsize=client_maxsize, clock=clock)
+
+    def _cached(self, cache: TTLCache, key: Hashable, ttl: float, load: Callable[[], Any]) -> Any:
+        value = cache.get(key)
+        if value is MISSING:
+            value = load()
+            cache.set(key, value, ttl if value else self.negative_ttl)
+        return value
+
+    def get_loop_by_id(self, loop_id: int) -> List[LoopInfo]:
+        loop_info = self._cached(
+            self._loops, loop_id, self.loop_ttl, lambda: self.repo.get_loop_by_id(loop_id)
+        )
+        # Callers reorder the steps in place, so each of them gets its own list
+        return list(loop_info)
+
+    def check_status(self, key: str) -> bool:
+        return self._cached(
+            self._clients, key, self.client_ttl, lambda: self.repo.check_status(key)
+        )
+
+    def get_method_info(self, method_name: str) -> Optional[MethodInfo]:
+        return self._cached(
+            self._methods, method_name, self.method_ttl,
+            lambda: self.repo.get_method_info(method_name)
+        )
+
+    def get_platform_info(self, platform_name: str) -> Optional[PlatformInfo]:
+        return self._cached(
+            self._platforms, platform_name, self.platform_ttl,
+            lambda: self.repo.get_platform_info(platform_name)
+        )
+
+    def invalidate_loop(self, loop_id: Optional[int] = None) -> None:
+        self._loops.invalidate(loop_id)
+
+    def invalidate_client(self, key: Optional[str] = None) -> None:
+        self._clients.invalidate(key)
+
+    def invalidate_method(self, method_name: Optional[str] = None) -> None:
+        self._methods.invalidate(method_name)
+
+    def invalidate_platform(self, platform_name: Optional[str] = None) -> None:
+        self._platforms.invalidate(platform_name)
+
+    def invalidate_all(self) -> None:
+        for cache in (self._loops, self._clients, self._methods, self._platforms):
+            cache.invalidate()
+
+    def stats(self) -> Dict[str, CacheStats]:
+        return {
+            'loops': self._loops.stats(),
+            'clients': self._clients.stats(),
+            'methods': self._methods.stats(),
+            'platforms': self._platforms.stats(),
+        }
+
+
+class PgInvalidationListener(threading.Thread):
+    """
+    Invalidates CachedLoopsRepo entries on Postgres notifications.
+
+    Payload is "<entity>:<key>" where entity is one of loop, client, method,
+    platform or all, and key "*" drops every entry of the entity, e.g.
+    `notify loops_repo_invalidate, 'loop:12'`.
+    """
+
+    def __init__(
+            self,
+            cache: CachedLoopsRepo,
+            channel: str = cache_params['notify_channel'],
+            poll_interval: float = 5.0
+    ):
+        super().__init__(daemon=True)
+        self.cache = cache
+        self.channel = channel
+        self.poll_interval = poll_interval
+        self._stopped = threading.Event()
+
+    def handle(self, payload: str) -> None:
+        entity, _, key = payload.partition(':')
+        key = None if key in ('', '*') else key
+        if entity == 'loop':
+            try:
+                loop_id = int(key) if key is not None else None
+            except ValueError:
+                logger.warning('Ignoring invalidation of loop %r', key)
+                return
+            self.cache.invalidate_loop(loop_id)
+        elif entity == 'client':
+            self.cache.invalidate_client(key)
+        elif entity == 'method':
+            self.cache.invalidate_method(key)
+        elif entity == 'platform':
+            self.cache.invalidate_platform(key)
+        elif entity == 'all':
+            self.cache.invalidate_all()
+        else:
+            logger.warning('Ignoring invalidation payload %r', payload)
+
+    def run(self) -> None:
+        while not self._stopped.is_set():
+            try:
+                self._listen()
+            except psycopg2.Error:
+                # Anything could have changed while we were disconnected
+                self.cache.invalidate_all()
+                self._stopped.wait(self.poll_interval)
+
+    def _listen(self) -> None:
+        conn = psycopg2.connect(**connection_params)
+        try:
+            conn.autocommit = True
+            conn.cursor().execute(f'listen "{self.channel}"')
+            while not self._stopped.is_set():
+                if select.select([conn], [], [], self.poll_interval) == ([], [], []):
+                    continue
+                conn.poll()
+                while conn.notifies:
+                    self.handle(conn.notifies.pop(0).payload)
+        finally:
+            conn.close()
+
+    def stop(self) -> None:
+        self._stopped.set()
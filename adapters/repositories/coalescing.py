@@ -0,0 +1,56 @@
+from typing import List, Optional, Tuple
+
+from adapters.repositories.decorator import LoopsRepoDecorator
+from application import interfaces
+from application.dataclasses.common import CoalesceStats, CourseInfo
+from application.services.single_flight import SingleFlight
+from connection_config import coalesce_params
+
+
+class CoalescingLoopsRepo(LoopsRepoDecorator):
+    """LoopsRepo decorator sharing one query between concurrent identical course lookups"""
+
+    def __init__(
+            self,
+            repo: interfaces.LoopsRepo,
+            ttl: float = coalesce_params['rate_ttl'],
+            maxsize: Optional[int] = coalesce_params['maxsize']
+    ):
+        super().__init__(repo)
+        self.flights = SingleFlight(ttl=ttl, maxsize=maxsize)
+
+    def get_curses_by_currency_name(
+            self,
+            currency_from: str,
+            currency_to: str,
+            platform_id: int,
+            method_id: int
+    ) -> Optional[float]:
+        return self.flights.do(
+            ('course', currency_from, currency_to, platform_id, method_id),
+            lambda: self.repo.get_curses_by_currency_name(
+                currency_from=currency_from,
+                currency_to=currency_to,
+                platform_id=platform_id,
+                method_id=method_id
+            )
+        )
+
+    def get_courses_by_pairs(
+            self,
+            pairs: List[Tuple[str, str]],
+            platform_id: int,
+            method_id: int
+    ) -> List[CourseInfo]:
+        pairs = sorted(set(pairs))
+        return self.flights.do(
+            ('courses', tuple(pairs), platform_id, method_id),
+            lambda: self.repo.get_courses_by_pairs(
+                pairs=pairs,
+                platform_id=platform_id,
+                method_id=method_id
+            )
+        )
+
+    def stats(self) -> CoalesceStats:
+        return self.flights.stats()
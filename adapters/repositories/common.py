@@ -1,11 +1,18 @@
 from datetime import datetime
-from typing import List, Optional
+from typing import List, Optional, Tuple
 
 import psycopg2
-from psycopg2.extras import DictCursor
+from psycopg2.extras import DictCursor, execute_values
 
 from application.dataclasses import LoopInfo
-from application.dataclasses.common import MethodInfo, PlatformInfo
+from application.dataclasses.common import (
+    CourseEdge,
+    CourseInfo,
+    LoopInfoRecord,
+    MaxFlowRecord,
+    MethodInfo,
+    PlatformInfo,
+)
 from connection_config import connection_params
 from application import interfaces
 
@@ -70,6 +77,87 @@ class LoopsRepo(interfaces.LoopsRepo):
             )
             return cur.fetchone()
 
+    def get_courses_by_pairs(
+            self,
+            pairs: List[Tuple[str, str]],
+            platform_id: int,
+            method_id: int
+    ) -> List[CourseInfo]:
+        if not pairs:
+            return []
+        with psycopg2.connect(**connection_params) as conn:
+            cur = conn.cursor(cursor_factory=DictCursor)
+            cur.execute(
+                """select cur1.name as currency_from, cur2.name as currency_to, c.rate, c.tax
+                from courses c
+                inner join currencies cur1 on cur1.id = c.currency_from
+                inner join currencies cur2 on cur2.id = c.currency_to
+                where c.platform_from = %s
+                and c.method = %s
+                and (cur1.name, cur2.name) in %s
+                """,
+                (platform_id, method_id, tuple(pairs))
+            )
+            return [
+                CourseInfo(
+                    currency_from=res['currency_from'],
+                    currency_to=res['currency_to'],
+                    rate=res['rate'],
+                    tax=res['tax']
+                )
+                for res in cur.fetchall()
+            ]
+
+    def get_course_edges(self) -> List[CourseEdge]:
+        with psycopg2.connect(**connection_params) as conn:
+            cur = conn.cursor(cursor_factory=DictCursor)
+            cur.execute(
+                """select tm.name as method,
+                       p_1.name as platform_from,
+                       p_2.name as platform_to,
+                       cur_1.name as currency_from,
+                       cur_2.name as currency_to,
+                       c.rule_number,
+                       c.rate,
+                       c.tax
+                from courses c
+                inner join tran_methods tm on tm.id = c.method
+                inner join platforms p_1 on p_1.id = c.platform_from
+                inner join platforms p_2 on p_2.id = c.platform_to
+                inner join currencies cur_1 on c.currency_from = cur_1.id
+                inner join currencies cur_2 on c.currency_to = cur_2.id
+                where c.rate > 0
+                """
+            )
+            return [
+                CourseEdge(
+                    method=res['method'],
+                    platform_from=res['platform_from'],
+                    platform_to=res['platform_to'],
+                    currency_from=res['currency_from'],
+                    currency_to=res['currency_to'],
+                    rule_id=res['rule_number'],
+                    rate=res['rate'],
+                    tax=res['tax']
+                )
+                for res in cur.fetchall()
+            ]
+
+    def get_active_loop_ids(self, platform_id: int, method_id: int) -> List[int]:
+        with psycopg2.connect(**connection_params) as conn:
+            cur = conn.cursor()
+            cur.execute(
+                """select lp.loop_id
+                from loop_path lp
+                inner join courses c on c.id = lp.edge
+                group by lp.loop_id
+                having bool_and(c.platform_from = %s and c.method = %s)
+                order by lp.loop_id
+                """,
+                (platform_id, method_id)
+            )
+            return [res[0] for res in cur.fetchall()]
+
     def save_loop_info(
             self,
             loop_id: int,
@@ -86,6 +174,35 @@ class LoopsRepo(interfaces.LoopsRepo):
                 values ({loop_id}, {spread}, {max_flow}, {loop_speed}, 's', '{str(added)}')
                 """)
 
+    def save_loop_infos(self, records: List[LoopInfoRecord]) -> None:
+        if not records:
+            return
+        with psycopg2.connect(**connection_params) as conn:
+            cur = conn.cursor()
+            execute_values(
+                cur,
+                """
+                insert into loop_info (loop_id, spread, max_flow, loop_speed, frequency, added)
+                values %s
+                """,
+                [
+                    (record.loop_id, record.spread, record.max_flow, record.loop_speed, 's', record.added)
+                    for record in records
+                ],
+                page_size=len(records)
+            )
+
+    def save_max_flow(self, record: MaxFlowRecord) -> None:
+        with psycopg2.connect(**connection_params) as conn:
+            cur = conn.cursor()
+            cur.execute(
+                """
+                insert into loop_max_flow (loop_id, profit, amount, added)
+                values (%s, %s, %s, %s)
+                """,
+                (record.loop_id, record.profit, record.amount, record.added)
+            )
+
     def check_status(self, key: str) -> bool:
         with psycopg2.connect(**connection_params) as conn:
             cur = conn.cursor()
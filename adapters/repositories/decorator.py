@@ -0,0 +1,86 @@
+from datetime import datetime
+from typing import List, Optional, Tuple
+
+from application import interfaces
+from application.dataclasses import LoopInfo
+from application.dataclasses.common import (
+    CourseEdge,
+    CourseInfo,
+    LoopInfoRecord,
+    MaxFlowRecord,
+    MethodInfo,
+    PlatformInfo,
+)
+
+
+class LoopsRepoDecorator(interfaces.LoopsRepo):
+    """Passes every call to the wrapped repository; subclasses override what they change"""
+
+    def __init__(self, repo: interfaces.LoopsRepo):
+        self.repo = repo
+
+    def get_loop_by_id(self, loop_id: int) -> List[LoopInfo]:
+        return self.repo.get_loop_by_id(loop_id)
+
+    def get_curses_by_currency_name(
+            self,
+            currency_from: str,
+            currency_to: str,
+            platform_id: int,
+            method_id: int
+    ) -> Optional[float]:
+        return self.repo.get_curses_by_currency_name(
+            currency_from=currency_from,
+            currency_to=currency_to,
+            platform_id=platform_id,
+            method_id=method_id
+        )
+
+    def get_courses_by_pairs(
+            self,
+            pairs: List[Tuple[str, str]],
+            platform_id: int,
+            method_id: int
+    ) -> List[CourseInfo]:
+        return self.repo.get_courses_by_pairs(
+            pairs=pairs,
+            platform_id=platform_id,
+            method_id=method_id
+        )
+
+    def get_course_edges(self) -> List[CourseEdge]:
+        return self.repo.get_course_edges()
+
+    def get_active_loop_ids(self, platform_id: int, method_id: int) -> List[int]:
+        return self.repo.get_active_loop_ids(platform_id=platform_id, method_id=method_id)
+
+    def save_loop_info(
+            self,
+            loop_id: int,
+            spread: float,
+            max_flow: float,
+            loop_speed: float,
+            added: datetime
+    ) -> None:
+        self.repo.save_loop_info(
+            loop_id=loop_id,
+            spread=spread,
+            max_flow=max_flow,
+            loop_speed=loop_speed,
+            added=added
+        )
+
+    def save_loop_infos(self, records: List[LoopInfoRecord]) -> None:
+        self.repo.save_loop_infos(records)
+
+    def save_max_flow(self, record: MaxFlowRecord) -> None:
+        self.repo.save_max_flow(record)
+
+    def check_status(self, key: str) -> bool:
+        return self.repo.check_status(key)
+
+    def get_method_info(self, method_name: str) -> Optional[MethodInfo]:
+        return self.repo.get_method_info(method_name)
+
+    def get_platform_info(self, platform_name: str) -> Optional[PlatformInfo]:
+        return self.repo.get_platform_info(platform_name)
@@ -0,0 +1,85 @@
+from datetime import datetime
+from typing import List, Optional, Tuple
+
+from adapters.repositories.decorator import LoopsRepoDecorator
+from application.dataclasses import LoopInfo
+from application.dataclasses.common import (
+    CourseEdge,
+    CourseInfo,
+    LoopInfoRecord,
+    MaxFlowRecord,
+    MethodInfo,
+    PlatformInfo,
+)
+from application.services.metrics import metrics
+
+
+class InstrumentedLoopsRepo(LoopsRepoDecorator):
+    """
+    Times every call as a 'db' span named after the method.
+
+    Wrap the repository that actually queries Postgres, so calls answered by
+    caches above it are not counted as queries.
+    """
+
+    def get_loop_by_id(self, loop_id: int) -> List[LoopInfo]:
+        with metrics.span('db.get_loop_by_id', kind='db'):
+            return super().get_loop_by_id(loop_id)
+
+    def get_curses_by_currency_name(
+            self,
+            currency_from: str,
+            currency_to: str,
+            platform_id: int,
+            method_id: int
+    ) -> Optional[float]:
+        with metrics.span('db.get_curses_by_currency_name', kind='db'):
+            return super().get_curses_by_currency_name(currency_from, currency_to, platform_id, method_id)
+
+    def get_courses_by_pairs(
+            self,
+            pairs: List[Tuple[str, str]],
+            platform_id: int,
+            method_id: int
+    ) -> List[CourseInfo]:
+        with metrics.span('db.get_courses_by_pairs', kind='db'):
+            return super().get_courses_by_pairs(pairs, platform_id, method_id)
+
+    def get_course_edges(self) -> List[CourseEdge]:
+        with metrics.span('db.get_course_edges', kind='db'):
+            return super().get_course_edges()
+
+    def get_active_loop_ids(self, platform_id: int, method_id: int) -> List[int]:
+        with metrics.span('db.get_active_loop_ids', kind='db'):
+            return super().get_active_loop_ids(platform_id, method_id)
+
+    def save_loop_info(
+            self,
+            loop_id: int,
+            spread: float,
+            max_flow: float,
+            loop_speed: float,
+            added: datetime
+    ) -> None:
+        with metrics.span('db.save_loop_info', kind='db'):
+            super().save_loop_info(loop_id, spread, max_flow, loop_speed, added)
+
+    def save_loop_infos(self, records: List[LoopInfoRecord]) -> None:
+        with metrics.span('db.save_loop_infos', kind='db'):
+            super().save_loop_infos(records)
+
+    def save_max_flow(self, record: MaxFlowRecord) -> None:
+        with metrics.span('db.save_max_flow', kind='db'):
+            super().save_max_flow(record)
+
+    def check_status(self, key: str) -> bool:
+        with metrics.span('db.check_status', kind='db'):
+            return super().check_status(key)
+
+    def get_method_info(self, method_name: str) -> Optional[MethodInfo]:
+        with metrics.span('db.get_method_info', kind='db'):
+            return super().get_method_info(method_name)
+
+    def get_platform_info(self, platform_name: str) -> Optional[PlatformInfo]:
+        with metrics.span('db.get_platform_info', kind='db'):
+            return super().get_platform_info(platform_name)
@@ -0,0 +1,236 @@
+import asyncio
+import threading
+import time
+from collections import Counter
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from application import interfaces
+from application.dataclasses import LoopInfo
+from application.dataclasses.common import (
+    CourseEdge,
+    CourseInfo,
+    LoopInfoRecord,
+    MaxFlowRecord,
+    MethodInfo,
+    PlatformInfo,
+)
+
+
+class InMemoryLoopsRepo(interfaces.LoopsRepo):
+    """
+    LoopsRepo over plain dicts, for benchmarks and local runs without Postgres.
+
+    Courses are CourseEdge rows named like the database joins return them.
+    Every call is counted in `calls` by method name, and saved loop infos and
+    max flows are kept in `loop_infos` and `max_flows`. With `latency` every
+    call sleeps that many seconds, standing in for the database round trip.
+    """
+
+    def __init__(
+            self,
+            loops: Optional[Dict[int, List[LoopInfo]]] = None,
+            courses: Iterable[CourseEdge] = (),
+            platforms: Optional[Dict[str, int]] = None,
+            methods: Optional[Dict[str, int]] = None,
+            keys: Optional[Dict[str, int]] = None,
+            latency: float = 0.0
+    ):
+        self.loops = dict(loops or {})
+        self.courses = list(courses)
+        self.platforms = dict(platforms or {'OKX': 1})
+        self.methods = dict(methods or {'Trade': 1})
+        # Client key -> status, 2 is active like in the clients table
+        self.keys = dict(keys or {})
+        self.loop_infos: List[LoopInfoRecord] = []
+        self.max_flows: List[MaxFlowRecord] = []
+        self.calls: Counter = Counter()
+        self.latency = latency
+        self._lock = threading.Lock()
+        self._index_courses()
+
+    def _index_courses(self) -> None:
+        self._courses: Dict[Tuple[int, int, str, str], CourseEdge] = {}
+        for course in self.courses:
+            key = (
+                self.platforms.get(course.platform_from),
+                self.methods.get(course.method),
+                course.currency_from,
+                course.currency_to
+            )
+            self._courses.setdefault(key, course)
+
+    def _count(self, name: str) -> None:
+        with self._lock:
+            self.calls[name] += 1
+        if self.latency:
+            time.sleep(self.latency)
+
+    def add_course(self, course: CourseEdge) -> None:
+        self.courses.append(course)
+        self._index_courses()
+
+    def get_loop_by_id(self, loop_id: int) -> List[LoopInfo]:
+        self._count('get_loop_by_id')
+        return list(self.loops.get(loop_id, []))
+
+    def get_curses_by_currency_name(
+            self,
+            currency_from: str,
+            currency_to: str,
+            platform_id: int,
+            method_id: int
+    ) -> Optional[Dict[str, float]]:
+        self._count('get_curses_by_currency_name')
+        course = self._courses.get((platform_id, method_id, currency_from, currency_to))
+        # Keyed like the rows of the database repositories
+        return {'rate': course.rate, 'tax': course.tax} if course else None
+
+    def get_courses_by_pairs(
+            self,
+            pairs: List[Tuple[str, str]],
+            platform_id: int,
+            method_id: int
+    ) -> List[CourseInfo]:
+        self._count('get_courses_by_pairs')
+        courses = []
+        for currency_from, currency_to in pairs:
+            course = self._courses.get((platform_id, method_id, currency_from, currency_to))
+            if course:
+                courses.append(CourseInfo(
+                    currency_from=currency_from,
+                    currency_to=currency_to,
+                    rate=course.rate,
+                    tax=course.tax
+                ))
+        return courses
+
+    def get_course_edges(self) -> List[CourseEdge]:
+        self._count('get_course_edges')
+        return [course for course in self.courses if course.rate > 0]
+
+    def get_active_loop_ids(self, platform_id: int, method_id: int) -> List[int]:
+        self._count('get_active_loop_ids')
+        return sorted(
+            loop_id for loop_id, loop_info in self.loops.items()
+            if loop_info and all(
+                self.platforms.get(loop.platform_from) == platform_id and self.methods.get(loop.method) == method_id
+                for loop in loop_info
+            )
+        )
+
+    def save_loop_info(
+            self,
+            loop_id: int,
+            spread: float,
+            max_flow: float,
+            loop_speed: float,
+            added: datetime
+    ) -> None:
+        self._count('save_loop_info')
+        record = LoopInfoRecord(loop_id=loop_id, spread=spread, max_flow=max_flow, loop_speed=loop_speed, added=added)
+        with self._lock:
+            self.loop_infos.append(record)
+
+    def save_loop_infos(self, records: List[LoopInfoRecord]) -> None:
+        self._count('save_loop_infos')
+        with self._lock:
+            self.loop_infos.extend(records)
+
+    def save_max_flow(self, record: MaxFlowRecord) -> None:
+        self._count('save_max_flow')
+        with self._lock:
+            self.max_flows.append(record)
+
+    def check_status(self, key: str) -> bool:
+        self._count('check_status')
+        return self.keys.get(key) == 2
+
+    def get_method_info(self, method_name: str) -> Optional[MethodInfo]:
+        self._count('get_method_info')
+        method_id = self.methods.get(method_name)
+        return MethodInfo(method_id=method_id, method_name=method_name) if method_id is not None else None
+
+    def get_platform_info(self, platform_name: str) -> Optional[PlatformInfo]:
+        self._count('get_platform_info')
+        platform_id = self.platforms.get(platform_name)
+        return PlatformInfo(platform_id=platform_id, platform_name=platform_name) if platform_id is not None else None
+
+
+class AsyncInMemoryLoopsRepo(interfaces.AsyncLoopsRepo):
+    """
+    AsyncLoopsRepo over an InMemoryLoopsRepo.
+
+    Every call first awaits `latency` seconds, standing in for the database
+    round trip, so concurrent callers overlap like they do on a real pool.
+    """
+
+    def __init__(self, repo: InMemoryLoopsRepo, latency: float = 0.0):
+        self.repo = repo
+        self.latency = latency
+
+    async def _round_trip(self) -> None:
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+    async def get_loop_by_id(self, loop_id: int) -> List[LoopInfo]:
+        await self._round_trip()
+        return self.repo.get_loop_by_id(loop_id)
+
+    async def get_curses_by_currency_name(
+            self,
+            currency_from: str,
+            currency_to: str,
+            platform_id: int,
+            method_id: int
+    ) -> Optional[Dict[str, float]]:
+        await self._round_trip()
+        return self.repo.get_curses_by_currency_name(currency_from, currency_to, platform_id, method_id)
+
+    async def get_courses_by_pairs(
+            self,
+            pairs: List[Tuple[str, str]],
+            platform_id: int,
+            method_id: int
+    ) -> List[CourseInfo]:
+        await self._round_trip()
+        return self.repo.get_courses_by_pairs(pairs, platform_id, method_id)
+
+    async def get_course_edges(self) -> List[CourseEdge]:
+        await self._round_trip()
+        return self.repo.get_course_edges()
+
+    async def get_active_loop_ids(self, platform_id: int, method_id: int) -> List[int]:
+        await self._round_trip()
+        return self.repo.get_active_loop_ids(platform_id, method_id)
+
+    async def save_loop_info(
+            self,
+            loop_id: int,
+            spread: float,
+            max_flow: float,
+            loop_speed: float,
+            added: datetime
+    ) -> None:
+        await self._round_trip()
+        self.repo.save_loop_info(loop_id, spread, max_flow, loop_speed, added)
+
+    async def save_loop_infos(self, records: List[LoopInfoRecord]) -> None:
+        await self._round_trip()
+        self.repo.save_loop_infos(records)
+
+    async def save_max_flow(self, record: MaxFlowRecord) -> None:
+        await self._round_trip()
+        self.repo.save_max_flow(record)
+
+    async def check_status(self, key: str) -> bool:
+        await self._round_trip()
+        return self.repo.check_status(key)
+
+    async def get_method_info(self, method_name: str) -> Optional[MethodInfo]:
+        await self._round_trip()
+        return self.repo.get_method_info(method_name)
+
+    async def get_platform_info(self, platform_name: str) -> Optional[PlatformInfo]:
+        await self._round_trip()
+        return self.repo.get_platform_info(platform_name)
@@ -0,0 +1,383 @@
+import threading
+import time
+import weakref
+from contextlib import ExitStack, contextmanager
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+import psycopg2
+from psycopg2.extras import DictCursor, execute_values
+
+from application import errors, interfaces
+from application.dataclasses import LoopInfo
+from application.dataclasses.common import (
+    CourseEdge,
+    CourseInfo,
+    LoopInfoRecord,
+    MaxFlowRecord,
+    MethodInfo,
+    PlatformInfo,
+    PoolStats,
+)
+from connection_config import connection_params, pool_params
+
+# Hot queries are prepared once per pooled connection and then run with EXECUTE
+PREPARED_STATEMENTS: Dict[str, str] = {
+    'get_loop_by_id': """prepare get_loop_by_id (int) as
+        select tm.name as method,
+               p_1.name as platform_from,
+               p_2.name as platform_to,
+               cur_1.name as currency_from,
+               cur_2.name as currency_to,
+               c.rule_number,
+               c.tax
+        from loop_path lp
+        inner join courses c on c.id = lp.edge
+        inner join tran_methods tm on tm.id = c.method
+        inner join platforms p_1 on p_1.id = c.platform_from
+        inner join platforms p_2 on p_2.id = c.platform_to
+        inner join currencies cur_1 on c.currency_from = cur_1.id
+        inner join currencies cur_2 on c.currency_to = cur_2.id
+        where loop_id = $1 order by step_number""",
+    'get_curses_by_currency_name': """prepare get_curses_by_currency_name (int, int, text, text) as
+        select c.rate, c.tax from courses c
+        inner join currencies cur1 on cur1.id = c.currency_from
+        inner join currencies cur2 on cur2.id = c.currency_to
+        where c.platform_from = $1
+        and c.method = $2
+        and cur1.name = $3
+        and cur2.name = $4""",
+    'check_status': """prepare check_status (text) as
+        select status from clients cl where cl.key = $1""",
+    'get_method_info': """prepare get_method_info (text) as
+        select id, name from tran_methods where name = $1""",
+    'get_platform_info': """prepare get_platform_info (text) as
+        select id, name from platforms where name = $1""",
+}
+
+
+class PooledLoopsRepo(interfaces.LoopsRepo):
+    """
+    LoopsRepo that reuses connections from a bounded thread-safe pool.
+
+    At most `maxconn` connections are in use at a time, and every returned
+    connection stays open for the next checkout, so the pool keeps up to
+    `maxconn` idle ones. psycopg2's pools would close those above `minconn`,
+    which is then only the number of connections `warm_up` opens.
+    """
+
+    def __init__(
+            self,
+            minconn: int = pool_params['minconn'],
+            maxconn: int = pool_params['maxconn'],
+            timeout: Optional[float] = pool_params['timeout']
+    ):
+        self.minconn = minconn
+        self.maxconn = maxconn
+        self.timeout = timeout
+        # Connections are opened lazily so importing the app does not touch the database
+        self._idle: List = []
+        self._pool_lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(maxconn)
+        self._stats_lock = threading.Lock()
+        # Held by the connection itself, so a new connection never passes for a prepared one
+        self._prepared: weakref.WeakSet = weakref.WeakSet()
+        self._checked_out = 0
+        self._max_checked_out = 0
+        self._checkouts = 0
+        self._waits = 0
+        self._wait_time = 0.0
+
+    def _getconn(self):
+        with self._pool_lock:
+            while self._idle:
+                conn = self._idle.pop()
+                if not conn.closed:
+                    return conn
+        return psycopg2.connect(**connection_params)
+
+    def _putconn(self, conn, close: bool) -> None:
+        if not close and not conn.closed:
+            with self._pool_lock:
+                self._idle.append(conn)
+        elif not conn.closed:
+            conn.close()
+
+    def _acquire_slot(self) -> None:
+        if self._slots.acquire(blocking=False):
+            return
+        started = time.monotonic()
+        acquired = self._slots.acquire(
+            timeout=self.timeout if self.timeout is not None else -1
+        )
+        waited = time.monotonic() - started
+        with self._stats_lock:
+            self._waits += 1
+            self._wait_time += waited
+        if not acquired:
+            raise errors.ConnectionPoolError(timeout=self.timeout)
+
+    @contextmanager
+    def connection(self):
+        self._acquire_slot()
+        try:
+            conn = self._getconn()
+        except Exception:
+            self._slots.release()
+            raise
+        with self._stats_lock:
+            self._checkouts += 1
+            self._checked_out += 1
+            self._max_checked_out = max(self._max_checked_out, self._checked_out)
+        broken = False
+        try:
+            if not conn.autocommit:
+                conn.autocommit = True
+            yield conn
+        except (psycopg2.OperationalError, psycopg2.InterfaceError):
+            broken = True
+            raise
+        finally:
+            self._putconn(conn, close=broken)
+            with self._stats_lock:
+                self._checked_out -= 1
+            self._slots.release()
+
+    def _prepare(self, conn) -> None:
+        if conn not in self._prepared:
+            try:
+                with conn.cursor() as prepare_cur:
+                    for statement in PREPARED_STATEMENTS.values():
+                        prepare_cur.execute(statement)
+            except BaseException:
+                # Partly prepared, it would fail on the statements it has; closed, it leaves the pool
+                conn.close()
+                raise
+            self._prepared.add(conn)
+
+    def _execute_prepared(self, conn, name: str, params: tuple, cursor_factory=None):
+        self._prepare(conn)
+        cur = conn.cursor(cursor_factory=cursor_factory)
+        placeholders = ', '.join(['%s'] * len(params))
+        cur.execute(f'execute {name} ({placeholders})', params)
+        return cur
+
+    def warm_up(self, connections: Optional[int] = None) -> int:
+        """
+        Opens `connections` connections (minconn by default) at once, checks
+        each with a query and prepares the hot statements on it.
+        """
+        count = min(connections or self.minconn, self.maxconn)
+        with ExitStack() as stack:
+            for _ in range(count):
+                conn = stack.enter_context(self.connection())
+                with conn.cursor() as cur:
+                    cur.execute('select 1')
+                self._prepare(conn)
+        return count
+
+    def stats(self) -> PoolStats:
+        with self._pool_lock:
+            idle = len(self._idle)
+        with self._stats_lock:
+            return PoolStats(
+                size=self.maxconn,
+                idle=idle,
+                checked_out=self._checked_out,
+                max_checked_out=self._max_checked_out,
+                checkouts=self._checkouts,
+                waits=self._waits,
+                wait_time=self._wait_time
+            )
+
+    def close(self) -> None:
+        with self._pool_lock:
+            idle, self._idle = self._idle, []
+        for conn in idle:
+            conn.close()
+
+    def get_loop_by_id(self, loop_id: int) -> List[LoopInfo]:
+        with self.connection() as conn:
+            cur = self._execute_prepared(
+                conn, 'get_loop_by_id', (loop_id,), cursor_factory=DictCursor
+            )
+            return [
+                LoopInfo(
+                    method=res['method'],
+                    platform_from=res['platform_from'],
+                    platform_to=res['platform_to'],
+                    currency_from=res['currency_from'],
+                    currency_to=res['currency_to'],
+                    rule_id=res['rule_number'],
+                    tax=res['tax']
+                )
+                for res in cur.fetchall()
+            ]
+
+    def get_curses_by_currency_name(
+            self,
+            currency_from: str,
+            currency_to: str,
+            platform_id: int,
+            method_id: int
+    ) -> Optional[float]:
+        with self.connection() as conn:
+            cur = self._execute_prepared(
+                conn,
+                'get_curses_by_currency_name',
+                (platform_id, method_id, currency_from, currency_to),
+                cursor_factory=DictCursor
+            )
+            return cur.fetchone()
+
+    def get_courses_by_pairs(
+            self,
+            pairs: List[Tuple[str, str]],
+            platform_id: int,
+            method_id: int
+    ) -> List[CourseInfo]:
+        if not pairs:
+            return []
+        with self.connection() as conn:
+            cur = conn.cursor(cursor_factory=DictCursor)
+            cur.execute(
+                """select cur1.name as currency_from, cur2.name as currency_to, c.rate, c.tax
+                from courses c
+                inner join currencies cur1 on cur1.id = c.currency_from
+                inner join currencies cur2 on cur2.id = c.currency_to
+                where c.platform_from = %s
+                and c.method = %s
+                and (cur1.name, cur2.name) in %s
+                """,
+                (platform_id, method_id, tuple(pairs))
+            )
+            return [
+                CourseInfo(
+                    currency_from=res['currency_from'],
+                    currency_to=res['currency_to'],
+                    rate=res['rate'],
+                    tax=res['tax']
+                )
+                for res in cur.fetchall()
+            ]
+
+    def get_course_edges(self) -> List[CourseEdge]:
+        with self.connection() as conn:
+            cur = conn.cursor(cursor_factory=DictCursor)
+            cur.execute(
+                """select tm.name as method,
+                       p_1.name as platform_from,
+                       p_2.name as platform_to,
+                       cur_1.name as currency_from,
+                       cur_2.name as currency_to,
+                       c.rule_number,
+                       c.rate,
+                       c.tax
+                from courses c
+                inner join tran_methods tm on tm.id = c.method
+                inner join platforms p_1 on p_1.id = c.platform_from
+                inner join platforms p_2 on p_2.id = c.platform_to
+                inner join currencies cur_1 on c.currency_from = cur_1.id
+                inner join currencies cur_2 on c.currency_to = cur_2.id
+                where c.rate > 0
+                """
+            )
+            return [
+                CourseEdge(
+                    method=res['method'],
+                    platform_from=res['platform_from'],
+                    platform_to=res['platform_to'],
+                    currency_from=res['currency_from'],
+                    currency_to=res['currency_to'],
+                    rule_id=res['rule_number'],
+                    rate=res['rate'],
+                    tax=res['tax']
+                )
+                for res in cur.fetchall()
+            ]
+
+    def get_active_loop_ids(self, platform_id: int, method_id: int) -> List[int]:
+        with self.connection() as conn:
+            cur = conn.cursor()
+            cur.execute(
+                """select lp.loop_id
+                from loop_path lp
+                inner join courses c on c.id = lp.edge
+                group by lp.loop_id
+                having bool_and(c.platform_from = %s and c.method = %s)
+                order by lp.loop_id
+                """,
+                (platform_id, method_id)
+            )
+            return [res[0] for res in cur.fetchall()]
+
+    def save_loop_info(
+            self,
+            loop_id: int,
+            spread: float,
+            max_flow: float,
+            loop_speed: float,
+            added: datetime
+    ) -> None:
+        with self.connection() as conn:
+            cur = conn.cursor()
+            cur.execute(
+                """
+                insert into loop_info (loop_id, spread, max_flow, loop_speed, frequency, added)
+                values (%s, %s, %s, %s, 's', %s)
+                """,
+                (loop_id, spread, max_flow, loop_speed, added)
+            )
+
+    def save_loop_infos(self, records: List[LoopInfoRecord]) -> None:
+        if not records:
+            return
+        with self.connection() as conn:
+            cur = conn.cursor()
+            execute_values(
+                cur,
+                """
+                insert into loop_info (loop_id, spread, max_flow, loop_speed, frequency, added)
+                values %s
+                """,
+                [
+                    (record.loop_id, record.spread, record.max_flow, record.loop_speed, 's', record.added)
+                    for record in records
+                ],
+                page_size=len(records)
+            )
+
+    def save_max_flow(self, record: MaxFlowRecord) -> None:
+        with self.connection() as conn:
+            cur = conn.cursor()
+            cur.execute(
+                """
+                insert into loop_max_flow (loop_id, profit, amount, added)
+                values (%s, %s, %s, %s)
+                """,
+                (record.loop_id, record.profit, record.amount, record.added)
+            )
+
+    def check_status(self, key: str) -> bool:
+        with self.connection() as conn:
+            cur = self._execute_prepared(conn, 'check_status', (key,))
+            info = cur.fetchall()
+            return len(info) != 0 and info[0][0] == 2
+
+    def get_method_info(self, method_name: str) -> Optional[MethodInfo]:
+        with self.connection() as conn:
+            cur = self._execute_prepared(conn, 'get_method_info', (method_name,))
+            res = cur.fetchone()
+            return MethodInfo(
+                method_id=res[0],
+                method_name=res[1]
+            ) if res else None
+
+    def get_platform_info(self, platform_name: str) -> Optional[PlatformInfo]:
+        with self.connection() as conn:
+            cur = self._execute_prepared(conn, 'get_platform_info', (platform_name,))
+            res = cur.fetchone()
+            return PlatformInfo(
+                platform_id=res[0],
+                platform_name=res[1]
+            ) if res else None
@@ -0,0 +1,180 @@
+import atexit
+import logging
+import queue
+import threading
+import time
+from datetime import datetime
+from typing import List, Optional
+
+from adapters.repositories.decorator import LoopsRepoDecorator
+from application import errors, interfaces
+from application.dataclasses.common import LoopInfoRecord, WriterStats
+from connection_config import writer_params
+
+logger = logging.getLogger(__name__)
+
+
+class LoopInfoWriter:
+    """
+    Buffers loop_info rows and inserts them in batches from one thread.
+
+    A batch is written when `max_batch` rows are pending or `flush_interval`
+    seconds passed since its first row. Rows are written in the order they
+    were queued. A full buffer blocks `put` for `put_timeout` seconds and then
+    raises WriteBufferFullError, so a slow database pushes back on callers
+    instead of growing memory.
+    """
+
+    def __init__(
+            self,
+            repo: interfaces.LoopsRepo,
+            max_batch: int = writer_params['max_batch'],
+            flush_interval: float = writer_params['flush_interval'],
+            max_queue: int = writer_params['max_queue'],
+            put_timeout: Optional[float] = writer_params['put_timeout'],
+            retries: int = writer_params['retries']
+    ):
+        self.repo = repo
+        self.max_batch = max_batch
+        self.flush_interval = flush_interval
+        self.max_queue = max_queue
+        self.put_timeout = put_timeout
+        self.retries = retries
+        self._queue: 'queue.Queue[Optional[LoopInfoRecord]]' = queue.Queue(maxsize=max_queue)
+        self._stats_lock = threading.Lock()
+        self._queued = 0
+        self._flushed = 0
+        self._failed = 0
+        self._flushes = 0
+        self._last_flush_latency = 0.0
+        self._max_flush_latency = 0.0
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name='loop-info-writer', daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def put(self, record: LoopInfoRecord) -> None:
+        if self._closed:
+            raise RuntimeError('LoopInfoWriter is closed')
+        try:
+            self._queue.put(record, timeout=self.put_timeout)
+        except queue.Full:
+            raise errors.WriteBufferFullError(size=self.max_queue)
+        with self._stats_lock:
+            self._queued += 1
+
+    def flush(self) -> None:
+        """Blocks until every row queued so far is written or given up on"""
+        self._queue.join()
+
+    def close(self) -> None:
+        """Writes the pending rows and stops the writer thread"""
+        if self._closed:
+            return
+        self._closed = True
+        self._queue.put(None)
+        self._thread.join()
+        # Rows a concurrent put queued behind the stop marker
+        leftovers = []
+        while True:
+            try:
+                leftovers.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+            self._queue.task_done()
+        if leftovers:
+            self._write(leftovers)
+
+    def stats(self) -> WriterStats:
+        with self._stats_lock:
+            return WriterStats(
+                queued=self._queued,
+                flushed=self._flushed,
+                failed=self._failed,
+                pending=self._queue.qsize(),
+                flushes=self._flushes,
+                last_flush_latency=self._last_flush_latency,
+                max_flush_latency=self._max_flush_latency
+            )
+
+    def _run(self) -> None:
+        stopping = False
+        while not stopping:
+            batch: List[LoopInfoRecord] = []
+            record = self._queue.get()
+            if record is None:
+                stopping = True
+            else:
+                batch.append(record)
+                deadline = time.monotonic() + self.flush_interval
+                while len(batch) < self.max_batch:
+                    try:
+                        record = self._queue.get(timeout=max(deadline - time.monotonic(), 0))
+                    except queue.Empty:
+                        break
+                    if record is None:
+                        stopping = True
+                        break
+                    batch.append(record)
+            if batch:
+                self._write(batch)
+            # task_done for the batch and the stop marker, if it was taken
+            for _ in range(len(batch) + int(record is None)):
+                self._queue.task_done()
+
+    def _write(self, batch: List[LoopInfoRecord]) -> None:
+        started = time.monotonic()
+        for attempt in range(self.retries + 1):
+            try:
+                self.repo.save_loop_infos(batch)
+                break
+            except Exception:
+                if attempt == self.retries:
+                    logger.exception('Dropped %s loop_info rows after %s attempts', len(batch), attempt + 1)
+                    with self._stats_lock:
+                        self._failed += len(batch)
+                    return
+                time.sleep(min(0.1 * 2 ** attempt, self.flush_interval))
+        latency = time.monotonic() - started
+        with self._stats_lock:
+            self._flushed += len(batch)
+            self._flushes += 1
+            self._last_flush_latency = latency
+            self._max_flush_latency = max(self._max_flush_latency, latency)
+
+
+class WriteBehindLoopsRepo(LoopsRepoDecorator):
+    """LoopsRepo decorator whose save_loop_info returns once the row is buffered"""
+
+    def __init__(self, repo: interfaces.LoopsRepo, writer: Optional[LoopInfoWriter] = None):
+        super().__init__(repo)
+        self.writer = writer or LoopInfoWriter(repo)
+
+    def save_loop_info(
+            self,
+            loop_id: int,
+            spread: float,
+            max_flow: float,
+            loop_speed: float,
+            added: datetime
+    ) -> None:
+        self.writer.put(LoopInfoRecord(
+            loop_id=loop_id,
+            spread=spread,
+            max_flow=max_flow,
+            loop_speed=loop_speed,
+            added=added
+        ))
+
+    def save_loop_infos(self, records: List[LoopInfoRecord]) -> None:
+        for record in records:
+            self.writer.put(record)
+
+    def flush(self) -> None:
+        self.writer.flush()
+
+    def close(self) -> None:
+        self.writer.close()
+
+    def stats(self) -> WriterStats:
+        return self.writer.stats()
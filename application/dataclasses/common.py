@@ -1,4 +1,5 @@
-from typing import List, Optional
+from datetime import datetime
+from typing import Dict, List, Optional
 
 from pydantic import Field
 from pydantic.dataclasses import dataclass
@@ -35,6 +36,14 @@ class BookOrderConverted(StepLoopInfo):
     total_amount: float = Field(description='Total number of sentences in the glass at the current rate')
 
 
+@dataclass
+class CourseInfo:
+    currency_from: str = Field(description='Currency from which we transfer')
+    currency_to: str = Field(description='currency in which we transfer')
+    rate: float = Field(description='Rate of exchange')
+    tax: float = Field(description='Tax')
+
+
 @dataclass
 class CurrenciesPairs:
     pair_names: str = Field(description='Currencies name pair')
@@ -69,6 +78,21 @@ class OKXResponse(LoopProfit):
     data: List[BookOrderParsed] = Field(description='Data from the sales book')
 
 
+@dataclass
+class LoopJob:
+    loop_id: int = Field(description='Loop id')
+    currency_name: str = Field(description='Base coin of the loop')
+    profit: Optional[float] = Field(default=None, description='Minimum profitability of the loop')
+    amount: Optional[float] = Field(default=None, description='Amount of currency')
+
+
+@dataclass
+class LoopJobResult(LoopProfit):
+    loop_id: int = Field(description='Loop id')
+    data: List[BookOrderParsed] = Field(default_factory=list, description='Data from the sales book')
+    error: Optional[str] = Field(default=None, description='Why the loop could not be evaluated')
+
+
 @dataclass
 class MethodInfo:
     method_id: int = Field(description='Method id')
@@ -79,3 +103,138 @@ class MethodInfo:
 class PlatformInfo:
     platform_id: int = Field(description='Platform id')
     platform_name: str = Field(description='Platform name')
+
+
+@dataclass
+class PoolStats:
+    size: int = Field(description='Maximum number of connections in the pool')
+    idle: int = Field(description='Open connections waiting for the next checkout')
+    checked_out: int = Field(description='Connections currently in use')
+    max_checked_out: int = Field(description='Highest number of connections used at the same time')
+    checkouts: int = Field(description='Total number of connection checkouts')
+    waits: int = Field(description='Checkouts that had to wait for a free connection')
+    wait_time: float = Field(description='Total seconds spent waiting for a free connection')
+
+
+@dataclass
+class CacheStats:
+    hits: int = Field(description='Lookups served from the cache')
+    misses: int = Field(description='Lookups passed to the repository')
+    size: int = Field(description='Entries currently stored')
+
+
+@dataclass
+class LoopInfoRecord:
+    loop_id: int = Field(description='Loop id')
+    spread: float = Field(description='Loop profit')
+    max_flow: float = Field(description='Maximum amount going through the loop')
+    loop_speed: float = Field(description='Loop speed')
+    added: datetime = Field(description='When the loop was evaluated')
+
+
+@dataclass
+class MaxFlowRecord:
+    loop_id: int = Field(description='Loop id')
+    profit: float = Field(description='Loop profit at the book prices, in percent of the input')
+    amount: float = Field(description='Largest input in the base coin still meeting the profit threshold')
+    added: datetime = Field(description='When the loop was evaluated')
+
+
+@dataclass
+class WriterStats:
+    queued: int = Field(description='Rows accepted by the buffer')
+    flushed: int = Field(description='Rows written to the database')
+    failed: int = Field(description='Rows dropped after all retries failed')
+    pending: int = Field(description='Rows waiting in the buffer')
+    flushes: int = Field(description='Bulk inserts executed')
+    last_flush_latency: float = Field(description='Seconds taken by the last bulk insert')
+    max_flush_latency: float = Field(description='Longest bulk insert in seconds')
+
+
+@dataclass
+class ScannerStats:
+    loops: int = Field(description='Loops scheduled by the scanner')
+    cycles: int = Field(description='Scan cycles run')
+    evaluated: int = Field(description='Loop evaluations finished')
+    failed: int = Field(description='Loop evaluations that raised an error')
+    profitable: int = Field(description='Loops profitable at their last evaluation')
+    last_cycle_time: float = Field(description='Seconds taken by the last cycle')
+    loops_per_second: float = Field(description='Evaluations per second over the last cycle')
+
+
+@dataclass
+class CourseEdge(LoopInfo):
+    rate: float = Field(description='Rate of exchange')
+
+
+@dataclass
+class LoopCandidate:
+    base_coin: str = Field(description='Currency the loop starts and ends with')
+    profit: float = Field(description='Profit at the course rates after taxes, in percent')
+    steps: List[LoopInfo] = Field(description='Steps of the loop in order')
+
+
+@dataclass
+class IncrementalStats:
+    loops: int = Field(description='Loops kept current')
+    legs: int = Field(description='Distinct legs shared by those loops')
+    updates: int = Field(description='Book and course changes that touched a loop')
+    legs_walked: int = Field(description='Leg level computations')
+    loops_evaluated: int = Field(description='Loop evaluations')
+    pending: int = Field(description='Loops waiting for the next refresh')
+
+
+@dataclass
+class CoalesceStats:
+    requests: int = Field(description='Calls made by callers')
+    upstream: int = Field(description='Calls passed to the upstream')
+    coalesced: int = Field(description='Calls that waited for an identical call in flight')
+    cached: int = Field(description='Calls answered by a result younger than the ttl')
+    errors: int = Field(description='Upstream calls that raised')
+    in_flight: int = Field(description='Upstream calls running now')
+
+
+@dataclass
+class SchedulerStats:
+    sent: int = Field(description='Requests sent to OKX, retries included')
+    retried: int = Field(description='Answers 429 or 5xx that were retried')
+    queued: int = Field(description='Requests waiting for a token now')
+    wait_p50: Dict[str, float] = Field(description='Median wait for a token per priority, bucket bound in seconds')
+    wait_p99: Dict[str, float] = Field(description='99th percentile wait for a token per priority, bucket bound in seconds')
+
+
+@dataclass
+class SweepPoint:
+    base_coin: str = Field(description='Base coin the loop starts and ends with')
+    amount: float = Field(description='Loop input in the base coin')
+    output: Optional[float] = Field(description='Loop output in the base coin, None when the books are too thin')
+    profit: Optional[float] = Field(description='Profit in percent of the input after slippage and taxes')
+    threshold: Optional[float] = Field(
+        default=None, description='Profit threshold this point is the largest input for, None for grid amounts'
+    )
+
+
+@dataclass
+class LoopSweep:
+    loop_id: int = Field(description='Loop id')
+    points: List[SweepPoint] = Field(default_factory=list, description='Curve points per base coin')
+    errors: Dict[str, str] = Field(default_factory=dict, description='Why a base coin could not be swept')
+
+
+@dataclass
+class BacktestPoint:
+    ts: int = Field(description='Replay time in ms')
+    profit: Optional[float] = Field(default=None, description='Loop profit on the books of that moment')
+    amount: Optional[float] = Field(default=None, description='Loop amount on the books of that moment')
+    error: Optional[str] = Field(default=None, description='Why the loop could not be evaluated at that moment')
+
+
+@dataclass
+class WarmUpStats:
+    ready: bool = Field(description='Whether every required step of the warm-up succeeded')
+    time_to_ready: Optional[float] = Field(default=None, description='Seconds from the start of the warm-up until ready')
+    steps: Dict[str, float] = Field(default_factory=dict, description='Seconds taken by each finished step')
+    connections: int = Field(default=0, description='Database connections opened and checked')
+    loops: int = Field(default=0, description='Loop paths loaded into the cache')
+    books: int = Field(default=0, description='Order books fetched for the most used instruments')
+    errors: Dict[str, str] = Field(default_factory=dict, description='Error of each failed step')
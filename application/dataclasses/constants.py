@@ -4,3 +4,9 @@ import enum
 class OrderTypes(str, enum.Enum):
     asks = 'asks'
     bids = 'bids'
+
+
+class RequestPriority(enum.IntEnum):
+    # Lower values are sent first
+    interactive = 0
+    background = 1
@@ -0,0 +1,182 @@
+"""Compact column representation of converted order book levels"""
+from typing import List, NamedTuple, Optional, Sequence, Union
+
+import numpy as np
+
+from application.dataclasses.common import (
+    BookOrderConverted,
+    BookOrderParsed,
+    LoopProfit,
+    OKXResponse,
+)
+
+
+class LevelLeg(NamedTuple):
+    """Fields shared by every level of one loop step"""
+    currency_from: str
+    currency_to: str
+    rule_id: int
+    platform_from: str
+    platform_to: str
+    rate: float
+    tax: float
+
+
+class OrderBookLevels:
+    """
+    Levels of one or more loop steps stored as parallel float64 columns.
+
+    Leg fields repeated on every level are kept once in `legs` and referenced
+    by `leg_index`. Pydantic objects are only built by `to_book_orders` and
+    `to_parsed`.
+    """
+    __slots__ = ('legs', 'leg_index', 'quantity_for_translation', 'quantity_base_currency', 'total_amount')
+
+    def __init__(
+            self,
+            legs: List[LevelLeg],
+            leg_index: np.ndarray,
+            quantity_for_translation: np.ndarray,
+            quantity_base_currency: np.ndarray,
+            total_amount: np.ndarray
+    ):
+        self.legs = legs
+        self.leg_index = leg_index
+        self.quantity_for_translation = quantity_for_translation
+        self.quantity_base_currency = quantity_base_currency
+        self.total_amount = total_amount
+
+    @classmethod
+    def from_leg(
+            cls,
+            leg: LevelLeg,
+            quantity_for_translation: np.ndarray,
+            quantity_base_currency: np.ndarray
+    ) -> 'OrderBookLevels':
+        return cls(
+            legs=[leg],
+            leg_index=np.zeros(len(quantity_for_translation), dtype=np.int32),
+            quantity_for_translation=quantity_for_translation,
+            quantity_base_currency=quantity_base_currency,
+            total_amount=np.cumsum(quantity_base_currency)
+        )
+
+    @classmethod
+    def merge(cls, parts: Sequence['OrderBookLevels']) -> 'OrderBookLevels':
+        """All levels of `parts` ordered by total_amount, ties keep their original order"""
+        if not parts:
+            return cls([], np.zeros(0, dtype=np.int32), np.zeros(0), np.zeros(0), np.zeros(0))
+        legs, leg_index, offset = [], [], 0
+        for part in parts:
+            legs.extend(part.legs)
+            leg_index.append(part.leg_index + offset)
+            offset += len(part.legs)
+        merged = cls(
+            legs=legs,
+            leg_index=np.concatenate(leg_index),
+            quantity_for_translation=np.concatenate([part.quantity_for_translation for part in parts]),
+            quantity_base_currency=np.concatenate([part.quantity_base_currency for part in parts]),
+            total_amount=np.concatenate([part.total_amount for part in parts])
+        )
+        return merged[np.argsort(merged.total_amount, kind='stable')]
+
+    def __len__(self) -> int:
+        return len(self.total_amount)
+
+    def __getitem__(self, index: Union[slice, np.ndarray]) -> 'OrderBookLevels':
+        return OrderBookLevels(
+            legs=self.legs,
+            leg_index=self.leg_index[index],
+            quantity_for_translation=self.quantity_for_translation[index],
+            quantity_base_currency=self.quantity_base_currency[index],
+            total_amount=self.total_amount[index]
+        )
+
+    def to_book_orders(self) -> List[BookOrderConverted]:
+        return [
+            BookOrderConverted(
+                currency_from=leg.currency_from,
+                currency_to=leg.currency_to,
+                rate=leg.rate,
+                quantity_for_translation=quantity_for_translation,
+                quantity_base_currency=quantity_base_currency,
+                total_amount=total_amount,
+                rule_id=leg.rule_id,
+                platform_from=leg.platform_from,
+                platform_to=leg.platform_to,
+                tax=leg.tax
+            )
+            for leg, quantity_for_translation, quantity_base_currency, total_amount in zip(
+                (self.legs[i] for i in self.leg_index.tolist()),
+                self.quantity_for_translation.tolist(),
+                self.quantity_base_currency.tolist(),
+                self.total_amount.tolist()
+            )
+        ]
+
+    def to_parsed(self, method: str) -> List[BookOrderParsed]:
+        return [
+            BookOrderParsed(
+                platform_from=leg.platform_from,
+                platform_to=leg.platform_to,
+                method=method,
+                currency_from=leg.currency_from,
+                currency_to=leg.currency_to,
+                rate=leg.rate,
+                rule_id=leg.rule_id,
+                tax=leg.tax,
+                sum_start=quantity_for_translation,
+                sum_end=quantity_base_currency
+            )
+            for leg, quantity_for_translation, quantity_base_currency in zip(
+                (self.legs[i] for i in self.leg_index.tolist()),
+                self.quantity_for_translation.tolist(),
+                self.quantity_base_currency.tolist()
+            )
+        ]
+
+
+class LoopEvaluation:
+    """
+    Result of evaluating a loop; the levels become `data` only when a response is built.
+
+    `leg_ts` holds the OKX time in ms of the book of every step, `skew_ms` the
+    time between the oldest and newest of them. `stale` is set when the
+    deadline ran out before every book was in, or the legs were too far apart.
+    With `solver` 'bisect' the profit is in percent of the input and the
+    amount is the input itself, at book prices; see OKXTradeOnlineParser.
+    """
+    __slots__ = ('loop_profit', 'levels', 'method', 'leg_ts', 'skew_ms', 'stale', 'solver')
+
+    def __init__(
+            self,
+            loop_profit: Optional[LoopProfit],
+            levels: OrderBookLevels,
+            method: str,
+            leg_ts: Optional[List[Optional[int]]] = None,
+            skew_ms: Optional[int] = None,
+            stale: bool = False,
+            solver: str = 'depth'
+    ):
+        self.loop_profit = loop_profit
+        self.levels = levels
+        self.method = method
+        self.leg_ts = leg_ts or []
+        self.skew_ms = skew_ms
+        self.stale = stale
+        self.solver = solver
+
+    @property
+    def profit(self) -> Optional[float]:
+        return self.loop_profit.profit if self.loop_profit else None
+
+    @property
+    def amount(self) -> Optional[float]:
+        return self.loop_profit.amount if self.loop_profit else None
+
+    @property
+    def data(self) -> List[BookOrderParsed]:
+        return self.levels.to_parsed(self.method)
+
+    def to_response(self) -> OKXResponse:
+        return OKXResponse(profit=self.profit, amount=self.amount, data=self.data)
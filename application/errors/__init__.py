@@ -1,6 +1,12 @@
 from .common_error import (
+    AppError,
     GetCurseError,
     GerMethodError,
     GerPlatformError,
     GetLoopError,
+    ConnectionPoolError,
+    GetOrdersBookError,
+    BaseCoinError,
+    WriteBufferFullError,
+    LegSkewError,
 )
@@ -32,3 +32,23 @@ class GerPlatformError(AppError):
 
 class GetLoopError(AppError):
     msg_template = 'Get loop error for loop_id: "{loop_id}"'
+
+
+class ConnectionPoolError(AppError):
+    msg_template = 'No free connection in pool after waiting {timeout} seconds'
+
+
+class GetOrdersBookError(AppError):
+    msg_template = 'Get orders book error for pair: "{pair}"'
+
+
+class BaseCoinError(AppError):
+    msg_template = 'Currency "{currency}" is not a step of the loop'
+
+
+class WriteBufferFullError(AppError):
+    msg_template = 'Loop info buffer is full ({size} rows)'
+
+
+class LegSkewError(AppError):
+    msg_template = 'Books of the loop legs are {skew_ms} ms apart, more than {max_skew_ms} ms'
@@ -1 +1 @@
-from .common import LoopsRepo
+from .common import AsyncLoopsRepo, BookSource, LoopsRepo
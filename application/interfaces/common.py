@@ -1,9 +1,16 @@
 from abc import ABC, abstractmethod
 from datetime import datetime
-from typing import List, Optional
+from typing import List, Optional, Tuple
 
 from application.dataclasses import LoopInfo
-from application.dataclasses.common import MethodInfo, PlatformInfo
+from application.dataclasses.common import (
+    CourseEdge,
+    CourseInfo,
+    LoopInfoRecord,
+    MaxFlowRecord,
+    MethodInfo,
+    PlatformInfo,
+)
 
 
 class LoopsRepo(ABC):
@@ -22,6 +29,23 @@ class LoopsRepo(ABC):
     ) -> Optional[float]:
         ...
 
+    @abstractmethod
+    def get_courses_by_pairs(
+            self,
+            pairs: List[Tuple[str, str]],
+            platform_id: int,
+            method_id: int
+    ) -> List[CourseInfo]:
+        ...
+
+    @abstractmethod
+    def get_course_edges(self) -> List[CourseEdge]:
+        ...
+
+    @abstractmethod
+    def get_active_loop_ids(self, platform_id: int, method_id: int) -> List[int]:
+        ...
+
     @abstractmethod
     def save_loop_info(
             self,
@@ -33,6 +57,14 @@ class LoopsRepo(ABC):
     ) -> None:
         ...
 
+    @abstractmethod
+    def save_loop_infos(self, records: List[LoopInfoRecord]) -> None:
+        ...
+
+    @abstractmethod
+    def save_max_flow(self, record: MaxFlowRecord) -> None:
+        ...
+
     @abstractmethod
     def check_status(self, key: str) -> bool:
         ...
@@ -44,3 +76,77 @@ class LoopsRepo(ABC):
     @abstractmethod
     def get_platform_info(self, platform_name: str) -> Optional[PlatformInfo]:
         ...
+
+
+class AsyncLoopsRepo(ABC):
+    """LoopsRepo for the async request path, same methods as coroutines"""
+
+    @abstractmethod
+    async def get_loop_by_id(self, loop_id: int) -> List[LoopInfo]:
+        ...
+
+    @abstractmethod
+    async def get_curses_by_currency_name(
+            self,
+            currency_from: str,
+            currency_to: str,
+            platform_id: int,
+            method_id: int
+    ) -> Optional[float]:
+        ...
+
+    @abstractmethod
+    async def get_courses_by_pairs(
+            self,
+            pairs: List[Tuple[str, str]],
+            platform_id: int,
+            method_id: int
+    ) -> List[CourseInfo]:
+        ...
+
+    @abstractmethod
+    async def get_course_edges(self) -> List[CourseEdge]:
+        ...
+
+    @abstractmethod
+    async def get_active_loop_ids(self, platform_id: int, method_id: int) -> List[int]:
+        ...
+
+    @abstractmethod
+    async def save_loop_info(
+            self,
+            loop_id: int,
+            spread: float,
+            max_flow: float,
+            loop_speed: float,
+            added: datetime
+    ) -> None:
+        ...
+
+    @abstractmethod
+    async def save_loop_infos(self, records: List[LoopInfoRecord]) -> None:
+        ...
+
+    @abstractmethod
+    async def save_max_flow(self, record: MaxFlowRecord) -> None:
+        ...
+
+    @abstractmethod
+    async def check_status(self, key: str) -> bool:
+        ...
+
+    @abstractmethod
+    async def get_method_info(self, method_name: str) -> Optional[MethodInfo]:
+        ...
+
+    @abstractmethod
+    async def get_platform_info(self, platform_name: str) -> Optional[PlatformInfo]:
+        ...
+
+
+class BookSource(ABC):
+    """Source of raw OKX order books ({'asks': [...], 'bids': [...], 'ts': ...})"""
+
+    @abstractmethod
+    def get_book(self, inst_id: str) -> Optional[dict]:
+        ...
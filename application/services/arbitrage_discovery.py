@@ -0,0 +1,322 @@
+"""Discovery of profitable loops in the graph of course edges"""
+import math
+from collections import defaultdict
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from adapters.repositories.common import LoopsRepo
+from application import interfaces
+from application.dataclasses.common import CourseEdge, LoopCandidate, LoopInfo
+
+
+# platform name, method name: the courses of one market
+Market = Tuple[str, str]
+
+
+class CurrencyGraph:
+    """
+    Course edges of one platform and method as arrays sorted by target currency.
+
+    Each edge weighs -log(rate * (1 - tax / 100)), so a loop is profitable
+    when the sum of its weights is negative. Of parallel edges between two
+    currencies only the best one is kept. Transfers between platforms are
+    left out: a loop must be priced and traded on one market.
+    """
+    __slots__ = (
+        'currencies', 'index', 'edges', 'source', 'target', 'weight',
+        'in_start', 'in_end', 'out_edges', 'out_start', 'out_end'
+    )
+
+    def __init__(self, currencies: List[str], edges: List[CourseEdge], source: np.ndarray,
+                 target: np.ndarray, weight: np.ndarray):
+        self.currencies = currencies
+        self.index = {currency: i for i, currency in enumerate(currencies)}
+        self.edges = edges
+        self.source = source
+        self.target = target
+        self.weight = weight
+        nodes = np.arange(len(currencies))
+        # Edges into currency i are edges[in_start[i]:in_end[i]]
+        self.in_start = np.searchsorted(target, nodes, side='left')
+        self.in_end = np.searchsorted(target, nodes, side='right')
+        # Edges out of currency i are out_edges[out_start[i]:out_end[i]]
+        self.out_edges = np.argsort(source, kind='stable')
+        self.out_start = np.searchsorted(source[self.out_edges], nodes, side='left')
+        self.out_end = np.searchsorted(source[self.out_edges], nodes, side='right')
+
+    @classmethod
+    def from_edges(cls, edges: Iterable[CourseEdge]) -> 'CurrencyGraph':
+        """Graph of edges of a single market, see `markets` for mixed edges"""
+        best: Dict[Tuple[str, str], Tuple[float, CourseEdge]] = {}
+        market = None
+        for edge in edges:
+            if edge.platform_from != edge.platform_to:
+                continue
+            if market is None:
+                market = (edge.platform_from, edge.method)
+            elif market != (edge.platform_from, edge.method):
+                raise ValueError(f'edges of {market} and {(edge.platform_from, edge.method)} in one graph')
+            gain = edge.rate * (1 - edge.tax / 100)
+            if gain <= 0 or edge.currency_from == edge.currency_to:
+                continue
+            weight = -math.log(gain)
+            key = (edge.currency_from, edge.currency_to)
+            if key not in best or weight < best[key][0]:
+                best[key] = (weight, edge)
+        currencies = sorted({currency for pair in best for currency in pair})
+        index = {currency: i for i, currency in enumerate(currencies)}
+        kept = sorted(best.items(), key=lambda item: (index[item[0][1]], index[item[0][0]]))
+        return cls(
+            currencies=currencies,
+            edges=[edge for _, (_, edge) in kept],
+            source=np.array([index[pair[0]] for pair, _ in kept], dtype=np.int64),
+            target=np.array([index[pair[1]] for pair, _ in kept], dtype=np.int64),
+            weight=np.array([weight for _, (weight, _) in kept], dtype=float)
+        )
+
+    @classmethod
+    def markets(cls, edges: Iterable[CourseEdge]) -> Dict[Market, 'CurrencyGraph']:
+        """One graph per platform and method"""
+        groups: Dict[Market, List[CourseEdge]] = defaultdict(list)
+        for edge in edges:
+            if edge.platform_from == edge.platform_to:
+                groups[(edge.platform_from, edge.method)].append(edge)
+        return {market: cls.from_edges(group) for market, group in groups.items()}
+
+    def __len__(self) -> int:
+        return len(self.edges)
+
+    def expand(self, nodes: np.ndarray, distance: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """For every edge out of `nodes`: which node it leaves, its target and the weight of the extended walk"""
+        starts = self.out_start[nodes]
+        counts = self.out_end[nodes] - starts
+        total = int(counts.sum())
+        rows = np.repeat(np.arange(len(nodes)), counts)
+        offsets = np.arange(total) - np.repeat(np.cumsum(counts) - counts, counts)
+        edges = self.out_edges[starts[rows] + offsets]
+        return rows, self.target[edges], distance[rows] + self.weight[edges]
+
+
+# Walks of one length from a batch of base coins: sorted keys row * currencies + currency,
+# and the weight of the lightest walk from the row's base coin to the currency
+Layer = Tuple[np.ndarray, np.ndarray]
+
+# Base coins searched together, and most base coin x currency cells of a batch
+BATCH = 256
+BATCH_CELLS = 1 << 21
+
+
+def find_cycles(
+        graph: CurrencyGraph,
+        base_coins: Optional[Sequence[str]] = None,
+        max_length: int = 4,
+        min_length: int = 2,
+        min_profit: float = 0.0
+) -> List[LoopCandidate]:
+    """
+    Bounded-length Bellman-Ford from each base coin over the adjacency lists.
+
+    Layer k holds the weight of the lightest walk of k edges from the base
+    coin to each currency it reaches, without passing through the base coin
+    again. Only the currencies reached are relaxed, for a batch of base coins
+    at once, so a search costs the edges around the base coins, not a dense
+    base coins x currencies matrix. The last layer is never built: the
+    in-edges of each base coin close the walks of the layer before, which
+    only keeps the currencies with such an edge. A closed walk of negative
+    weight is a candidate loop; walks repeating an inner currency are
+    dropped. Only the best loop per base coin and length is found, which is
+    what a rate-based scan can promise anyway: books decide the rest.
+    Without `base_coins` every currency is searched, through currencies
+    sorted after it only, so every loop is found once, from its first
+    currency.
+    """
+    if not len(graph):
+        return []
+    if base_coins is None:
+        sources, ordered = np.unique(graph.source), True
+    else:
+        sources = np.array([graph.index[coin] for coin in base_coins if coin in graph.index], dtype=np.int64)
+        ordered = False
+    threshold = -math.log1p(min_profit / 100)
+    found: Dict[Tuple[int, ...], LoopCandidate] = {}
+    batch_size = max(min(BATCH, BATCH_CELLS // len(graph.currencies)), 1)
+    for batch in range(0, len(sources), batch_size):
+        _search(graph, sources[batch:batch + batch_size], ordered, max_length, min_length, threshold, found)
+    return sorted(found.values(), key=lambda candidate: -candidate.profit)
+
+
+def _search(
+        graph: CurrencyGraph,
+        bases: np.ndarray,
+        ordered: bool,
+        max_length: int,
+        min_length: int,
+        threshold: float,
+        found: Dict[Tuple[int, ...], LoopCandidate]
+) -> None:
+    size = len(graph.currencies)
+    # Edges into every base coin, by row: the edges closing its loops
+    counts = graph.in_end[bases] - graph.in_start[bases]
+    closing_rows = np.repeat(np.arange(len(bases)), counts)
+    closing_edges = np.arange(int(counts.sum())) - np.repeat(np.cumsum(counts) - counts, counts)
+    closing_edges += graph.in_start[bases][closing_rows]
+    closing_keys = closing_rows * size + graph.source[closing_edges]
+    closers = np.zeros(len(bases) * size, dtype=bool)
+    closers[closing_keys] = True
+
+    layers: List[Layer] = [(np.arange(len(bases)) * size + bases, np.zeros(len(bases)))]
+    for length in range(1, max_length + 1):
+        if length >= min_length:
+            weights = _distances(layers[-1], closing_keys) + graph.weight[closing_edges]
+            order = np.lexsort((weights, closing_rows))
+            first = order[np.r_[True, closing_rows[order][1:] != closing_rows[order][:-1]]] if len(order) else order
+            for position in first[weights[first] < threshold].tolist():
+                row = int(closing_rows[position])
+                path = _walk_back(graph, layers, int(closing_edges[position]), row, int(bases[row]))
+                if path is not None:
+                    _keep(found, graph, path, int(bases[row]), threshold)
+        if length == max_length or not len(layers[-1][0]):
+            break
+        layers.append(_relax(graph, layers[-1], bases, ordered, closers if length + 1 == max_length else None))
+
+
+def _relax(
+        graph: CurrencyGraph,
+        layer: Layer,
+        bases: np.ndarray,
+        ordered: bool,
+        only: Optional[np.ndarray]
+) -> Layer:
+    size = len(graph.currencies)
+    keys, weights = layer
+    rows = keys // size
+    origins, targets, weights = graph.expand(keys % size, weights)
+    rows = rows[origins]
+    # Walks must not come back to the base coin before their last step
+    keep = targets > bases[rows] if ordered else targets != bases[rows]
+    keys, weights = rows[keep] * size + targets[keep], weights[keep]
+    if only is not None:
+        keep = only[keys]
+        keys, weights = keys[keep], weights[keep]
+    # The lightest walk per base coin and currency, in key order
+    if len(keys) * 8 < len(bases) * size:
+        # Few walks in a large batch: sorting them is cheaper than a dense row per base coin
+        order = np.argsort(keys, kind='stable')
+        keys, weights = keys[order], weights[order]
+        starts = np.flatnonzero(np.r_[True, keys[1:] != keys[:-1]]) if len(keys) else keys
+        return keys[starts], np.minimum.reduceat(weights, starts) if len(keys) else weights
+    distance = np.full(len(bases) * size, np.inf)
+    np.minimum.at(distance, keys, weights)
+    keys = np.flatnonzero(distance < np.inf)
+    return keys, distance[keys]
+
+
+def _distances(layer: Layer, keys: np.ndarray) -> np.ndarray:
+    """Weights of the walks of `layer` to `keys`, inf where it has none"""
+    layer_keys, weights = layer
+    if not len(layer_keys):
+        return np.full(len(keys), np.inf)
+    positions = np.minimum(np.searchsorted(layer_keys, keys), len(layer_keys) - 1)
+    return np.where(layer_keys[positions] == keys, weights[positions], np.inf)
+
+
+def _walk_back(graph: CurrencyGraph, layers: List[Layer], closing: int, row: int, base: int) -> Optional[List[int]]:
+    """Edges of the best closed walk ending with `closing`, None unless it is a simple loop"""
+    size = len(graph.currencies)
+    path, currency, seen = [closing], int(graph.source[closing]), {base}
+    for previous in reversed(layers[:-1]):
+        if currency in seen:
+            return None
+        seen.add(currency)
+        # Edges into the currency, the lightest one continues the best walk
+        edges = np.arange(graph.in_start[currency], graph.in_end[currency])
+        if not len(edges):
+            return None
+        weights = _distances(previous, row * size + graph.source[edges]) + graph.weight[edges]
+        best = int(np.argmin(weights))
+        if not np.isfinite(weights[best]):
+            return None
+        path.append(int(edges[best]))
+        currency = int(graph.source[edges[best]])
+    if currency != base:
+        return None
+    return path[::-1]
+
+
+def _keep(
+        found: Dict[Tuple[int, ...], LoopCandidate],
+        graph: CurrencyGraph,
+        path: List[int],
+        base: int,
+        threshold: float
+) -> None:
+    loop_weight = math.fsum(graph.weight[path])
+    if not loop_weight < threshold:
+        return
+    # The same loop is found from each of its currencies; keep the first rotation
+    start = path.index(min(path))
+    key = tuple(path[start:] + path[:start])
+    if key not in found:
+        found[key] = LoopCandidate(
+            base_coin=graph.currencies[base],
+            profit=math.expm1(-loop_weight) * 100,
+            steps=[_step(graph.edges[edge]) for edge in path]
+        )
+
+
+def _step(edge: CourseEdge) -> LoopInfo:
+    return LoopInfo(
+        method=edge.method,
+        platform_from=edge.platform_from,
+        platform_to=edge.platform_to,
+        currency_from=edge.currency_from,
+        currency_to=edge.currency_to,
+        rule_id=edge.rule_id,
+        tax=edge.tax
+    )
+
+
+class ArbitrageDiscovery:
+    """
+    Finds loops that are profitable at the course rates.
+
+    Every platform and method is searched on its own, so each loop can be
+    traded and priced on one market. Candidate steps are LoopInfo objects in
+    loop order starting from the base coin, so they can be passed to
+    OKXTradeOnlineParser.evaluate_loop as is.
+    """
+
+    def __init__(self, repo: Optional[interfaces.LoopsRepo] = None):
+        self.repo = repo or LoopsRepo()
+        self.graphs: Optional[Dict[Market, CurrencyGraph]] = None
+
+    def load(self) -> Dict[Market, CurrencyGraph]:
+        self.graphs = CurrencyGraph.markets(self.repo.get_course_edges())
+        return self.graphs
+
+    def find_loops(
+            self,
+            base_coins: Optional[Sequence[str]] = None,
+            max_length: int = 4,
+            min_length: int = 2,
+            min_profit: float = 0.0,
+            limit: Optional[int] = None,
+            platform: Optional[str] = None,
+            method: Optional[str] = None
+    ) -> List[LoopCandidate]:
+        graphs = self.graphs if self.graphs is not None else self.load()
+        candidates = [
+            candidate
+            for (graph_platform, graph_method), graph in graphs.items()
+            if platform in (None, graph_platform) and method in (None, graph_method)
+            for candidate in find_cycles(
+                graph,
+                base_coins=base_coins,
+                max_length=max_length,
+                min_length=min_length,
+                min_profit=min_profit
+            )
+        ]
+        candidates.sort(key=lambda candidate: -candidate.profit)
+        return candidates[:limit] if limit is not None else candidates
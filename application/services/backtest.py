@@ -0,0 +1,87 @@
+"""Evaluation of a loop over captured order books"""
+from typing import Iterator, Optional
+
+from adapters.repositories.common import LoopsRepo
+from application import errors, interfaces
+from application.dataclasses.common import BacktestPoint
+from application.services.book_capture import BookReplay
+from application.services.okx_parser import OKXExchangeParser
+from application.services.okx_services import OKXTradeOnlineParser
+from application.services.rate_matrix import RateMatrix
+
+
+class LoopBacktest:
+    """
+    Runs OKXTradeOnlineParser on the books of a BookReplay.
+
+    The loop, platform, method and courses are loaded once; books only come
+    from the replay, so nothing goes over the network and the same capture
+    always gives the same results. Results are not saved to loop_info.
+
+    Courses are not captured with the books: unless `rates` are passed to
+    `run`, they are today's courses from the repository, and the profits
+    mix captured books with current conversion rates.
+    """
+
+    def __init__(self, replay: BookReplay, repo: Optional[interfaces.LoopsRepo] = None):
+        self.replay = replay
+        self.repo = repo or LoopsRepo()
+        self.exchange_parser = OKXExchangeParser(repo=self.repo, book_source=replay, rest_fallback=False)
+        self.loop_parser = OKXTradeOnlineParser(
+            repo=self.repo, exchange_parser=self.exchange_parser, overlap_io=False, save_results=False
+        )
+
+    def run(
+            self,
+            loop_id: int,
+            currency_name: str,
+            profit: Optional[float],
+            amount: Optional[float],
+            interval: Optional[float] = None,
+            start: Optional[int] = None,
+            end: Optional[int] = None,
+            rates: Optional[RateMatrix] = None
+    ) -> Iterator[BacktestPoint]:
+        """
+        One point every `interval` seconds of capture time, or one per
+        captured book when no interval is given. `rates` are the courses
+        of the captured period, when they are known.
+        """
+        loop_info = self.loop_parser.get_loop(loop_id=loop_id)
+        if not loop_info:
+            raise errors.GetLoopError(loop_id=f'{loop_id}')
+        platform = self.loop_parser.get_platform()
+        method = self.loop_parser.get_method()
+        if rates is None:
+            rates = RateMatrix.load(
+                repo=self.repo,
+                pairs=RateMatrix.required_pairs(loop_info=loop_info, base_coin=currency_name),
+                platform=platform,
+                method=method
+            )
+        if interval is None:
+            times = self.replay.timestamps(start=start, end=end).tolist()
+        else:
+            times = list(self.replay.steps(interval, start=start, end=end))
+        for ts in times:
+            self.replay.seek(ts)
+            try:
+                evaluation = self.loop_parser.evaluate_loop(
+                    loop_id=loop_id,
+                    loop_info=loop_info,
+                    currency_name=currency_name,
+                    profit=profit,
+                    amount=amount,
+                    platform=platform,
+                    method=method,
+                    rates=rates,
+                    books=self.exchange_parser.fetch_books(loop_info, strict=False)
+                )
+            except errors.AppError as error:
+                yield BacktestPoint(ts=ts, error=str(error))
+                continue
+            yield BacktestPoint(
+                ts=ts,
+                profit=evaluation.profit if evaluation else None,
+                amount=evaluation.amount if evaluation else None
+            )
@@ -0,0 +1,294 @@
+"""Append-only capture of OKX order books and memory-mapped replay of the captures"""
+import atexit
+import glob
+import mmap
+import os
+import struct
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from application import interfaces
+from connection_config import capture_params
+
+DATA_MAGIC = b'OKXB'
+INDEX_MAGIC = b'OKXI'
+VERSION = 1
+FILE_HEADER = struct.Struct('<4sI')
+# ts in ms, instrument length, ask and bid level counts
+RECORD_HEADER = struct.Struct('<QHII')
+LEVEL = np.dtype([('price', '<f8'), ('size', '<f8'), ('orders', '<u4')])
+INDEX_ENTRY = np.dtype([('ts', '<u8'), ('offset', '<u8'), ('inst', 'S32')])
+
+
+def book_ts(book: dict) -> int:
+    """OKX book time in ms, the capture time when the book has none"""
+    try:
+        return int(book['ts'])
+    except (KeyError, TypeError, ValueError):
+        return int(time.time() * 1000)
+
+
+def _pack_levels(levels: List[list]) -> bytes:
+    packed = np.zeros(len(levels), dtype=LEVEL)
+    if levels:
+        packed['price'] = [float(level[0]) for level in levels]
+        packed['size'] = [float(level[1]) for level in levels]
+        packed['orders'] = [int(level[3]) if len(level) > 3 else 0 for level in levels]
+    return packed.tobytes()
+
+
+def _unpack_levels(levels: np.ndarray) -> List[list]:
+    # repr round-trips the float64, so parsed values equal the captured ones
+    return [
+        [repr(price), repr(size), '0', str(orders)]
+        for price, size, orders in zip(
+            levels['price'].tolist(), levels['size'].tolist(), levels['orders'].tolist()
+        )
+    ]
+
+
+class BookRecorder:
+    """
+    Appends books to segment files in `directory`.
+
+    Each segment is a data file of records (header, instrument, asks, bids as
+    float64 price and size plus uint32 order count) and an index file of fixed
+    size (ts, offset, instrument) entries, both append-only. A new segment is
+    started once the data file passes `segment_bytes`. Use `record` directly
+    or as an OKXBookStream listener.
+    """
+
+    def __init__(
+            self,
+            directory: str = capture_params['directory'],
+            segment_bytes: int = capture_params['segment_bytes'],
+            flush_every: int = capture_params['flush_every']
+    ):
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        self.flush_every = flush_every
+        self.records = 0
+        self._data = None
+        self._index = None
+        self._size = 0
+        self._unflushed = 0
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        atexit.register(self.close)
+
+    def record(self, inst_id: str, book: Optional[dict], ts: Optional[int] = None) -> None:
+        if not book:
+            return
+        ts = book_ts(book) if ts is None else ts
+        name = inst_id.encode()
+        asks, bids = book.get('asks') or [], book.get('bids') or []
+        payload = b''.join((
+            RECORD_HEADER.pack(ts, len(name), len(asks), len(bids)),
+            name,
+            _pack_levels(asks),
+            _pack_levels(bids),
+        ))
+        entry = np.zeros(1, dtype=INDEX_ENTRY)
+        with self._lock:
+            if self._data is None or self._size >= self.segment_bytes:
+                self._open_segment(ts)
+            entry['ts'], entry['offset'], entry['inst'] = ts, self._size, name
+            self._data.write(payload)
+            self._index.write(entry.tobytes())
+            self._size += len(payload)
+            self.records += 1
+            self._unflushed += 1
+            if self._unflushed >= self.flush_every:
+                self._flush()
+
+    def _open_segment(self, ts: int) -> None:
+        self._close_segment()
+        stem = os.path.join(self.directory, f'{ts:013d}-{self.records:010d}')
+        self._data = open(stem + '.okxb', 'wb')
+        self._index = open(stem + '.okxi', 'wb')
+        self._data.write(FILE_HEADER.pack(DATA_MAGIC, VERSION))
+        self._index.write(FILE_HEADER.pack(INDEX_MAGIC, VERSION))
+        self._size = FILE_HEADER.size
+
+    def _flush(self) -> None:
+        # Data first, so an index entry never points past the data on disk
+        self._data.flush()
+        self._index.flush()
+        self._unflushed = 0
+
+    def _close_segment(self) -> None:
+        if self._data is not None:
+            self._flush()
+            self._data.close()
+            self._index.close()
+            self._data = self._index = None
+
+    def flush(self) -> None:
+        with self._lock:
+            if self._data is not None:
+                self._flush()
+
+    def close(self) -> None:
+        with self._lock:
+            self._close_segment()
+
+
+class _Segment:
+    __slots__ = ('file', 'data', 'index')
+
+    def __init__(self, data_path: str, index_path: str):
+        self.file = open(data_path, 'rb')
+        size = os.fstat(self.file.fileno()).st_size
+        # A segment whose header is not on disk yet is empty
+        self.data = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ) if size >= FILE_HEADER.size else None
+        if self.data is not None and FILE_HEADER.unpack_from(self.data)[0] != DATA_MAGIC:
+            raise ValueError(f'{data_path} is not a book capture')
+        index_size = os.path.getsize(index_path) - FILE_HEADER.size
+        entries = max(index_size, 0) // INDEX_ENTRY.itemsize if self.data is not None else 0
+        if entries:
+            index = np.memmap(index_path, dtype=INDEX_ENTRY, mode='r', offset=FILE_HEADER.size, shape=(entries,))
+        else:
+            index = np.zeros(0, dtype=INDEX_ENTRY)
+        # An entry whose record is not entirely on disk yet is left out
+        self.index = index[self._record_ends(index['offset'].astype(np.int64), size) <= size]
+
+    def _record_ends(self, offsets: np.ndarray, size: int) -> np.ndarray:
+        # Records follow each other, so each one ends where the next starts;
+        # the size of the last one is read from its header
+        if not len(offsets):
+            return offsets
+        last = int(offsets[-1])
+        if last + RECORD_HEADER.size > size:
+            last_end = size + 1
+        else:
+            _, name_size, asks, bids = RECORD_HEADER.unpack_from(self.data, last)
+            last_end = last + RECORD_HEADER.size + name_size + (asks + bids) * LEVEL.itemsize
+        return np.append(offsets[1:], last_end)
+
+    def close(self) -> None:
+        if self.data is not None:
+            self.data.close()
+        self.file.close()
+
+
+class BookReplay(interfaces.BookSource):
+    """
+    Serves captured books as of a replay time, for OKXExchangeParser.
+
+    `get_book` returns the last book of the instrument captured at or before
+    the time set by `seek`, or None when there is none or it is older than
+    `max_age` seconds, like a stale OKXBookStream book. Nothing is read until
+    a book is asked for: records are decoded straight from the memory-mapped
+    segments.
+    """
+
+    def __init__(
+            self,
+            directory: str = capture_params['directory'],
+            max_age: Optional[float] = None,
+            cache_size: int = 4096
+    ):
+        self.directory = directory
+        self.max_age_ms = max_age * 1000 if max_age is not None else None
+        self.now: Optional[int] = None
+        self.segments: List[_Segment] = []
+        for data_path in sorted(glob.glob(os.path.join(directory, '*.okxb'))):
+            self.segments.append(_Segment(data_path, data_path[:-len('.okxb')] + '.okxi'))
+        self._cache: 'OrderedDict[Tuple[int, int], dict]' = OrderedDict()
+        self._cache_size = cache_size
+        self._lock = threading.Lock()
+        self._build_index()
+
+    def _build_index(self) -> None:
+        parts = [segment.index for segment in self.segments]
+        ts = np.concatenate([part['ts'] for part in parts]) if parts else np.zeros(0, dtype='<u8')
+        offsets = np.concatenate([part['offset'] for part in parts]) if parts else np.zeros(0, dtype='<u8')
+        insts = np.concatenate([part['inst'] for part in parts]) if parts else np.zeros(0, dtype='S32')
+        segment_ids = np.concatenate([
+            np.full(len(part), number, dtype=np.int64) for number, part in enumerate(parts)
+        ]) if parts else np.zeros(0, dtype=np.int64)
+        self.ts = ts.astype(np.int64)
+        # Per instrument: capture times sorted, and where each record lives
+        self.instruments: Dict[str, Tuple[np.ndarray, np.ndarray, np.ndarray]] = {}
+        if not len(ts):
+            return
+        names, inverse = np.unique(insts, return_inverse=True)
+        order = np.lexsort((self.ts, inverse))
+        bounds = np.searchsorted(inverse[order], np.arange(len(names) + 1))
+        for number, name in enumerate(names):
+            rows = order[bounds[number]:bounds[number + 1]]
+            self.instruments[name.decode()] = (self.ts[rows], segment_ids[rows], offsets[rows].astype(np.int64))
+
+    @property
+    def start(self) -> Optional[int]:
+        return int(self.ts.min()) if len(self.ts) else None
+
+    @property
+    def end(self) -> Optional[int]:
+        return int(self.ts.max()) if len(self.ts) else None
+
+    def __len__(self) -> int:
+        return len(self.ts)
+
+    def seek(self, ts: int) -> None:
+        """Replay time in ms; books captured later are not visible"""
+        self.now = ts
+
+    def timestamps(self, start: Optional[int] = None, end: Optional[int] = None) -> np.ndarray:
+        """Distinct capture times in ms, the moments at which some book changed"""
+        times = np.unique(self.ts)
+        if start is not None:
+            times = times[times >= start]
+        if end is not None:
+            times = times[times <= end]
+        return times
+
+    def steps(self, interval: float, start: Optional[int] = None, end: Optional[int] = None) -> Iterator[int]:
+        """Replay times every `interval` seconds over the capture, each one seeked before it is yielded"""
+        start = self.start if start is None else start
+        end = self.end if end is None else end
+        if start is None:
+            return
+        step = max(int(interval * 1000), 1)
+        for ts in range(start, end + 1, step):
+            self.seek(ts)
+            yield ts
+
+    def get_book(self, inst_id: str) -> Optional[dict]:
+        entry = self.instruments.get(inst_id)
+        if entry is None:
+            return None
+        times, segment_ids, offsets = entry
+        position = len(times) - 1 if self.now is None else int(np.searchsorted(times, self.now, side='right')) - 1
+        if position < 0:
+            return None
+        if self.now is not None and self.max_age_ms is not None and self.now - times[position] > self.max_age_ms:
+            return None
+        return self._read(int(segment_ids[position]), int(offsets[position]))
+
+    def _read(self, segment_id: int, offset: int) -> dict:
+        key = (segment_id, offset)
+        with self._lock:
+            book = self._cache.get(key)
+            if book is not None:
+                self._cache.move_to_end(key)
+                return book
+        data = self.segments[segment_id].data
+        ts, name_size, asks, bids = RECORD_HEADER.unpack_from(data, offset)
+        position = offset + RECORD_HEADER.size + name_size
+        ask_levels = np.frombuffer(data, dtype=LEVEL, count=asks, offset=position)
+        bid_levels = np.frombuffer(data, dtype=LEVEL, count=bids, offset=position + asks * LEVEL.itemsize)
+        book = {'asks': _unpack_levels(ask_levels), 'bids': _unpack_levels(bid_levels), 'ts': str(ts)}
+        with self._lock:
+            self._cache[key] = book
+            if len(self._cache) > self._cache_size:
+                self._cache.popitem(last=False)
+        return book
+
+    def close(self) -> None:
+        for segment in self.segments:
+            segment.close()
@@ -0,0 +1,189 @@
+"""Best known conversion of every currency to the base coins, direct or through other currencies"""
+import logging
+import threading
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from adapters.repositories.common import LoopsRepo
+from application import interfaces
+from application.dataclasses.common import CourseEdge, CourseInfo
+from application.services.arbitrage_discovery import CurrencyGraph
+from connection_config import conversion_params
+
+logger = logging.getLogger(__name__)
+
+# platform name, method name, currency, base coin
+ConversionKey = Tuple[str, str, str, str]
+
+
+def best_routes(graph: CurrencyGraph, base: int, max_hops: int) -> Dict[int, List[int]]:
+    """
+    Edges of the best route of at most `max_hops` steps from every currency
+    to `base`, found by a hop-bounded Bellman-Ford over all edges at once.
+    Where the best walk visits a currency twice, the best route that does
+    not is searched for instead.
+    """
+    size = len(graph.currencies)
+    distance = np.full(size, np.inf)
+    distance[base] = 0.0
+    # Layer k holds the weight of the lightest walk of at most k steps
+    layers = [distance]
+    for _ in range(max_hops):
+        distance = layers[-1].copy()
+        np.minimum.at(distance, graph.source, graph.weight + layers[-1][graph.target])
+        distance[base] = 0.0
+        layers.append(distance)
+
+    routes = {}
+    for currency in np.flatnonzero(np.isfinite(layers[-1])).tolist():
+        if currency == base:
+            continue
+        route = _walk_back(graph, layers, currency, base)
+        if route is None:
+            route = _simple_route(graph, layers, currency, base)
+        if route:
+            routes[currency] = route
+    return routes
+
+
+def _walk_back(graph: CurrencyGraph, layers: List[np.ndarray], currency: int, base: int) -> Optional[List[int]]:
+    """Edges of the lightest walk from `currency`, None when it visits a currency twice"""
+    route, current, seen = [], currency, {currency}
+    for hops in range(len(layers) - 1, 0, -1):
+        if current == base:
+            break
+        if layers[hops - 1][current] <= layers[hops][current]:
+            # A walk with fewer steps is as good
+            continue
+        edges = graph.out_edges[graph.out_start[current]:graph.out_end[current]]
+        edge = int(edges[np.argmin(graph.weight[edges] + layers[hops - 1][graph.target[edges]])])
+        route.append(edge)
+        current = int(graph.target[edge])
+        if current in seen:
+            return None
+        seen.add(current)
+    return route if current == base else None
+
+
+def _simple_route(graph: CurrencyGraph, layers: List[np.ndarray], currency: int, base: int) -> Optional[List[int]]:
+    """
+    Edges of the lightest route from `currency` visiting no currency twice.
+
+    Depth-first with the walk weights as bounds: no route is lighter than the
+    lightest walk with as many steps left, so most branches are cut at once.
+    """
+    best_weight, best_route = np.inf, None
+    route, seen = [], {currency}
+
+    def visit(current: int, hops: int, weight: float) -> None:
+        nonlocal best_weight, best_route
+        if current == base:
+            if weight < best_weight:
+                best_weight, best_route = weight, list(route)
+            return
+        if not hops:
+            return
+        edges = graph.out_edges[graph.out_start[current]:graph.out_end[current]]
+        bounds = weight + graph.weight[edges] + layers[hops - 1][graph.target[edges]]
+        for i in np.argsort(bounds, kind='stable').tolist():
+            if bounds[i] >= best_weight:
+                break
+            edge = int(edges[i])
+            target = int(graph.target[edge])
+            if target in seen:
+                continue
+            route.append(edge)
+            seen.add(target)
+            visit(target, hops - 1, weight + graph.weight[edge])
+            seen.discard(target)
+            route.pop()
+
+    visit(currency, len(layers) - 1, 0.0)
+    return best_route
+
+
+def compose(edges: Sequence[CourseEdge], base_coin: str) -> CourseInfo:
+    """One course equivalent to converting through `edges` in order"""
+    rate, keep = 1.0, 1.0
+    for edge in edges:
+        rate *= edge.rate
+        keep *= 1 - edge.tax / 100
+    return CourseInfo(currency_from=edges[0].currency_from, currency_to=base_coin, rate=rate, tax=(1 - keep) * 100)
+
+
+def build_conversions(
+        edges: Iterable[CourseEdge],
+        base_coins: Sequence[str],
+        max_hops: int
+) -> Dict[ConversionKey, CourseInfo]:
+    # Routes stay on one platform and method, like the loops they price
+    table = {}
+    for (platform, method), graph in CurrencyGraph.markets(edges).items():
+        for base_coin in base_coins:
+            base = graph.index.get(base_coin)
+            if base is None:
+                continue
+            for currency, route in best_routes(graph, base, max_hops).items():
+                table[(platform, method, graph.currencies[currency], base_coin)] = compose(
+                    [graph.edges[edge] for edge in route], base_coin
+                )
+            # A listed course wins over any route, so known conversions do not change
+            for edge in graph.edges:
+                if edge.currency_to == base_coin:
+                    table[(platform, method, edge.currency_from, base_coin)] = CourseInfo(
+                        currency_from=edge.currency_from, currency_to=base_coin, rate=edge.rate, tax=edge.tax
+                    )
+    return table
+
+
+class ConversionIndex:
+    """
+    In-memory table of conversions to the base coins per platform and method.
+
+    `refresh` loads every course with one query, builds a new table and swaps
+    it in with a single assignment, so readers never see a partial table.
+    Currencies without a course to the base coin get the best route of up to
+    `max_hops` courses, with rates multiplied and taxes compounded.
+    """
+
+    def __init__(
+            self,
+            repo: Optional[interfaces.LoopsRepo] = None,
+            base_coins: Sequence[str] = conversion_params['base_coins'],
+            max_hops: int = conversion_params['max_hops'],
+            refresh_interval: float = conversion_params['refresh_interval']
+    ):
+        self.repo = repo or LoopsRepo()
+        self.base_coins = tuple(base_coins)
+        self.max_hops = max_hops
+        self.refresh_interval = refresh_interval
+        self._table: Dict[ConversionKey, CourseInfo] = {}
+        self._stopped = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def refresh(self) -> None:
+        self._table = build_conversions(self.repo.get_course_edges(), self.base_coins, self.max_hops)
+
+    def get(self, platform: str, method: str, currency_from: str, base_coin: str) -> Optional[CourseInfo]:
+        return self._table.get((platform, method, currency_from, base_coin))
+
+    def __len__(self) -> int:
+        return len(self._table)
+
+    def start(self) -> 'ConversionIndex':
+        self.refresh()
+        self._thread = threading.Thread(target=self._run, name='conversion-index', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._stopped.set()
+
+    def _run(self) -> None:
+        while not self._stopped.wait(self.refresh_interval):
+            try:
+                self.refresh()
+            except Exception:
+                # The previous table keeps serving until a refresh succeeds
+                logger.exception('Conversion index refresh failed')
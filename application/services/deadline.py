@@ -0,0 +1,64 @@
+"""Latency budget of one request"""
+import math
+import time
+from typing import Any, Callable, Optional
+
+from connection_config import deadline_params
+
+
+class Deadline:
+    """
+    Seconds left for one request, shared by every stage working for it.
+
+    A budget of None never expires. Once `expired` has been seen true the
+    deadline stays `missed`, so the result can be flagged as stale.
+    """
+    __slots__ = ('budget', 'expires', 'missed', '_clock')
+    # requests refuses a timeout of 0
+    MIN_TIMEOUT = 0.001
+
+    def __init__(self, budget: Optional[float], clock: Callable[[], float] = time.monotonic):
+        self.budget = budget
+        self.expires = clock() + budget if budget is not None else None
+        self.missed = False
+        self._clock = clock
+
+    def remaining(self) -> Optional[float]:
+        """Seconds left, never below 0, or None without a budget"""
+        if self.expires is None:
+            return None
+        return max(self.expires - self._clock(), 0.0)
+
+    def timeout(self, default: Optional[float]) -> Optional[float]:
+        """`default` cut to the seconds left, so no single call outlives the budget"""
+        remaining = self.remaining()
+        if remaining is None:
+            return default
+        remaining = max(remaining, self.MIN_TIMEOUT)
+        return remaining if default is None else min(default, remaining)
+
+    @property
+    def expired(self) -> bool:
+        if self.expires is not None and self._clock() >= self.expires:
+            self.missed = True
+        return self.missed
+
+
+def parse_budget(
+        value: Any,
+        default: Optional[float] = deadline_params['budget'],
+        min_budget: float = deadline_params['min_budget'],
+        max_budget: float = deadline_params['max_budget']
+) -> Optional[float]:
+    """Budget in seconds sent by a client, `default` when missing; ValueError when it is not a number"""
+    if value is None:
+        return default
+    try:
+        if isinstance(value, bool):
+            raise ValueError
+        budget = float(value)
+        if math.isnan(budget):
+            raise ValueError
+    except (TypeError, ValueError):
+        raise ValueError(f'budget {value!r} is not a number') from None
+    return min(max(budget, min_budget), max_budget)
@@ -0,0 +1,97 @@
+"""Vectorized evaluation of a loop over every order book depth at once"""
+from typing import List, Optional
+
+import numpy as np
+
+from application import errors
+from application.dataclasses.common import LoopInfo, LoopProfit
+from application.services.rate_matrix import RateMatrix
+
+
+class DepthWalkResult:
+    """Level at which the walk stops, the loop profit returned there and how many levels go to `data`"""
+    __slots__ = ('index', 'loop_profit', 'data_end')
+
+    def __init__(self, index: int, loop_profit: Optional[LoopProfit], data_end: int):
+        self.index = index
+        self.loop_profit = loop_profit
+        self.data_end = data_end
+
+
+def loop_output(
+        loop_info: List[LoopInfo],
+        rates: RateMatrix,
+        start_quantities: np.ndarray,
+        currency_from: str
+) -> np.ndarray:
+    # Same operations as OKXTradeOnlineParser.check_profitability_loop, element-wise
+    quantities = start_quantities
+    for loop in loop_info:
+        rate = rates.get(currency_from=loop.currency_from, currency_to=loop.currency_to)
+        if not rate:
+            raise errors.GetCurseError(pair=f'{currency_from}-{loop.currency_to}')
+        quantity = quantities * rate.rate
+        quantities = quantity - quantity / 100 * rate.tax
+    return quantities
+
+
+def _first(condition: np.ndarray) -> int:
+    return int(np.argmax(condition)) if condition.any() else len(condition)
+
+
+def depth_walk(
+        total_amounts: np.ndarray,
+        loop_info: List[LoopInfo],
+        rates: RateMatrix,
+        currency_from: str,
+        profit: Optional[float],
+        amount: Optional[float]
+) -> Optional[DepthWalkResult]:
+    """
+    Finds where the level-by-level walk of OKXTradeOnlineParser.main stops.
+
+    In profit mode the walk stops at the first level that is not profitable or
+    whose profit is not above `profit`; in amount mode at the first level
+    deeper than `amount`. Returns None when the book is exhausted first.
+    """
+    levels = len(total_amounts)
+    if not levels or not (profit or amount):
+        return None
+
+    profit_stop = levels
+    if profit:
+        end_quantities = loop_output(loop_info, rates, total_amounts, currency_from)
+        profits = (end_quantities - total_amounts) / 100
+        profit_stop = _first((end_quantities <= total_amounts) | (profits <= profit))
+
+    amount_stop = levels
+    amount_profit = None
+    if amount:
+        amount_profit = _loop_profit(
+            float(amount),
+            float(loop_output(loop_info, rates, np.array([amount], dtype=float), currency_from)[0])
+        )
+        amount_stop = _first(amount < total_amounts)
+
+    if profit_stop < levels and profit_stop <= amount_stop:
+        i = profit_stop
+        start, end = float(total_amounts[i]), float(end_quantities[i])
+        if end <= start or profits[i] == profit:
+            return DepthWalkResult(i, _loop_profit(start, end), i + 1)
+        # Profit fell below the threshold: answer with the previous level
+        if i == 0:
+            return DepthWalkResult(i, None, 0)
+        previous = amount_profit if amount else _loop_profit(
+            float(total_amounts[i - 1]), float(end_quantities[i - 1])
+        )
+        return DepthWalkResult(i, previous, i)
+    if amount_stop < levels:
+        return DepthWalkResult(amount_stop, amount_profit, amount_stop + 1)
+    return None
+
+
+def _loop_profit(start_quantity: float, end_quantity: float) -> LoopProfit:
+    return LoopProfit(
+        profit=(end_quantity - start_quantity) / 100,
+        amount=end_quantity
+    )
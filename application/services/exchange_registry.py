@@ -0,0 +1,272 @@
+"""Book sources of several platforms behind the OKXExchangeParser contract"""
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from application import errors, interfaces
+from application.dataclasses.common import BookOrderConverted, LoopInfo, MethodInfo, PlatformInfo
+from application.dataclasses.order_book import OrderBookLevels
+from application.services.deadline import Deadline
+from application.services.max_flow import LegBook
+from application.services.metrics import metrics
+from application.services.okx_parser import OKXExchangeParser, create_session
+from application.services.okx_scheduler import OKXRequestScheduler
+from application.services.rate_matrix import RateMatrix
+from application.services.single_flight import SingleFlight
+from connection_config import okx_params, okx_rate_limits
+
+SEPARATOR = ':'
+
+
+def platform_parser(
+        repo: interfaces.LoopsRepo,
+        base_url: str,
+        rate_limits: Optional[Dict[str, Tuple[int, float]]] = None,
+        pool_maxsize: int = okx_params['pool_maxsize'],
+        max_workers: int = okx_params['max_workers'],
+        **kwargs
+) -> OKXExchangeParser:
+    """
+    Parser of an exchange serving the OKX books API at `base_url`.
+
+    It has its own connections, request limits, threads and in-flight
+    requests, so a slow or throttled exchange does not hold up the others.
+    """
+    session = create_session(pool_maxsize=pool_maxsize)
+    return OKXExchangeParser(
+        repo=repo,
+        session=session,
+        executor=ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='platform-books'),
+        base_url=base_url,
+        scheduler=OKXRequestScheduler(session, limits=okx_rate_limits if rate_limits is None else rate_limits),
+        book_flights=SingleFlight(),
+        **kwargs
+    )
+
+
+class ExchangeParserRegistry:
+    """
+    Reads every loop step from the parser registered for its platform_from.
+
+    Answers the OKXExchangeParser calls the services make, so it is given to
+    them in its place. Books of the `default` platform are keyed by
+    instrument like OKXExchangeParser keys them, those of the other platforms
+    by '<platform>:<instrument>', so the books of one loop travel in one
+    dict. The steps of each platform are fetched at the same time as those
+    of the others.
+    """
+
+    def __init__(
+            self,
+            default: OKXExchangeParser,
+            parsers: Optional[Dict[str, OKXExchangeParser]] = None,
+            default_platform: str = 'OKX',
+            executor: Optional[ThreadPoolExecutor] = None
+    ):
+        self.default_platform = default_platform
+        self.parsers = {default_platform: default}
+        self.parsers.update(parsers or {})
+        self.repo = default.repo
+        self.executor = executor or ThreadPoolExecutor(
+            max_workers=okx_params['max_workers'],
+            thread_name_prefix='platforms'
+        )
+
+    def register(self, platform: str, parser: OKXExchangeParser) -> None:
+        self.parsers[platform] = parser
+
+    def parser_for(self, platform: str) -> OKXExchangeParser:
+        parser = self.parsers.get(platform)
+        if parser is None:
+            raise errors.GerPlatformError(platform=platform)
+        return parser
+
+    def _key(self, platform: str, inst_id: str) -> str:
+        return inst_id if platform == self.default_platform else f'{platform}{SEPARATOR}{inst_id}'
+
+    def _split(self, key: str) -> Tuple[str, str]:
+        platform, separator, inst_id = key.partition(SEPARATOR)
+        return (platform, inst_id) if separator else (self.default_platform, key)
+
+    def _platform_books(self, books: Dict[str, Optional[dict]], platform: str) -> Dict[str, Optional[dict]]:
+        # Keys of other platforms hold the separator and match no instrument of the default one
+        if platform == self.default_platform:
+            return books
+        prefix = platform + SEPARATOR
+        return {key[len(prefix):]: book for key, book in books.items() if key.startswith(prefix)}
+
+    def _platform_info(self, name: str, platform: PlatformInfo) -> PlatformInfo:
+        if name == platform.platform_name:
+            return platform
+        info = self.repo.get_platform_info(name)
+        if not info:
+            raise errors.GerPlatformError(platform=name)
+        return info
+
+    @staticmethod
+    def _by_platform(loop_info: Iterable[LoopInfo]) -> Dict[str, List[LoopInfo]]:
+        steps: Dict[str, List[LoopInfo]] = {}
+        for loop in loop_info:
+            steps.setdefault(loop.platform_from, []).append(loop)
+        return steps
+
+    def _run(self, calls: List[Callable[[], Dict[str, Optional[dict]]]]) -> List[Dict[str, Optional[dict]]]:
+        # The first platform is fetched on the calling thread while the others are on the executor
+        futures = [self.executor.submit(metrics.propagate(call)) for call in calls[1:]]
+        results = [calls[0]()] if calls else []
+        return results + [future.result() for future in futures]
+
+    def _merge(self, platforms: List[str], results: List[Dict[str, Optional[dict]]]) -> Dict[str, Optional[dict]]:
+        books = {}
+        for platform, platform_books in zip(platforms, results):
+            books.update((self._key(platform, inst_id), book) for inst_id, book in platform_books.items())
+        return books
+
+    def get_book(self, key: str) -> Optional[dict]:
+        platform, inst_id = self._split(key)
+        return self.parser_for(platform).get_book(inst_id)
+
+    def get_books(
+            self,
+            keys: Iterable[str],
+            strict: bool = True,
+            deadline: Optional[Deadline] = None
+    ) -> Dict[str, Optional[dict]]:
+        inst_ids: Dict[str, List[str]] = {}
+        for key in keys:
+            platform, inst_id = self._split(key)
+            inst_ids.setdefault(platform, []).append(inst_id)
+        results = self._run([
+            partial(self.parser_for(platform).get_books, platform_ids, strict=strict, deadline=deadline)
+            for platform, platform_ids in inst_ids.items()
+        ])
+        return self._merge(list(inst_ids), results)
+
+    def fetch_books(
+            self,
+            loop_info: List[LoopInfo],
+            strict: bool = True,
+            deadline: Optional[Deadline] = None
+    ) -> Dict[str, Optional[dict]]:
+        steps = self._by_platform(loop_info)
+        results = self._run([
+            partial(self.parser_for(platform).fetch_books, platform_steps, strict=strict, deadline=deadline)
+            for platform, platform_steps in steps.items()
+        ])
+        return self._merge(list(steps), results)
+
+    def leg_instruments(self, loop: LoopInfo) -> List[str]:
+        return [
+            self._key(loop.platform_from, inst_id)
+            for inst_id in self.parser_for(loop.platform_from).leg_instruments(loop)
+        ]
+
+    def request_instruments(self, loop: LoopInfo) -> List[str]:
+        return [
+            self._key(loop.platform_from, inst_id)
+            for inst_id in self.parser_for(loop.platform_from).request_instruments(loop)
+        ]
+
+    def sort_loop(self, loop_info: List[LoopInfo], base_coin: str) -> List[LoopInfo]:
+        return self.parsers[self.default_platform].sort_loop(loop_info, base_coin)
+
+    def load_rates(
+            self,
+            loop_info: List[LoopInfo],
+            base_coin: str,
+            platform: PlatformInfo,
+            method: MethodInfo
+    ) -> RateMatrix:
+        """Courses of every step from its own platform, those of `platform` first"""
+        steps = self._by_platform(loop_info)
+        names = sorted(steps, key=lambda name: name != platform.platform_name)
+        return RateMatrix.merge(
+            self.parser_for(name).load_rates(
+                loop_info=steps[name],
+                base_coin=base_coin,
+                platform=self._platform_info(name, platform),
+                method=method
+            )
+            for name in names
+        )
+
+    def get_leg_levels(
+            self,
+            loop: LoopInfo,
+            base_coin: str,
+            platform: PlatformInfo,
+            method: MethodInfo,
+            rates: RateMatrix,
+            books: Dict[str, Optional[dict]]
+    ) -> OrderBookLevels:
+        return self.parser_for(loop.platform_from).get_leg_levels(
+            loop=loop,
+            base_coin=base_coin,
+            platform=self._platform_info(loop.platform_from, platform),
+            method=method,
+            rates=rates,
+            books=self._platform_books(books, loop.platform_from)
+        )
+
+    def get_order_levels(
+            self, loop_info: List[LoopInfo],
+            base_coin: str,
+            platform: PlatformInfo,
+            method: MethodInfo,
+            rates: Optional[RateMatrix] = None,
+            books: Optional[Dict[str, Optional[dict]]] = None
+    ) -> OrderBookLevels:
+        # Sorted in place like OKXExchangeParser does, callers read the steps in this order
+        loop_info[:] = self.sort_loop(loop_info, base_coin)
+        if books is None:
+            books = self.fetch_books(loop_info=loop_info)
+        if rates is None:
+            rates = self.load_rates(loop_info=loop_info, base_coin=base_coin, platform=platform, method=method)
+        return OrderBookLevels.merge([
+            self.get_leg_levels(
+                loop=loop,
+                base_coin=base_coin,
+                platform=platform,
+                method=method,
+                rates=rates,
+                books=books
+            )
+            for loop in loop_info
+        ])
+
+    def get_orders_book(
+            self, loop_info: List[LoopInfo],
+            base_coin: str,
+            platform: PlatformInfo,
+            method: MethodInfo,
+            rates: Optional[RateMatrix] = None,
+            books: Optional[Dict[str, Optional[dict]]] = None
+    ) -> List[BookOrderConverted]:
+        return self.get_order_levels(
+            loop_info=loop_info,
+            base_coin=base_coin,
+            platform=platform,
+            method=method,
+            rates=rates,
+            books=books
+        ).to_book_orders()
+
+    def get_leg_books(
+            self,
+            loop_info: List[LoopInfo],
+            base_coin: str,
+            books: Optional[Dict[str, Optional[dict]]] = None
+    ) -> List[LegBook]:
+        loop_info[:] = self.sort_loop(loop_info, base_coin)
+        if books is None:
+            books = self.fetch_books(loop_info=loop_info)
+        return [
+            self.parser_for(loop.platform_from).get_leg_book(loop, self._platform_books(books, loop.platform_from))
+            for loop in loop_info
+        ]
+
+    def leg_timestamps(self, loop_info: List[LoopInfo], books: Dict[str, Optional[dict]]) -> List[Optional[int]]:
+        return [
+            self.parser_for(loop.platform_from).leg_timestamps([loop], self._platform_books(books, loop.platform_from))[0]
+            for loop in loop_info
+        ]
@@ -0,0 +1,40 @@
+"""Cumulative bucket histogram in the Prometheus layout"""
+import threading
+from typing import Dict, Sequence, Tuple
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class Histogram:
+    """Counts of observations per upper bound, plus their count and sum"""
+
+    def __init__(self, buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.buckets = tuple(sorted(buckets)) + (float('inf'),)
+        self._counts = [0] * len(self.buckets)
+        self._sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float) -> None:
+        with self._lock:
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    self._counts[i] += 1
+                    break
+            self._sum += value
+
+    def snapshot(self) -> Tuple[Dict[float, int], int, float]:
+        """Cumulative count per bucket bound, total count and sum"""
+        with self._lock:
+            cumulative, total = {}, 0
+            for bound, count in zip(self.buckets, self._counts):
+                total += count
+                cumulative[bound] = total
+            return cumulative, total, self._sum
+
+    def quantile(self, q: float) -> float:
+        """Upper bound of the bucket holding the q-quantile"""
+        cumulative, total, _ = self.snapshot()
+        for bound, count in cumulative.items():
+            if total and count >= q * total:
+                return bound
+        return 0.0
@@ -0,0 +1,296 @@
+"""Re-evaluation of only the loops touched by a book or course change"""
+import threading
+from collections import defaultdict
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from application import errors
+from application.dataclasses.common import CourseInfo, IncrementalStats, LoopInfo, MethodInfo, PlatformInfo
+from application.dataclasses.order_book import LoopEvaluation, OrderBookLevels
+from application.services.okx_services import OKXTradeOnlineParser
+from application.services.rate_matrix import RateMatrix
+
+# currency_from, currency_to, rule_id, base_coin: one step as seen from one base coin
+LegKey = Tuple[str, str, int, str]
+Pair = Tuple[str, str]
+
+
+def leg_key(loop: LoopInfo, base_coin: str) -> LegKey:
+    return loop.currency_from, loop.currency_to, loop.rule_id, base_coin
+
+
+class LoopDependencyIndex:
+    """
+    Which legs and loops read which instrument and which course.
+
+    A leg reads both instruments of its step (the listed one is used) and the
+    courses converting either side of the step to the base coin. A loop reads
+    its legs plus the courses of its own steps.
+    """
+
+    def __init__(self):
+        self.loop_legs: Dict[int, List[LegKey]] = {}
+        self.loop_pairs: Dict[int, Set[Pair]] = {}
+        self.leg_loops: Dict[LegKey, Set[int]] = defaultdict(set)
+        self.instrument_legs: Dict[str, Set[LegKey]] = defaultdict(set)
+        self.pair_legs: Dict[Pair, Set[LegKey]] = defaultdict(set)
+        self.pair_loops: Dict[Pair, Set[int]] = defaultdict(set)
+
+    def add(self, loop_id: int, loop_info: List[LoopInfo], base_coin: str, instruments: List[List[str]]) -> None:
+        """`instruments[i]` are the instruments step i can be read from"""
+        self.remove(loop_id)
+        legs = [leg_key(loop, base_coin) for loop in loop_info]
+        pairs = {(loop.currency_from, loop.currency_to) for loop in loop_info}
+        self.loop_legs[loop_id] = legs
+        self.loop_pairs[loop_id] = pairs
+        for loop, leg, leg_instruments in zip(loop_info, legs, instruments):
+            self.leg_loops[leg].add(loop_id)
+            for inst_id in leg_instruments:
+                self.instrument_legs[inst_id].add(leg)
+            for currency in (loop.currency_from, loop.currency_to):
+                if currency != base_coin:
+                    self.pair_legs[(currency, base_coin)].add(leg)
+        for pair in pairs:
+            self.pair_loops[pair].add(loop_id)
+
+    def remove(self, loop_id: int) -> Set[LegKey]:
+        """Forgets a loop and returns the legs no other loop uses"""
+        unused = set()
+        for leg in self.loop_legs.pop(loop_id, []):
+            self.leg_loops[leg].discard(loop_id)
+            if not self.leg_loops[leg]:
+                del self.leg_loops[leg]
+                unused.add(leg)
+        for pair in self.loop_pairs.pop(loop_id, set()):
+            self.pair_loops[pair].discard(loop_id)
+        for index in (self.instrument_legs, self.pair_legs):
+            for legs in index.values():
+                legs -= unused
+        return unused
+
+    def legs_for_instrument(self, inst_id: str) -> Set[LegKey]:
+        return set(self.instrument_legs.get(inst_id, ()))
+
+    def legs_for_pair(self, pair: Pair) -> Set[LegKey]:
+        return set(self.pair_legs.get(pair, ()))
+
+    def loops_for_legs(self, legs: Iterable[LegKey]) -> Set[int]:
+        loops = set()
+        for leg in legs:
+            loops.update(self.leg_loops.get(leg, ()))
+        return loops
+
+    def loops_for_instrument(self, inst_id: str) -> Set[int]:
+        return self.loops_for_legs(self.instrument_legs.get(inst_id, ()))
+
+    def loops_for_pair(self, pair: Pair) -> Set[int]:
+        return self.loops_for_legs(self.pair_legs.get(pair, ())) | self.pair_loops.get(pair, set())
+
+    def instruments(self) -> Set[str]:
+        return {inst_id for inst_id, legs in self.instrument_legs.items() if legs}
+
+    def pairs(self) -> Set[Pair]:
+        return (
+                {pair for pair, legs in self.pair_legs.items() if legs}
+                | {pair for pair, loops in self.pair_loops.items() if loops}
+        )
+
+
+class TrackedLoop:
+    __slots__ = ('loop_id', 'loop_info', 'base_coin', 'profit', 'amount')
+
+    def __init__(
+            self,
+            loop_id: int,
+            loop_info: List[LoopInfo],
+            base_coin: str,
+            profit: Optional[float],
+            amount: Optional[float]
+    ):
+        self.loop_id = loop_id
+        self.loop_info = loop_info
+        self.base_coin = base_coin
+        self.profit = profit
+        self.amount = amount
+
+
+class IncrementalLoopEvaluator:
+    """
+    Keeps the evaluation of many loops current as books and courses change.
+
+    `update_book` and `update_course` only mark the legs and loops that read
+    the changed instrument or course. `refresh` walks each marked leg once,
+    however many loops share it, and re-evaluates only the marked loops from
+    the cached levels of their legs. Feed it from OKXBookStream.add_listener
+    or any other source of books.
+    """
+
+    def __init__(
+            self,
+            loop_parser: OKXTradeOnlineParser,
+            platform: Optional[PlatformInfo] = None,
+            method: Optional[MethodInfo] = None
+    ):
+        self.loop_parser = loop_parser
+        self.exchange_parser = loop_parser.exchange_parser
+        self.platform = platform or loop_parser.get_platform()
+        self.method = method or loop_parser.get_method()
+        self.index = LoopDependencyIndex()
+        self.rates = RateMatrix([])
+        self.books: Dict[str, Optional[dict]] = {}
+        self.loops: Dict[int, TrackedLoop] = {}
+        self.evaluations: Dict[int, Optional[LoopEvaluation]] = {}
+        self.errors: Dict[int, errors.AppError] = {}
+        self._legs: Dict[LegKey, OrderBookLevels] = {}
+        self._leg_errors: Dict[LegKey, errors.AppError] = {}
+        self._dirty_legs: Set[LegKey] = set()
+        self._dirty_loops: Set[int] = set()
+        self._lock = threading.Lock()
+        self._updates = 0
+        self._legs_walked = 0
+        self._loops_evaluated = 0
+
+    def add_loop(
+            self,
+            loop_id: int,
+            loop_info: List[LoopInfo],
+            base_coin: str,
+            profit: Optional[float] = None,
+            amount: Optional[float] = None
+    ) -> None:
+        """Tracks a loop; courses and books it needs that are not known yet are loaded"""
+        sorted_loop = self.exchange_parser.sort_loop(loop_info, base_coin)
+        missing_pairs = [
+            pair for pair in RateMatrix.required_pairs(loop_info=sorted_loop, base_coin=base_coin)
+            if pair not in self.rates
+        ]
+        courses = RateMatrix.load(
+            repo=self.loop_parser.repo, pairs=missing_pairs, platform=self.platform, method=self.method
+        ) if missing_pairs else RateMatrix([])
+        instruments = [self.exchange_parser.leg_instruments(loop) for loop in sorted_loop]
+        missing_books = [
+            loop for loop, leg_instruments in zip(sorted_loop, instruments)
+            if not any(inst_id in self.books for inst_id in leg_instruments)
+        ]
+        books = self.exchange_parser.fetch_books(missing_books, strict=False) if missing_books else {}
+        with self._lock:
+            for pair in missing_pairs:
+                course = courses.get(*pair)
+                if course:
+                    self.rates.update(course)
+            for inst_id, book in books.items():
+                self.books.setdefault(inst_id, book)
+            self.loops[loop_id] = TrackedLoop(loop_id, sorted_loop, base_coin, profit, amount)
+            self.index.add(loop_id, sorted_loop, base_coin, instruments)
+            self._dirty_legs.update(leg for leg in self.index.loop_legs[loop_id] if leg not in self._legs)
+            self._dirty_loops.add(loop_id)
+
+    def remove_loop(self, loop_id: int) -> None:
+        with self._lock:
+            self.loops.pop(loop_id, None)
+            self.evaluations.pop(loop_id, None)
+            self.errors.pop(loop_id, None)
+            self._dirty_loops.discard(loop_id)
+            for leg in self.index.remove(loop_id):
+                self._legs.pop(leg, None)
+                self._leg_errors.pop(leg, None)
+                self._dirty_legs.discard(leg)
+
+    def update_book(self, inst_id: str, book: Optional[dict]) -> None:
+        with self._lock:
+            legs = self.index.legs_for_instrument(inst_id)
+            if not legs:
+                return
+            self.books[inst_id] = book
+            self._updates += 1
+            self._dirty_legs |= legs
+            self._dirty_loops |= self.index.loops_for_legs(legs)
+
+    def update_course(self, course: CourseInfo) -> None:
+        pair = (course.currency_from, course.currency_to)
+        with self._lock:
+            self.rates.update(course)
+            self._updates += 1
+            self._dirty_legs |= self.index.legs_for_pair(pair)
+            self._dirty_loops |= self.index.loops_for_pair(pair)
+
+    def refresh(self) -> Dict[int, Optional[LoopEvaluation]]:
+        """Re-evaluates the loops changed since the last refresh and returns their results"""
+        with self._lock:
+            dirty_legs, self._dirty_legs = self._dirty_legs, set()
+            dirty_loops, self._dirty_loops = self._dirty_loops, set()
+            # Books and courses are replaced, never changed in place, so
+            # shallow copies are a consistent snapshot
+            books = dict(self.books)
+            rates = self.rates.copy()
+            loops = [self.loops[loop_id] for loop_id in dirty_loops if loop_id in self.loops]
+
+        legs: Dict[LegKey, OrderBookLevels] = {}
+        leg_errors: Dict[LegKey, errors.AppError] = {}
+        steps = {leg_key(loop, tracked.base_coin): loop for tracked in loops for loop in tracked.loop_info}
+        for leg in dirty_legs:
+            if leg not in steps:
+                continue
+            try:
+                legs[leg] = self.exchange_parser.get_leg_levels(
+                    loop=steps[leg],
+                    base_coin=leg[3],
+                    platform=self.platform,
+                    method=self.method,
+                    rates=rates,
+                    books=books
+                )
+            except errors.AppError as error:
+                leg_errors[leg] = error
+        with self._lock:
+            for leg, levels in legs.items():
+                self._legs[leg] = levels
+                self._leg_errors.pop(leg, None)
+            for leg, error in leg_errors.items():
+                self._legs.pop(leg, None)
+                self._leg_errors[leg] = error
+            self._legs_walked += len(legs) + len(leg_errors)
+            cached_legs = dict(self._legs)
+            cached_errors = dict(self._leg_errors)
+
+        results: Dict[int, Optional[LoopEvaluation]] = {}
+        loop_errors: Dict[int, errors.AppError] = {}
+        for tracked in loops:
+            keys = [leg_key(loop, tracked.base_coin) for loop in tracked.loop_info]
+            try:
+                failed = next((cached_errors[key] for key in keys if key in cached_errors), None)
+                if failed is not None:
+                    raise failed
+                results[tracked.loop_id] = self.loop_parser.evaluate_levels(
+                    loop_id=tracked.loop_id,
+                    loop_info=tracked.loop_info,
+                    currency_name=tracked.base_coin,
+                    profit=tracked.profit,
+                    amount=tracked.amount,
+                    rates=rates,
+                    books=books,
+                    levels=OrderBookLevels.merge([cached_legs[key] for key in keys])
+                )
+            except errors.AppError as error:
+                loop_errors[tracked.loop_id] = error
+        with self._lock:
+            for loop_id, evaluation in results.items():
+                if loop_id in self.loops:
+                    self.evaluations[loop_id] = evaluation
+                    self.errors.pop(loop_id, None)
+            for loop_id, error in loop_errors.items():
+                if loop_id in self.loops:
+                    self.evaluations[loop_id] = None
+                    self.errors[loop_id] = error
+            self._loops_evaluated += len(results) + len(loop_errors)
+        return results
+
+    def stats(self) -> IncrementalStats:
+        with self._lock:
+            return IncrementalStats(
+                loops=len(self.loops),
+                legs=len(self.index.leg_loops),
+                updates=self._updates,
+                legs_walked=self._legs_walked,
+                loops_evaluated=self._loops_evaluated,
+                pending=len(self._dirty_loops)
+            )
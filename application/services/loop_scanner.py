@@ -0,0 +1,261 @@
+"""Background re-evaluation of every active loop, hottest loops first"""
+import heapq
+import logging
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Callable, Dict, List, Optional, Tuple
+
+from adapters.repositories.common import LoopsRepo
+from application import errors, interfaces
+from application.dataclasses.common import LoopInfo, ScannerStats
+from application.dataclasses.order_book import LoopEvaluation
+from application.services.loop_index import IncrementalLoopEvaluator
+from application.services.okx_book_stream import OKXBookStream
+from application.services.okx_parser import OKXExchangeParser
+from application.services.okx_services import OKXTradeOnlineParser
+from connection_config import scanner_params
+
+logger = logging.getLogger(__name__)
+
+
+class ScheduledLoop:
+    __slots__ = ('loop_id', 'due', 'interval', 'last_profit', 'profitable')
+
+    def __init__(self, loop_id: int, due: float, interval: float):
+        self.loop_id = loop_id
+        self.due = due
+        self.interval = interval
+        self.last_profit: Optional[float] = None
+        self.profitable = False
+
+
+class LoopScanner:
+    """
+    Keeps re-evaluating the active loops of the platform.
+
+    Loops wait in a heap ordered by the time they are due. A loop that is
+    profitable, with a profit above zero and at least `profit`, or just
+    stopped being profitable, is due again after `min_interval`. A losing
+    loop whose profit moved by `volatility` percent points or more since its
+    last evaluation halves its interval down to `min_interval`; any other
+    loop doubles its interval up to `max_interval`.
+    Each cycle evaluates due loops on `workers` threads until `cycle_budget`
+    seconds pass; loops left over stay at the head of the heap.
+    Results are saved to loop_info by the evaluation itself. With a
+    `book_stream`, the books of new loops are subscribed when they are
+    scheduled and, when `incremental`, an IncrementalLoopEvaluator fed by
+    the stream re-evaluates at the start of each cycle the loops whose
+    books changed, which are then rescheduled like any evaluated loop.
+    """
+
+    def __init__(
+            self,
+            repo: Optional[interfaces.LoopsRepo] = None,
+            exchange_parser: Optional[OKXExchangeParser] = None,
+            book_stream: Optional[OKXBookStream] = None,
+            workers: int = scanner_params['workers'],
+            cycle_budget: float = scanner_params['cycle_budget'],
+            min_interval: float = scanner_params['min_interval'],
+            max_interval: float = scanner_params['max_interval'],
+            refresh_interval: float = scanner_params['refresh_interval'],
+            profit: float = scanner_params['profit'],
+            volatility: float = scanner_params['volatility'],
+            incremental: bool = scanner_params['incremental'],
+            clock: Callable[[], float] = time.monotonic
+    ):
+        self.repo = repo or LoopsRepo()
+        self.loop_parser = OKXTradeOnlineParser(repo=self.repo, exchange_parser=exchange_parser)
+        self.book_stream = book_stream
+        self.incremental = incremental and book_stream is not None
+        # Created on the first refresh, which loads the platform and method
+        self.evaluator: Optional[IncrementalLoopEvaluator] = None
+        self.workers = workers
+        self.cycle_budget = cycle_budget
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.refresh_interval = refresh_interval
+        self.profit = profit
+        self.volatility = volatility
+        self.clock = clock
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='loop-scanner')
+        self._loops: Dict[int, ScheduledLoop] = {}
+        self._queue: List[Tuple[float, int]] = []
+        self._refreshed: Optional[float] = None
+        self._stopped = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._cycles = 0
+        self._evaluated = 0
+        self._failed = 0
+        self._last_cycle_time = 0.0
+        self._loops_per_second = 0.0
+
+    def refresh(self) -> None:
+        """Schedules new active loops right away and forgets the removed ones"""
+        platform = self.loop_parser.get_platform()
+        method = self.loop_parser.get_method()
+        loop_ids = set(self.repo.get_active_loop_ids(platform_id=platform.platform_id, method_id=method.method_id))
+        if self.incremental and self.evaluator is None:
+            self.evaluator = IncrementalLoopEvaluator(self.loop_parser, platform=platform, method=method)
+            self.book_stream.add_listener(self.evaluator.update_book)
+        now = self.clock()
+        new_loop_ids = loop_ids - self._loops.keys()
+        for loop_id in new_loop_ids:
+            self._schedule(ScheduledLoop(loop_id=loop_id, due=now, interval=self.min_interval))
+        if self.book_stream is not None and new_loop_ids:
+            loops = {loop_id: self.loop_parser.get_loop(loop_id=loop_id) for loop_id in new_loop_ids}
+            self.book_stream.subscribe_loops(loops.values())
+            if self.evaluator is not None:
+                for loop_id, loop_info in loops.items():
+                    self._track(loop_id, loop_info)
+        for loop_id in self._loops.keys() - loop_ids:
+            # Its heap entry is skipped when popped
+            del self._loops[loop_id]
+            if self.evaluator is not None:
+                self.evaluator.remove_loop(loop_id)
+        self._refreshed = now
+
+    def run_cycle(self) -> int:
+        """Evaluates due loops within the cycle budget and returns how many were evaluated"""
+        started = self.clock()
+        if self._refreshed is None or started - self._refreshed >= self.refresh_interval:
+            self.refresh()
+        deadline = started + self.cycle_budget
+        running: Dict[Future, ScheduledLoop] = {}
+        evaluated = 0
+        if self.evaluator is not None:
+            for loop_id, evaluation in self.evaluator.refresh().items():
+                loop = self._loops.get(loop_id)
+                if loop is not None:
+                    self._record(loop, evaluation)
+                    evaluated += 1
+        while True:
+            now = self.clock()
+            while now < deadline and len(running) < self.workers:
+                loop = self._pop_due(now)
+                if loop is None:
+                    break
+                running[self.executor.submit(self._evaluate, loop.loop_id)] = loop
+            if not running:
+                break
+            # Evaluations already started are waited for, so a cycle may overrun
+            # its budget by at most one evaluation
+            done, _ = wait(running, timeout=max(deadline - now, 0) or None, return_when=FIRST_COMPLETED)
+            for future in done:
+                self._reschedule(running.pop(future), future)
+                evaluated += 1
+
+        cycle_time = self.clock() - started
+        self._cycles += 1
+        self._evaluated += evaluated
+        self._last_cycle_time = cycle_time
+        self._loops_per_second = evaluated / cycle_time if cycle_time else 0.0
+        return evaluated
+
+    def stats(self) -> ScannerStats:
+        return ScannerStats(
+            loops=len(self._loops),
+            cycles=self._cycles,
+            evaluated=self._evaluated,
+            failed=self._failed,
+            profitable=sum(loop.profitable for loop in self._loops.values()),
+            last_cycle_time=self._last_cycle_time,
+            loops_per_second=self._loops_per_second
+        )
+
+    def start(self) -> 'LoopScanner':
+        self._thread = threading.Thread(target=self._run, name='loop-scanner-cycle', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join()
+        self.executor.shutdown(wait=True)
+
+    def _run(self) -> None:
+        while not self._stopped.is_set():
+            try:
+                evaluated = self.run_cycle()
+            except Exception:
+                # Database and network errors included, the thread keeps scanning
+                logger.exception('Loop scanner cycle failed')
+                self._stopped.wait(self.min_interval)
+                continue
+            if evaluated:
+                logger.info(
+                    'Scanned %s loops in %.3f s (%.1f loops/s)',
+                    evaluated, self._last_cycle_time, self._loops_per_second
+                )
+            self._stopped.wait(self._idle_time())
+
+    def _idle_time(self) -> float:
+        now = self.clock()
+        next_due = self._queue[0][0] if self._queue else now + self.min_interval
+        if self.evaluator is not None:
+            # Loops whose books changed wait for the next cycle
+            next_due = min(next_due, now + self.min_interval)
+        next_refresh = (self._refreshed or now) + self.refresh_interval
+        return max(min(next_due, next_refresh) - now, 0.0)
+
+    def _evaluate(self, loop_id: int) -> Optional[LoopEvaluation]:
+        loop_info = self.loop_parser.get_loop(loop_id=loop_id)
+        if not loop_info:
+            raise errors.GetLoopError(loop_id=f'{loop_id}')
+        return self.loop_parser.evaluate(
+            loop_id=loop_id,
+            currency_name=loop_info[0].currency_from,
+            profit=self.profit,
+            amount=None
+        )
+
+    def _track(self, loop_id: int, loop_info: List[LoopInfo]) -> None:
+        if not loop_info:
+            return
+        try:
+            self.evaluator.add_loop(loop_id, loop_info, loop_info[0].currency_from, profit=self.profit)
+        except errors.AppError as error:
+            # The loop is still scanned over REST
+            logger.warning('Loop %s is not evaluated incrementally: %s', loop_id, error)
+
+    def _schedule(self, loop: ScheduledLoop) -> None:
+        self._loops[loop.loop_id] = loop
+        heapq.heappush(self._queue, (loop.due, loop.loop_id))
+
+    def _pop_due(self, now: float) -> Optional[ScheduledLoop]:
+        while self._queue and self._queue[0][0] <= now:
+            due, loop_id = heapq.heappop(self._queue)
+            loop = self._loops.get(loop_id)
+            if loop is not None and loop.due == due:
+                return loop
+        return None
+
+    def _reschedule(self, loop: ScheduledLoop, future: Future) -> None:
+        try:
+            evaluation = future.result()
+        except Exception:
+            logger.exception('Evaluation of loop %s failed', loop.loop_id)
+            self._failed += 1
+            evaluation = None
+        self._record(loop, evaluation)
+
+    def _record(self, loop: ScheduledLoop, evaluation: Optional[LoopEvaluation]) -> None:
+        profit = evaluation.profit if evaluation else None
+        # Losing loops are evaluated too and come back with a negative profit
+        profitable = profit is not None and profit > 0 and profit >= (self.profit or 0.0)
+        if profitable or loop.profitable:
+            loop.interval = self.min_interval
+        elif (
+                profit is not None and loop.last_profit is not None
+                and abs(profit - loop.last_profit) >= self.volatility
+        ):
+            # Still losing but moving fast, it may cross the threshold soon
+            loop.interval = max(loop.interval / 2, self.min_interval)
+        else:
+            loop.interval = min(loop.interval * 2, self.max_interval)
+        loop.last_profit = profit
+        loop.profitable = profitable
+        loop.due = self.clock() + loop.interval
+        if loop.loop_id in self._loops:
+            self._schedule(loop)
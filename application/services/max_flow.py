@@ -0,0 +1,165 @@
+"""Maximum loop input that still meets a profit threshold, with book slippage"""
+from typing import List, Optional
+
+import numpy as np
+
+from application.dataclasses.constants import OrderTypes
+
+DEPTH_TOLERANCE = 1e-9
+
+
+class LegBook:
+    """
+    One loop step as price levels, best level first.
+
+    `rates` is the amount of currency_to received per unit of currency_from at
+    each level and `capacities` how much currency_from each level absorbs.
+    """
+    __slots__ = ('rates', 'capacities', 'tax', 'input_depth', 'output_depth')
+
+    def __init__(self, rates: np.ndarray, capacities: np.ndarray, tax: float = 0.0):
+        self.rates = np.asarray(rates, dtype=float)
+        self.capacities = np.asarray(capacities, dtype=float)
+        self.tax = tax
+        self.input_depth = np.cumsum(self.capacities)
+        self.output_depth = np.cumsum(self.capacities * self.rates)
+
+    @classmethod
+    def from_okx(cls, book: dict, reversed_pair: bool, tax: float = 0.0) -> 'LegBook':
+        # Selling the base currency of a listed pair hits its bids; when only the
+        # reversed pair is listed we buy its base currency from the asks
+        if reversed_pair:
+            levels = np.array([level[:2] for level in book[OrderTypes.asks]], dtype=float)
+            return cls(rates=1 / levels[:, 0], capacities=levels[:, 0] * levels[:, 1], tax=tax)
+        levels = np.array([level[:2] for level in book[OrderTypes.bids]], dtype=float)
+        return cls(rates=levels[:, 0], capacities=levels[:, 1], tax=tax)
+
+    @property
+    def keep(self) -> float:
+        return 1 - self.tax / 100
+
+    def output(self, quantities: np.ndarray) -> np.ndarray:
+        """Output for each input; inputs deeper than the book give nan"""
+        return self._walk(
+            np.asarray(quantities, dtype=float), self.input_depth, self.output_depth, self.rates
+        ) * self.keep
+
+    def input_for(self, outputs: np.ndarray) -> np.ndarray:
+        """Input needed for each output; outputs deeper than the book give nan"""
+        return self._walk(
+            np.asarray(outputs, dtype=float) / self.keep, self.output_depth, self.input_depth, 1 / self.rates
+        )
+
+    @staticmethod
+    def _walk(values: np.ndarray, depth: np.ndarray, other_depth: np.ndarray, rates: np.ndarray) -> np.ndarray:
+        # Values a rounding error past the last level still fill the whole book
+        beyond = values > depth[-1] * (1 + DEPTH_TOLERANCE)
+        values = np.minimum(values, depth[-1])
+        # nan inputs sort past the end and stay nan
+        index = np.minimum(np.searchsorted(depth, values, side='left'), len(depth) - 1)
+        filled = np.where(index > 0, depth[index - 1], 0.0)
+        other_filled = np.where(index > 0, other_depth[index - 1], 0.0)
+        return np.where(beyond, np.nan, other_filled + (values - filled) * rates[index])
+
+
+class MaxFlow:
+    """Largest loop input meeting the threshold and the loop result at that input"""
+    __slots__ = ('amount', 'profit', 'output', 'simulations')
+
+    def __init__(self, amount: float, profit: float, output: float, simulations: int):
+        self.amount = amount
+        self.profit = profit
+        self.output = output
+        self.simulations = simulations
+
+
+def simulate(legs: List[LegBook], start_quantity: float) -> float:
+    quantity = np.array([start_quantity], dtype=float)
+    for leg in legs:
+        quantity = leg.output(quantity)
+    return float(quantity[0])
+
+
+def loop_profit(start_quantity: float, end_quantity: float) -> float:
+    """Profit of the loop in percent of the input"""
+    return (end_quantity / start_quantity - 1) * 100
+
+
+def breakpoints(legs: List[LegBook]) -> np.ndarray:
+    """Loop inputs at which some leg moves to its next price level"""
+    points = [legs[0].input_depth]
+    for k in range(1, len(legs)):
+        mapped = legs[k].input_depth
+        for leg in reversed(legs[:k]):
+            mapped = leg.input_for(mapped)
+        points.append(mapped)
+    # The shallowest leg, seen from the loop input, bounds the flow
+    limit = min(float(leg_points[-1]) for leg_points in points if not np.isnan(leg_points[-1]))
+    values = np.concatenate(points)
+    values = values[~np.isnan(values)]
+    return np.unique(values[values <= limit])
+
+
+def bisect_max_flow(legs: List[LegBook], profit: float) -> Optional[MaxFlow]:
+    """
+    Binary search over the depth breakpoints for the largest input whose
+    loop profit is still at least `profit`, then exact interpolation inside
+    the last segment where the loop output is linear in the input. None when
+    no input meets `profit`, like linear_max_flow.
+
+    Relies on profit being non-increasing in the input, which holds for books
+    sorted best level first. Needs O(log levels) loop simulations.
+    """
+    points = breakpoints(legs)
+    if not len(points):
+        return None
+    simulations = 0
+
+    def evaluate(x: float) -> float:
+        nonlocal simulations
+        simulations += 1
+        return simulate(legs, x)
+
+    low, high = 0, len(points) - 1
+    best = -1
+    outputs = {}
+    while low <= high:
+        middle = (low + high) // 2
+        outputs[middle] = evaluate(float(points[middle]))
+        if loop_profit(float(points[middle]), outputs[middle]) >= profit:
+            best = middle
+            low = middle + 1
+        else:
+            high = middle - 1
+
+    if best == -1:
+        # Every leg is on its first level up to points[0], so profit is constant there
+        return None
+    point, output = float(points[best]), outputs[best]
+    if best == len(points) - 1:
+        return MaxFlow(point, loop_profit(point, output), output, simulations)
+
+    # Output is linear up to the next breakpoint: out(x) = out(a) + slope * (x - a)
+    next_point = float(points[best + 1])
+    next_output = outputs[best + 1] if best + 1 in outputs else evaluate(next_point)
+    slope = (next_output - output) / (next_point - point)
+    target = 1 + profit / 100
+    if target == slope:
+        amount = next_point
+    else:
+        amount = min(max((output - slope * point) / (target - slope), point), next_point)
+    output = output + slope * (amount - point)
+    return MaxFlow(amount, loop_profit(amount, output), output, simulations)
+
+
+def linear_max_flow(legs: List[LegBook], profit: float) -> Optional[MaxFlow]:
+    """Reference scan probing every breakpoint in order, snapping to level boundaries"""
+    result = None
+    for simulations, point in enumerate(breakpoints(legs), start=1):
+        point = float(point)
+        output = simulate(legs, point)
+        point_profit = loop_profit(point, output)
+        if point_profit < profit:
+            break
+        result = MaxFlow(point, point_profit, output, simulations)
+    return result
@@ -0,0 +1,229 @@
+"""Timing spans, counters and histograms of the request hot path, in the Prometheus text format"""
+import dataclasses
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from application.services.histogram import Histogram
+from connection_config import metrics_params
+
+Labels = Tuple[Tuple[str, str], ...]
+# Gauge name, labels and value read by a collector when metrics are rendered
+Sample = Tuple[str, Dict[str, str], float]
+
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+# Counter incremented by every span of a kind, with the span name as label
+KIND_COUNTERS = {
+    'db': 'okx_db_queries_total',
+    'http': 'okx_http_requests_total',
+}
+
+
+class RequestTrace:
+    """Seconds per span name and calls per kind for one request, from any thread working for it"""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.phases: Dict[str, float] = {}
+        self.calls: Counter = Counter()
+        self._lock = threading.Lock()
+
+    def add(self, name: str, kind: Optional[str], seconds: float) -> None:
+        with self._lock:
+            self.phases[name] = self.phases.get(name, 0.0) + seconds
+            if kind:
+                self.calls[kind] += 1
+
+    def breakdown(self) -> dict:
+        """
+        Milliseconds per span, summed over threads, so spans running
+        concurrently can add up to more than the total.
+        """
+        with self._lock:
+            return {
+                'total_ms': (time.perf_counter() - self.started) * 1000,
+                'phases_ms': {name: seconds * 1000 for name, seconds in sorted(self.phases.items())},
+                'db_queries': self.calls['db'],
+                'http_calls': self.calls['http'],
+            }
+
+
+class Metrics:
+    """
+    Registry of counters and histograms.
+
+    When disabled and no request is being traced, `span` returns a shared
+    no-op context, so instrumented code pays one attribute lookup.
+    """
+
+    def __init__(self, enabled: bool = metrics_params['enabled']):
+        self.enabled = enabled
+        self._counters: Dict[Tuple[str, Labels], float] = {}
+        self._histograms: Dict[Tuple[str, Labels], Histogram] = {}
+        self._collectors: List[Callable[[], Iterable[Sample]]] = []
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def inc(self, name: str, labels: Optional[Dict[str, str]] = None, value: float = 1.0) -> None:
+        key = (name, tuple(sorted((labels or {}).items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0.0) + value
+
+    def observe(self, name: str, value: float, labels: Optional[Dict[str, str]] = None, buckets=None) -> None:
+        key = (name, tuple(sorted((labels or {}).items())))
+        histogram = self._histograms.get(key)
+        if histogram is None:
+            with self._lock:
+                histogram = self._histograms.setdefault(key, Histogram(buckets) if buckets else Histogram())
+        histogram.observe(value)
+
+    def add_collector(self, collect: Callable[[], Iterable[Sample]]) -> None:
+        """`collect` is called on every render for gauges of pools, caches and queues"""
+        with self._lock:
+            self._collectors.append(collect)
+
+    @property
+    def trace(self) -> Optional[RequestTrace]:
+        return getattr(self._local, 'trace', None)
+
+    def span(self, name: str, kind: Optional[str] = None):
+        """Times a block as `name`; `kind` 'db' or 'http' also counts it as a query or call"""
+        if not self.enabled and getattr(self._local, 'trace', None) is None:
+            return _NOOP
+        return self._span(name, kind)
+
+    @contextmanager
+    def _span(self, name: str, kind: Optional[str]) -> Iterator[None]:
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            seconds = time.perf_counter() - started
+            trace = self.trace
+            if trace is not None:
+                trace.add(name, kind, seconds)
+            if self.enabled:
+                self.observe('okx_phase_seconds', seconds, {'phase': name})
+                if kind in KIND_COUNTERS:
+                    self.inc(KIND_COUNTERS[kind], {'span': name})
+
+    @contextmanager
+    def request(self, endpoint: str, debug: bool = False) -> Iterator[Optional[RequestTrace]]:
+        """Traces one request; yields the trace when metrics are enabled or `debug` asks for it"""
+        if not self.enabled and not debug:
+            yield None
+            return
+        trace = RequestTrace()
+        self._local.trace = trace
+        try:
+            yield trace
+        finally:
+            self._local.trace = None
+            if self.enabled:
+                labels = {'endpoint': endpoint}
+                self.observe('okx_request_seconds', time.perf_counter() - trace.started, labels)
+                self.observe('okx_request_db_queries', trace.calls['db'], labels, COUNT_BUCKETS)
+                self.observe('okx_request_http_calls', trace.calls['http'], labels, COUNT_BUCKETS)
+
+    def propagate(self, fn: Callable) -> Callable:
+        """`fn` recording its spans into the current request's trace from whichever thread runs it"""
+        trace = self.trace
+        if trace is None:
+            return fn
+
+        def traced(*args, **kwargs):
+            previous = getattr(self._local, 'trace', None)
+            self._local.trace = trace
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                self._local.trace = previous
+
+        return traced
+
+    def render(self) -> str:
+        with self._lock:
+            counters = sorted(self._counters.items())
+            histograms = sorted(self._histograms.items(), key=lambda item: item[0])
+            collectors = list(self._collectors)
+        lines: List[str] = []
+        typed = set()
+        for (name, labels), value in counters:
+            if name not in typed:
+                lines.append(f'# TYPE {name} counter')
+                typed.add(name)
+            lines.append(f'{name}{_labels(labels)} {value:g}')
+        for (name, labels), histogram in histograms:
+            if name not in typed:
+                lines.append(f'# TYPE {name} histogram')
+                typed.add(name)
+            cumulative, count, total = histogram.snapshot()
+            for bound, bucket_count in cumulative.items():
+                le = '+Inf' if bound == float('inf') else f'{bound:g}'
+                lines.append(f'{name}_bucket{_labels(labels + (("le", le),))} {bucket_count}')
+            lines.append(f'{name}_sum{_labels(labels)} {total:g}')
+            lines.append(f'{name}_count{_labels(labels)} {count}')
+        gauges: Dict[str, List[Tuple[Labels, float]]] = {}
+        for collect in collectors:
+            for name, labels, value in collect():
+                gauges.setdefault(name, []).append((tuple(sorted(labels.items())), value))
+        for name, samples in sorted(gauges.items()):
+            if name not in typed:
+                lines.append(f'# TYPE {name} gauge')
+                typed.add(name)
+            for labels, value in samples:
+                lines.append(f'{name}{_labels(labels)} {_value(value)}')
+        return '\n'.join(lines) + '\n'
+
+
+class _NoopSpan:
+    __slots__ = ()
+
+    def __enter__(self) -> None:
+        return None
+
+    def __exit__(self, *exc) -> None:
+        return None
+
+
+_NOOP = _NoopSpan()
+
+
+def stats_samples(
+        prefix: str,
+        stats,
+        labels: Optional[Dict[str, str]] = None,
+        key_label: str = 'key'
+) -> List[Sample]:
+    """Gauges of the numeric fields of a stats dataclass; a dict field gives one gauge per key"""
+    labels = labels or {}
+    samples = []
+    for field, value in dataclasses.asdict(stats).items():
+        name = f'{prefix}_{field}'
+        if isinstance(value, dict):
+            samples.extend((name, {**labels, key_label: str(key)}, item) for key, item in value.items())
+        elif isinstance(value, (int, float)):
+            samples.append((name, labels, float(value)))
+    return samples
+
+
+def _value(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    return f'{value:g}'
+
+
+def _labels(labels: Labels) -> str:
+    if not labels:
+        return ''
+    escaped = (
+        '{}="{}"'.format(key, str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+        for key, value in labels
+    )
+    return '{' + ','.join(escaped) + '}'
+
+
+# One registry per process, shared by every instrumented module
+metrics = Metrics()
@@ -0,0 +1,360 @@
+"""Async request path: OKX books over aiohttp, courses and loops over an AsyncLoopsRepo"""
+import asyncio
+import datetime
+import logging
+from typing import Any, Dict, List, Optional, Tuple
+
+import aiohttp
+
+from application import errors, interfaces
+from application.dataclasses.common import LoopInfo, MaxFlowRecord, MethodInfo, OKXResponse, PlatformInfo
+from application.dataclasses.order_book import LoopEvaluation, OrderBookLevels
+from application.services.book_capture import BookRecorder
+from application.services.conversion_index import ConversionIndex
+from application.services.deadline import Deadline
+from application.services.okx_parser import OKXExchangeParser
+from application.services.okx_scheduler import RETRY_STATUSES, TokenBucket, backoff_delay
+from application.services.okx_services import OKXTradeOnlineParser
+from application.services.rate_matrix import RateMatrix
+from connection_config import okx_params, okx_rate_limits
+
+logger = logging.getLogger(__name__)
+
+
+class AsyncOKXRequestScheduler:
+    """
+    OKXRequestScheduler for the event loop: the same per-endpoint token
+    buckets, retries and backoff, with callers of one path served in arrival
+    order. Its buckets are separate from the threaded scheduler's, so one
+    process should use one or the other.
+    """
+
+    def __init__(
+            self,
+            limits: Optional[Dict[str, Tuple[int, float]]] = None,
+            burst: float = 1.0,
+            headroom: float = okx_params['rate_headroom'],
+            max_retries: int = okx_params['max_retries'],
+            backoff_base: float = okx_params['backoff_base'],
+            backoff_max: float = okx_params['backoff_max']
+    ):
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.buckets: Dict[str, TokenBucket] = {
+            path: TokenBucket(rate=count / seconds * headroom, capacity=burst)
+            for path, (count, seconds) in (okx_rate_limits if limits is None else limits).items()
+        }
+        self.sent = 0
+        self.retried = 0
+        self._locks: Dict[str, asyncio.Lock] = {}
+
+    async def _acquire(self, path: str) -> None:
+        bucket = self.buckets.get(path)
+        if bucket is None:
+            return
+        lock = self._locks.get(path)
+        if lock is None:
+            lock = self._locks[path] = asyncio.Lock()
+        async with lock:
+            wait = bucket.take()
+            while wait:
+                await asyncio.sleep(wait)
+                wait = bucket.take()
+
+    async def get_json(
+            self,
+            session: aiohttp.ClientSession,
+            url: str,
+            path: str,
+            params: Optional[dict] = None,
+            timeout: Optional[float] = None
+    ) -> Tuple[int, Any]:
+        """Status and decoded body of the last answer"""
+        attempt = 0
+        while True:
+            await self._acquire(path)
+            self.sent += 1
+            async with session.get(url, params=params, timeout=aiohttp.ClientTimeout(total=timeout)) as response:
+                if response.status not in RETRY_STATUSES or attempt >= self.max_retries:
+                    return response.status, await response.json(content_type=None)
+                delay = backoff_delay(attempt, response.headers.get('Retry-After'), self.backoff_base, self.backoff_max)
+            logger.info('OKX answered %s on %s, retrying in %.2f s', response.status, path, delay)
+            self.retried += 1
+            attempt += 1
+            await asyncio.sleep(delay)
+
+
+class AsyncOKXExchangeParser:
+    """
+    OKXExchangeParser for the event loop.
+
+    Every instrument of every leg is requested at once, and concurrent
+    requests for one instrument share a single call. Levels are computed by
+    the code of the synchronous parser on the books and courses given to it.
+    """
+    BOOKS_PATH = OKXExchangeParser.BOOKS_PATH
+
+    def __init__(
+            self,
+            base_url: str = okx_params['base_url'],
+            timeout: float = okx_params['timeout'],
+            book_source: Optional[interfaces.BookSource] = None,
+            scheduler: Optional[AsyncOKXRequestScheduler] = None,
+            conversion_index: Optional[ConversionIndex] = None,
+            recorder: Optional[BookRecorder] = None,
+            pool_maxsize: int = okx_params['pool_maxsize']
+    ):
+        self.base_url = base_url
+        self.timeout = timeout
+        self.book_source = book_source
+        self.scheduler = scheduler or AsyncOKXRequestScheduler()
+        self.recorder = recorder
+        self.pool_maxsize = pool_maxsize
+        self.parser = OKXExchangeParser(base_url=base_url, book_source=book_source, conversion_index=conversion_index)
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._in_flight: Dict[str, asyncio.Future] = {}
+
+    def session(self) -> aiohttp.ClientSession:
+        # Created on first use, inside the running event loop
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=self.pool_maxsize))
+        return self._session
+
+    async def close(self) -> None:
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    async def get_book(self, inst_id: str, timeout: Optional[float] = None) -> Optional[dict]:
+        flight = self._in_flight.get(inst_id)
+        joined = flight is not None
+        if not joined:
+            flight = self._start_flight(inst_id, timeout)
+        try:
+            # A cancelled caller must not cancel the request the others wait for
+            return await asyncio.shield(flight)
+        except errors.GetOrdersBookError as error:
+            # The request joined may have been cut short by another caller's budget
+            if not joined or not isinstance(error.__cause__, asyncio.TimeoutError):
+                raise
+            return await asyncio.shield(self._in_flight.get(inst_id) or self._start_flight(inst_id, timeout))
+
+    def _start_flight(self, inst_id: str, timeout: Optional[float]) -> asyncio.Future:
+        flight = asyncio.ensure_future(self._request_book(inst_id, timeout))
+        self._in_flight[inst_id] = flight
+
+        def landed(_) -> None:
+            self._in_flight.pop(inst_id, None)
+            # Every caller may have given up on it; its error is theirs, not the loop's
+            if not flight.cancelled():
+                flight.exception()
+
+        flight.add_done_callback(landed)
+        return flight
+
+    async def _request_book(self, inst_id: str, timeout: Optional[float] = None) -> Optional[dict]:
+        try:
+            status, payload = await self.scheduler.get_json(
+                self.session(),
+                f'{self.base_url}{self.BOOKS_PATH}',
+                self.BOOKS_PATH,
+                params={'instId': inst_id},
+                timeout=self.timeout if timeout is None else timeout
+            )
+            if status in RETRY_STATUSES:
+                raise errors.GetOrdersBookError(pair=inst_id)
+            data_values = payload.get('data')
+        except (aiohttp.ClientError, asyncio.TimeoutError, ValueError, AttributeError) as error:
+            raise errors.GetOrdersBookError(pair=inst_id) from error
+        book = data_values[0] if data_values else None
+        self.parser.note_listing(inst_id, book)
+        if book:
+            self.parser.last_books[inst_id] = book
+            if self.recorder is not None:
+                self.recorder.record(inst_id, book)
+        return book
+
+    async def get_books(
+            self,
+            inst_ids: List[str],
+            strict: bool = True,
+            deadline: Optional[Deadline] = None
+    ) -> Dict[str, Optional[dict]]:
+        # Same rules as OKXExchangeParser.get_books
+        inst_ids = list(dict.fromkeys(inst_ids))
+        if deadline is not None and deadline.expired:
+            return {inst_id: self.parser.last_books.get(inst_id) for inst_id in inst_ids}
+        timeout = deadline.timeout(self.timeout) if deadline is not None else None
+        flights = {inst_id: asyncio.ensure_future(self.get_book(inst_id, timeout)) for inst_id in inst_ids}
+        if flights:
+            await asyncio.wait(list(flights.values()), timeout=deadline.remaining() if deadline is not None else None)
+        books = {}
+        for inst_id, flight in flights.items():
+            if not flight.done():
+                flight.cancel()
+                deadline.missed = True
+                books[inst_id] = self.parser.last_books.get(inst_id)
+                continue
+            error = flight.exception()
+            if error is None:
+                books[inst_id] = flight.result()
+            elif not isinstance(error, errors.GetOrdersBookError):
+                raise error
+            elif deadline is not None and deadline.expired:
+                books[inst_id] = self.parser.last_books.get(inst_id)
+            elif strict:
+                raise error
+            else:
+                books[inst_id] = None
+        return books
+
+    async def fetch_books(
+            self,
+            loop_info: List[LoopInfo],
+            strict: bool = True,
+            deadline: Optional[Deadline] = None
+    ) -> Dict[str, Optional[dict]]:
+        books = {}
+        inst_ids = []
+        for loop in loop_info:
+            if self.book_source is not None:
+                for inst_id in self.parser.leg_instruments(loop):
+                    book = self.book_source.get_book(inst_id)
+                    if book:
+                        books[inst_id] = book
+                        break
+                else:
+                    inst_ids.extend(self.parser.request_instruments(loop))
+            else:
+                inst_ids.extend(self.parser.request_instruments(loop))
+        books.update(await self.get_books(inst_ids, strict=strict, deadline=deadline))
+        return books
+
+    def get_order_levels(
+            self,
+            loop_info: List[LoopInfo],
+            base_coin: str,
+            platform: PlatformInfo,
+            method: MethodInfo,
+            rates: RateMatrix,
+            books: Dict[str, Optional[dict]]
+    ) -> OrderBookLevels:
+        return self.parser.get_order_levels(
+            loop_info=loop_info,
+            base_coin=base_coin,
+            platform=platform,
+            method=method,
+            rates=rates,
+            books=books
+        )
+
+
+class AsyncOKXTradeOnlineParser:
+    """
+    OKXTradeOnlineParser for the event loop.
+
+    The loop, platform and method are looked up together, then the courses
+    are queried while the books of all legs are fetched. The evaluation
+    itself is the synchronous parser's; its result is saved afterwards.
+    """
+    PLATFORM_NAME = OKXTradeOnlineParser.PLATFORM_NAME
+    METHOD_NAME = OKXTradeOnlineParser.METHOD_NAME
+
+    def __init__(
+            self,
+            repo: interfaces.AsyncLoopsRepo,
+            exchange_parser: Optional[AsyncOKXExchangeParser] = None,
+            engine: str = 'numpy',
+            solver: str = 'depth'
+    ):
+        self.repo = repo
+        self.exchange_parser = exchange_parser or AsyncOKXExchangeParser()
+        self.evaluator = OKXTradeOnlineParser(
+            exchange_parser=self.exchange_parser.parser,
+            overlap_io=False,
+            engine=engine,
+            solver=solver,
+            save_results=False
+        )
+
+    async def get_method(self) -> Optional[MethodInfo]:
+        method = await self.repo.get_method_info(method_name=self.METHOD_NAME)
+        if method:
+            return method
+        else:
+            raise errors.GetCurseError(method=f'{method}')
+
+    async def get_platform(self) -> Optional[PlatformInfo]:
+        platform = await self.repo.get_platform_info(platform_name=self.PLATFORM_NAME)
+        if platform:
+            return platform
+        else:
+            raise errors.GerPlatformError(platform=f'{platform}')
+
+    async def main(
+            self,
+            loop_id: int,
+            currency_name: Optional[str],
+            profit: Optional[float],
+            amount: Optional[float],
+            deadline: Optional[Deadline] = None
+    ) -> OKXResponse:
+        evaluation = await self.evaluate(
+            loop_id=loop_id, currency_name=currency_name, profit=profit, amount=amount, deadline=deadline
+        )
+        return evaluation.to_response() if evaluation else None
+
+    async def evaluate(
+            self,
+            loop_id: int,
+            currency_name: Optional[str],
+            profit: Optional[float],
+            amount: Optional[float],
+            deadline: Optional[Deadline] = None
+    ) -> Optional[LoopEvaluation]:
+        loop_info, platform, method = await asyncio.gather(
+            self.repo.get_loop_by_id(loop_id), self.get_platform(), self.get_method()
+        )
+        if not loop_info:
+            raise errors.GetLoopError(loop_id=f'{loop_id}')
+        if deadline is not None and deadline.expired:
+            return self.evaluator.expired_evaluation()
+        books = asyncio.ensure_future(self.exchange_parser.fetch_books(list(loop_info), deadline=deadline))
+        try:
+            rates = RateMatrix(await self.repo.get_courses_by_pairs(
+                pairs=sorted(RateMatrix.required_pairs(loop_info=loop_info, base_coin=currency_name)),
+                platform_id=platform.platform_id,
+                method_id=method.method_id
+            ))
+        except BaseException:
+            books.cancel()
+            raise
+        evaluation = self.evaluator.evaluate_loop(
+            loop_id=loop_id,
+            loop_info=loop_info,
+            currency_name=currency_name,
+            profit=profit,
+            amount=amount,
+            platform=platform,
+            method=method,
+            rates=rates,
+            books=await books,
+            deadline=deadline
+        )
+        if evaluation is not None and evaluation.loop_profit is not None and evaluation.solver == 'bisect':
+            await self.repo.save_max_flow(MaxFlowRecord(
+                loop_id=loop_id,
+                profit=evaluation.loop_profit.profit,
+                amount=evaluation.loop_profit.amount,
+                added=datetime.datetime.now()
+            ))
+        elif evaluation is not None and evaluation.loop_profit is not None:
+            await self.repo.save_loop_info(
+                loop_id=loop_id,
+                spread=evaluation.loop_profit.profit,
+                max_flow=evaluation.loop_profit.amount,
+                loop_speed=1.0,
+                added=datetime.datetime.now()
+            )
+        return evaluation
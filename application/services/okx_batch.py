@@ -0,0 +1,95 @@
+"""Evaluation of many loops per request on shared order books and courses"""
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
+
+from adapters.repositories.common import LoopsRepo
+from application import errors, interfaces
+from application.dataclasses.common import LoopInfo, LoopJob, LoopJobResult
+from application.services.okx_parser import OKXExchangeParser
+from application.services.okx_services import OKXTradeOnlineParser
+from application.services.rate_matrix import RateMatrix
+from connection_config import okx_params
+
+batch_executor = ThreadPoolExecutor(
+    max_workers=okx_params['max_workers'],
+    thread_name_prefix='okx-batch'
+)
+
+
+class OKXBatchParser:
+    """
+    Evaluates a list of loop jobs.
+
+    Every instrument used by the batch is fetched once and every course is
+    loaded with one query, so cost grows with the number of unique
+    instruments rather than loops. A failing job is reported in its own
+    result and does not fail the batch.
+    """
+
+    def __init__(
+            self,
+            repo: Optional[interfaces.LoopsRepo] = None,
+            exchange_parser: Optional[OKXExchangeParser] = None,
+            executor: Optional[ThreadPoolExecutor] = None
+    ):
+        self.repo = repo or LoopsRepo()
+        self.exchange_parser = exchange_parser or OKXExchangeParser(repo=self.repo)
+        self.executor = executor or batch_executor
+        self.loop_parser = OKXTradeOnlineParser(repo=self.repo, exchange_parser=self.exchange_parser)
+
+    def main(self, jobs: List[LoopJob]) -> List[LoopJobResult]:
+        loops: Dict[int, List[LoopInfo]] = {}
+        loop_errors: Dict[int, errors.AppError] = {}
+        for loop_id in dict.fromkeys(job.loop_id for job in jobs):
+            loop_info = self.loop_parser.get_loop(loop_id=loop_id)
+            if loop_info:
+                loops[loop_id] = loop_info
+            else:
+                loop_errors[loop_id] = errors.GetLoopError(loop_id=f'{loop_id}')
+        if not loops:
+            return [self._failed(job, loop_errors[job.loop_id]) for job in jobs]
+
+        books = self.executor.submit(
+            self.exchange_parser.fetch_books,
+            [loop for loop_info in loops.values() for loop in loop_info],
+            strict=False
+        )
+        platform = self.loop_parser.get_platform()
+        method = self.loop_parser.get_method()
+        pairs = set()
+        for job in jobs:
+            if job.loop_id in loops:
+                pairs.update(RateMatrix.required_pairs(loop_info=loops[job.loop_id], base_coin=job.currency_name))
+        rates = RateMatrix.load(repo=self.repo, pairs=pairs, platform=platform, method=method)
+        books = books.result()
+
+        def evaluate(job: LoopJob) -> LoopJobResult:
+            if job.loop_id in loop_errors:
+                return self._failed(job, loop_errors[job.loop_id])
+            try:
+                evaluation = self.loop_parser.evaluate_loop(
+                    loop_id=job.loop_id,
+                    # Steps are reordered in place per base coin, so every job gets its own list
+                    loop_info=list(loops[job.loop_id]),
+                    currency_name=job.currency_name,
+                    profit=job.profit,
+                    amount=job.amount,
+                    platform=platform,
+                    method=method,
+                    rates=rates,
+                    books=books
+                )
+            except errors.AppError as error:
+                return self._failed(job, error)
+            return LoopJobResult(
+                loop_id=job.loop_id,
+                profit=evaluation.profit if evaluation else None,
+                amount=evaluation.amount if evaluation else None,
+                data=evaluation.data if evaluation else []
+            )
+
+        return list(self.executor.map(evaluate, jobs))
+
+    @staticmethod
+    def _failed(job: LoopJob, error: errors.AppError) -> LoopJobResult:
+        return LoopJobResult(loop_id=job.loop_id, profit=None, amount=None, error=str(error))
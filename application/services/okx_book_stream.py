@@ -0,0 +1,268 @@
+"""Local order books kept in sync with the OKX public WebSocket books channel"""
+import json
+import logging
+import re
+import threading
+import time
+import zlib
+from typing import Callable, Dict, Iterable, List, Optional, Set
+
+import websocket
+
+from application import interfaces
+from application.dataclasses.common import LoopInfo
+from connection_config import stream_params
+
+logger = logging.getLogger(__name__)
+
+CHECKSUM_DEPTH = 25
+# OKX error events name the instrument only in msg: "...channel:books,instId:BTC-USDTT doesn't exist..."
+ERROR_INST_ID = re.compile(r'instId:([A-Za-z0-9_-]+)')
+
+
+def book_checksum(bids: List[list], asks: List[list]) -> int:
+    # OKX: crc32 of "bid:size:ask:size:..." over the best 25 levels, as signed int32
+    parts = []
+    for i in range(CHECKSUM_DEPTH):
+        if i < len(bids):
+            parts.append(f'{bids[i][0]}:{bids[i][1]}')
+        if i < len(asks):
+            parts.append(f'{asks[i][0]}:{asks[i][1]}')
+    crc = zlib.crc32(':'.join(parts).encode())
+    return crc - (1 << 32) if crc >= (1 << 31) else crc
+
+
+class LocalOrderBook:
+    """One instrument's book built from a snapshot and incremental updates"""
+
+    def __init__(self, inst_id: str):
+        self.inst_id = inst_id
+        self.asks: Dict[str, list] = {}
+        self.bids: Dict[str, list] = {}
+        self.ts: Optional[str] = None
+        self.seq_id: Optional[int] = None
+        self.updated_at = 0.0
+        self._sorted: Optional[dict] = None
+
+    def apply_snapshot(self, data: dict) -> None:
+        self.asks = {level[0]: level for level in data.get('asks', [])}
+        self.bids = {level[0]: level for level in data.get('bids', [])}
+        self._touch(data)
+
+    def apply_update(self, data: dict) -> None:
+        for side, levels in ((self.asks, data.get('asks', [])), (self.bids, data.get('bids', []))):
+            for level in levels:
+                if float(level[1]) == 0:
+                    side.pop(level[0], None)
+                else:
+                    side[level[0]] = level
+        self._touch(data)
+
+    def _touch(self, data: dict) -> None:
+        self.ts = data.get('ts', self.ts)
+        if data.get('seqId') is not None:
+            self.seq_id = int(data['seqId'])
+        self.updated_at = time.monotonic()
+        self._sorted = None
+
+    def checksum(self) -> int:
+        book = self.as_dict()
+        return book_checksum(book['bids'], book['asks'])
+
+    def as_dict(self) -> dict:
+        if self._sorted is None:
+            self._sorted = {
+                'asks': sorted(self.asks.values(), key=lambda level: float(level[0])),
+                'bids': sorted(self.bids.values(), key=lambda level: -float(level[0])),
+                'ts': self.ts,
+            }
+        return self._sorted
+
+
+class OKXBookStream(interfaces.BookSource):
+    """
+    Subscribes to OKX order books and serves them from memory.
+
+    `get_book` never touches the network: it returns None on a cold miss or a
+    stale book and subscribes the instrument so later calls are served locally.
+    Books failing the sequence or checksum check are dropped and resubscribed.
+    """
+
+    def __init__(
+            self,
+            url: str = stream_params['url'],
+            channel: str = stream_params['channel'],
+            ping_interval: float = stream_params['ping_interval'],
+            reconnect_delay: float = stream_params['reconnect_delay'],
+            max_age: Optional[float] = stream_params['max_age']
+    ):
+        self.url = url
+        self.channel = channel
+        self.ping_interval = ping_interval
+        self.reconnect_delay = reconnect_delay
+        self.max_age = max_age
+        self.books: Dict[str, LocalOrderBook] = {}
+        self.instruments: Set[str] = set()
+        self.unknown_instruments: Set[str] = set()
+        self.listeners: List[Callable[[str, dict], None]] = []
+        self.messages = 0
+        self.resyncs = 0
+        self._lock = threading.Lock()
+        self._ws: Optional[websocket.WebSocketApp] = None
+        self._stopped = threading.Event()
+        self._connected = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def get_book(self, inst_id: str) -> Optional[dict]:
+        with self._lock:
+            book = self.books.get(inst_id)
+            if book is not None and (
+                    self.max_age is None or time.monotonic() - book.updated_at <= self.max_age
+            ):
+                return book.as_dict()
+        self.subscribe([inst_id])
+        return None
+
+    def add_listener(self, listener: Callable[[str, dict], None]) -> None:
+        """`listener(inst_id, book)` is called from the stream thread after every valid change"""
+        self.listeners.append(listener)
+
+    def subscribe(self, inst_ids: Iterable[str]) -> None:
+        # Instruments OKX rejected before are not asked for again
+        with self._lock:
+            new = [
+                inst_id for inst_id in dict.fromkeys(inst_ids)
+                if inst_id not in self.instruments and inst_id not in self.unknown_instruments
+            ]
+            self.instruments.update(new)
+        if new:
+            self._send('subscribe', new)
+
+    def subscribe_loops(self, loops: Iterable[List[LoopInfo]]) -> None:
+        # Both directions of every step; the ones OKX does not list are rejected once
+        inst_ids = []
+        for loop_info in loops:
+            for loop in loop_info:
+                inst_ids.append(f'{loop.currency_from}-{loop.currency_to}')
+                inst_ids.append(f'{loop.currency_to}-{loop.currency_from}')
+        self.subscribe(inst_ids)
+
+    def _send(self, op: str, inst_ids: List[str]) -> None:
+        if self._ws is None or not self._connected.is_set():
+            # Everything in self.instruments is subscribed again on connect
+            return
+        self._ws.send(json.dumps({
+            'op': op,
+            'args': [{'channel': self.channel, 'instId': inst_id} for inst_id in inst_ids]
+        }))
+
+    def _resync(self, inst_id: str) -> None:
+        with self._lock:
+            self.books.pop(inst_id, None)
+        self.resyncs += 1
+        logger.warning('Order book %s is out of sync, resubscribing', inst_id)
+        self._send('unsubscribe', [inst_id])
+        self._send('subscribe', [inst_id])
+
+    def handle_message(self, raw: str) -> None:
+        if raw == 'pong':
+            return
+        message = json.loads(raw)
+        self.messages += 1
+        if message.get('event') == 'error':
+            inst_id = (message.get('arg') or {}).get('instId')
+            if not inst_id:
+                match = ERROR_INST_ID.search(message.get('msg') or '')
+                inst_id = match and match.group(1)
+            if inst_id:
+                with self._lock:
+                    self.instruments.discard(inst_id)
+                    self.unknown_instruments.add(inst_id)
+            logger.info('OKX stream error: %s', message.get('msg'))
+            return
+        arg = message.get('arg') or {}
+        action = message.get('action')
+        if arg.get('channel') != self.channel or action is None:
+            return
+        inst_id = arg['instId']
+        for data in message.get('data', []):
+            with self._lock:
+                book = self.books.get(inst_id)
+                if action == 'snapshot':
+                    book = LocalOrderBook(inst_id)
+                    book.apply_snapshot(data)
+                elif book is None:
+                    # Update before the snapshot arrived: wait for the snapshot
+                    continue
+                else:
+                    prev_seq_id = data.get('prevSeqId')
+                    if (
+                            prev_seq_id is not None and book.seq_id is not None
+                            and int(prev_seq_id) != book.seq_id
+                    ):
+                        book = None
+                    else:
+                        book.apply_update(data)
+                valid = book is not None and (
+                    data.get('checksum') is None or book.checksum() == int(data['checksum'])
+                )
+                if valid:
+                    self.books[inst_id] = book
+                    snapshot = book.as_dict() if self.listeners else None
+            if not valid:
+                self._resync(inst_id)
+                return
+            for listener in self.listeners:
+                listener(inst_id, snapshot)
+
+    def _on_open(self, ws) -> None:
+        self._connected.set()
+        with self._lock:
+            inst_ids = sorted(self.instruments)
+        if inst_ids:
+            self._send('subscribe', inst_ids)
+
+    def _on_message(self, ws, raw: str) -> None:
+        try:
+            self.handle_message(raw)
+        except (ValueError, KeyError, IndexError):
+            logger.exception('Malformed OKX stream message')
+
+    def _on_close(self, ws, *args) -> None:
+        self._connected.clear()
+        with self._lock:
+            self.books.clear()
+
+    def _ping(self) -> None:
+        while not self._stopped.wait(self.ping_interval):
+            if self._ws is not None and self._connected.is_set():
+                try:
+                    self._ws.send('ping')
+                except websocket.WebSocketException:
+                    pass
+
+    def _run(self) -> None:
+        while not self._stopped.is_set():
+            self._ws = websocket.WebSocketApp(
+                self.url,
+                on_open=self._on_open,
+                on_message=self._on_message,
+                on_close=self._on_close
+            )
+            self._ws.run_forever()
+            self._on_close(self._ws)
+            self._stopped.wait(self.reconnect_delay)
+
+    def start(self) -> 'OKXBookStream':
+        self._thread = threading.Thread(target=self._run, daemon=True, name='okx-book-stream')
+        self._thread.start()
+        threading.Thread(target=self._ping, daemon=True, name='okx-book-stream-ping').start()
+        return self
+
+    def wait_connected(self, timeout: Optional[float] = None) -> bool:
+        return self._connected.wait(timeout)
+
+    def stop(self) -> None:
+        self._stopped.set()
+        if self._ws is not None:
+            self._ws.close()
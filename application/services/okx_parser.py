@@ -1,96 +1,357 @@
 """Module for online parsing okx.com"""
 from abc import ABC
-from typing import List, Optional
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from typing import Dict, FrozenSet, Iterable, List, Optional, Tuple
 
+import numpy as np
 import requests
+from requests.adapters import HTTPAdapter
 
 from adapters.repositories.common import LoopsRepo
+from application import interfaces
 from application.dataclasses.common import (
     CurrenciesPairs,
-    BookOrder,
     LoopInfo,
     BookOrderConverted, PlatformInfo, MethodInfo
 )
-from application.dataclasses.constants import OrderTypes
+from application.dataclasses.order_book import LevelLeg, OrderBookLevels
+from application.dataclasses.constants import OrderTypes, RequestPriority
 from application import errors
+from application.services.book_capture import BookRecorder
+from application.services.conversion_index import ConversionIndex
+from application.services.deadline import Deadline
+from application.services.max_flow import LegBook
+from application.services.metrics import metrics
+from application.services.okx_scheduler import RETRY_STATUSES, OKXRequestScheduler
+from application.services.rate_matrix import RateMatrix
+from application.services.single_flight import SingleFlight
+from connection_config import coalesce_params, okx_params
+
+
+def create_session(pool_maxsize: int = okx_params['pool_maxsize']) -> requests.Session:
+    session = requests.Session()
+    adapter = HTTPAdapter(
+        pool_connections=pool_maxsize,
+        pool_maxsize=pool_maxsize
+    )
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+
+# Shared by all parsers so connections to OKX are kept alive between requests
+okx_session = create_session()
+okx_executor = ThreadPoolExecutor(
+    max_workers=okx_params['max_workers'],
+    thread_name_prefix='okx-books'
+)
+# Every request to OKX goes through one scheduler so the IP stays within the limits
+okx_scheduler = OKXRequestScheduler(okx_session)
+# Concurrent requests for one instrument share a single call to OKX
+okx_book_flights = SingleFlight(ttl=coalesce_params['book_ttl'], maxsize=coalesce_params['maxsize'])
+# Listed instrument of each currency pair per exchange, learnt from book answers
+okx_listed: Dict[Tuple[str, FrozenSet[str]], str] = {}
 
 
 class OKXExchangeParser(ABC):
     """Class for parsing okx.com"""
+    BOOKS_PATH = '/api/v5/market/books-lite'
+
+    def __init__(
+            self,
+            repo: Optional[interfaces.LoopsRepo] = None,
+            session: Optional[requests.Session] = None,
+            executor: Optional[ThreadPoolExecutor] = None,
+            base_url: str = okx_params['base_url'],
+            timeout: float = okx_params['timeout'],
+            book_source: Optional[interfaces.BookSource] = None,
+            book_flights: Optional[SingleFlight] = None,
+            scheduler: Optional[OKXRequestScheduler] = None,
+            priority: RequestPriority = RequestPriority.interactive,
+            conversion_index: Optional[ConversionIndex] = None,
+            recorder: Optional[BookRecorder] = None,
+            rest_fallback: bool = True,
+            listed: Optional[Dict[Tuple[str, FrozenSet[str]], str]] = None
+    ):
+        self.repo = repo or LoopsRepo()
+        # Books fetched over REST are also written to the recorder
+        self.recorder = recorder
+        # Without it, legs missing from book_source have no book instead of being requested
+        self.rest_fallback = rest_fallback
+        self.conversion_index = conversion_index
+        self.book_source = book_source
+        self.session = session or okx_session
+        # A parser given its own session gets its own limits
+        self.scheduler = scheduler or (OKXRequestScheduler(session) if session else okx_scheduler)
+        self.priority = priority
+        self.executor = executor or okx_executor
+        self.base_url = base_url
+        self.timeout = timeout
+        self.book_flights = book_flights or okx_book_flights
+        # Last REST book per instrument, answering for books still in flight when a deadline expires
+        self.last_books: Dict[str, dict] = {}
+        # Once the listed direction of a pair is known the other one is no longer requested
+        self.listed = okx_listed if listed is None else listed
+
+    def get_book(self, inst_id: str, timeout: Optional[float] = None) -> Optional[dict]:
+        started = []
+
+        def request() -> Optional[dict]:
+            started.append(True)
+            return self._request_book(inst_id, timeout)
+
+        try:
+            return self.book_flights.do((self.base_url, inst_id), request)
+        except errors.GetOrdersBookError as error:
+            # The request joined may have been cut short by another caller's budget
+            if started or not isinstance(error.__cause__, requests.Timeout):
+                raise
+            return self.book_flights.do((self.base_url, inst_id), request)
+
+    def _request_book(self, inst_id: str, timeout: Optional[float] = None) -> Optional[dict]:
+        try:
+            with metrics.span('okx.books', kind='http'):
+                response = self.scheduler.get(
+                    f'{self.base_url}{self.BOOKS_PATH}',
+                    self.BOOKS_PATH,
+                    params={'instId': inst_id},
+                    timeout=self.timeout if timeout is None else timeout,
+                    priority=self.priority
+                )
+            if response.status_code in RETRY_STATUSES:
+                raise errors.GetOrdersBookError(pair=inst_id)
+            data_values = response.json().get('data')
+        except (requests.RequestException, ValueError) as error:
+            raise errors.GetOrdersBookError(pair=inst_id) from error
+        book = data_values[0] if data_values else None
+        self.note_listing(inst_id, book)
+        if book:
+            self.last_books[inst_id] = book
+            if self.recorder is not None:
+                self.recorder.record(inst_id, book)
+        return book
+
+    def _listing_key(self, inst_id: str) -> Tuple[str, FrozenSet[str]]:
+        return self.base_url, frozenset(inst_id.split('-'))
+
+    def note_listing(self, inst_id: str, book: Optional[dict]) -> None:
+        """Remembers `inst_id` as listed when OKX answered it with a book, forgets it when without"""
+        key = self._listing_key(inst_id)
+        if book:
+            self.listed[key] = inst_id
+        elif self.listed.get(key) == inst_id:
+            self.listed.pop(key, None)
+
+    def get_books(
+            self,
+            inst_ids: Iterable[str],
+            strict: bool = True,
+            deadline: Optional[Deadline] = None
+    ) -> Dict[str, Optional[dict]]:
+        # Without strict a failed request leaves the instrument without a book.
+        # Past the deadline, books not in yet are the last ones seen, or None;
+        # their requests go on, never past the budget, and leave their books for
+        # the next caller. Nothing is requested once the deadline has expired.
+        inst_ids = list(dict.fromkeys(inst_ids))
+        if deadline is not None and deadline.expired:
+            return {inst_id: self.last_books.get(inst_id) for inst_id in inst_ids}
+        timeout = deadline.timeout(self.timeout) if deadline is not None else None
+        get_book = metrics.propagate(self.get_book)
+        futures = {inst_id: self.executor.submit(get_book, inst_id, timeout) for inst_id in inst_ids}
+        books = {}
+        for inst_id, future in futures.items():
+            try:
+                books[inst_id] = future.result(timeout=deadline.remaining() if deadline is not None else None)
+            except FutureTimeoutError:
+                deadline.missed = True
+                books[inst_id] = self.last_books.get(inst_id)
+            except errors.GetOrdersBookError:
+                if deadline is not None and deadline.expired:
+                    books[inst_id] = self.last_books.get(inst_id)
+                elif strict:
+                    raise
+                else:
+                    books[inst_id] = None
+        return books
+
+    def fetch_books(
+            self,
+            loop_info: List[LoopInfo],
+            strict: bool = True,
+            deadline: Optional[Deadline] = None
+    ) -> Dict[str, Optional[dict]]:
+        # Legs found in the local book source are not requested over REST,
+        # direct and reversed instruments of the others are probed at the same time
+        books = {}
+        inst_ids = []
+        for loop in loop_info:
+            if self.book_source is not None:
+                for inst_id in self.leg_instruments(loop):
+                    book = self.book_source.get_book(inst_id)
+                    if book:
+                        books[inst_id] = book
+                        break
+                else:
+                    if self.rest_fallback:
+                        inst_ids.extend(self.request_instruments(loop))
+            else:
+                inst_ids.extend(self.request_instruments(loop))
+        with metrics.span('okx.fetch_books'):
+            books.update(self.get_books(inst_ids, strict=strict, deadline=deadline))
+        return books
 
     def get_orders_book(
             self, loop_info: List[LoopInfo],
             base_coin: str,
             platform: PlatformInfo,
-            method: MethodInfo
+            method: MethodInfo,
+            rates: Optional[RateMatrix] = None,
+            books: Optional[Dict[str, Optional[dict]]] = None
     ) -> List[BookOrderConverted]:
+        return self.get_order_levels(
+            loop_info=loop_info,
+            base_coin=base_coin,
+            platform=platform,
+            method=method,
+            rates=rates,
+            books=books
+        ).to_book_orders()
+
+    def get_order_levels(
+            self, loop_info: List[LoopInfo],
+            base_coin: str,
+            platform: PlatformInfo,
+            method: MethodInfo,
+            rates: Optional[RateMatrix] = None,
+            books: Optional[Dict[str, Optional[dict]]] = None
+    ) -> OrderBookLevels:
         loop_data = []
         sorted_loop = self._check_first_step(loop_info=loop_info, currency_from=base_coin)
+        if books is None:
+            books = self.fetch_books(loop_info=sorted_loop)
+        if rates is None:
+            rates = self.load_rates(loop_info=sorted_loop, base_coin=base_coin, platform=platform, method=method)
         for loop in sorted_loop:
-            loop_step = []
-            pair = loop.get_currencies_pairs
-            data_values = requests.get(
-                f"https://www.okx.com/api/v5/market/books-lite?instId={pair}"
-            ).json().get('data')
-            if data_values:
-                values = data_values[0][OrderTypes.asks]
-                for value in values:
-                    loop_step.append(
-                        BookOrder(
-                            currency_from=loop.currency_from,
-                            currency_to=loop.currency_to,
-                            rate=float(value[0]),
-                            quantity=float(value[1]),
-                            rule_id=loop.rule_id
-                        )
-                    )
-            else:
-                revert_pair = self._get_revert_currency_pair(loop)
-                data_values = requests.get(
-                    f"https://www.okx.com/api/v5/market/books-lite?instId={revert_pair.pair_names}"
-                ).json().get('data')
-                if data_values:
-                    values = data_values[0][OrderTypes.bids]
-                    for value in values:
-                        rate = 1 / float(value[1])
-                        loop_step.append(
-                            BookOrder(
-                                currency_from=loop.currency_to,
-                                currency_to=loop.currency_from,
-                                rate=rate,
-                                quantity=float(value[1]),
-                                rule_id=loop.rule_id
-                            )
-                        )
-            if loop_step[0].currency_from == base_coin:
-                base_currency_loop_step = []
-                amount = 0
-                for order in loop_step:
-                    amount += order.quantity
-                    base_currency_loop_step.append(
-                        BookOrderConverted(
-                            currency_from=order.currency_from,
-                            currency_to=base_coin,
-                            rate=1,
-                            quantity_for_translation=order.quantity,
-                            quantity_base_currency=order.quantity,
-                            total_amount=amount,
-                            rule_id=order.rule_id,
-                            platform_from=platform.platform_name,
-                            platform_to=method.method_name,
-                            tax=0
-                        )
-                    )
-            else:
-                base_currency_loop_step = self._convert_to_base_coin(
-                    orders_book=loop_step,
-                    base_coin=base_coin,
-                    platform=platform,
-                    method=method
-                )
-            loop_data.extend(base_currency_loop_step)
-        sorted_loop_data = sorted(loop_data, key=lambda order_book: order_book.total_amount)
-        return sorted_loop_data
+            loop_data.append(self.get_leg_levels(
+                loop=loop,
+                base_coin=base_coin,
+                platform=platform,
+                method=method,
+                rates=rates,
+                books=books
+            ))
+        return OrderBookLevels.merge(loop_data)
+
+    def load_rates(
+            self,
+            loop_info: List[LoopInfo],
+            base_coin: str,
+            platform: PlatformInfo,
+            method: MethodInfo
+    ) -> RateMatrix:
+        """Every course evaluating the loop can touch, in one query"""
+        return RateMatrix.load(
+            repo=self.repo,
+            pairs=RateMatrix.required_pairs(loop_info=loop_info, base_coin=base_coin),
+            platform=platform,
+            method=method
+        )
+
+    def get_leg_levels(
+            self,
+            loop: LoopInfo,
+            base_coin: str,
+            platform: PlatformInfo,
+            method: MethodInfo,
+            rates: RateMatrix,
+            books: Dict[str, Optional[dict]]
+    ) -> OrderBookLevels:
+        """Levels of one loop step converted to the base coin"""
+        quantities = None
+        book = books.get(loop.get_currencies_pairs)
+        if book:
+            currency_from = loop.currency_from
+            quantities = self._level_quantities(book[OrderTypes.asks])
+        else:
+            revert_pair = self._get_revert_currency_pair(loop)
+            book = books.get(revert_pair.pair_names)
+            if book:
+                currency_from = loop.currency_to
+                quantities = self._level_quantities(book[OrderTypes.bids])
+        if quantities is None or not len(quantities):
+            raise errors.GetOrdersBookError(pair=loop.get_currencies_pairs)
+        if currency_from == base_coin:
+            return OrderBookLevels.from_leg(
+                leg=LevelLeg(
+                    currency_from=currency_from,
+                    currency_to=base_coin,
+                    rule_id=loop.rule_id,
+                    platform_from=platform.platform_name,
+                    platform_to=method.method_name,
+                    rate=1.0,
+                    tax=0.0
+                ),
+                quantity_for_translation=quantities,
+                quantity_base_currency=quantities
+            )
+        return self._convert_to_base_coin(
+            currency_from=currency_from,
+            quantities=quantities,
+            rule_id=loop.rule_id,
+            base_coin=base_coin,
+            platform=platform,
+            method=method,
+            rates=rates
+        )
+
+    def leg_timestamps(self, loop_info: List[LoopInfo], books: Dict[str, Optional[dict]]) -> List[Optional[int]]:
+        """OKX time in ms of the book each step is read from, None when it has none"""
+        timestamps = []
+        for loop in loop_info:
+            book = books.get(loop.get_currencies_pairs) or books.get(self._get_revert_currency_pair(loop).pair_names)
+            try:
+                timestamps.append(int(book['ts']))
+            except (KeyError, TypeError, ValueError):
+                timestamps.append(None)
+        return timestamps
+
+    def leg_instruments(self, loop: LoopInfo) -> List[str]:
+        """Instruments a loop step can be read from, the listed direction first"""
+        return [loop.get_currencies_pairs, self._get_revert_currency_pair(loop).pair_names]
+
+    def request_instruments(self, loop: LoopInfo) -> List[str]:
+        """Instruments to request for a loop step, only the listed one once it is known"""
+        inst_ids = self.leg_instruments(loop)
+        listed = self.listed.get(self._listing_key(inst_ids[0]))
+        return [listed] if listed else inst_ids
+
+    def sort_loop(self, loop_info: List[LoopInfo], base_coin: str) -> List[LoopInfo]:
+        """Copy of the loop starting with the step that spends the base coin"""
+        return self._check_first_step(loop_info=list(loop_info), currency_from=base_coin)
+
+    @staticmethod
+    def _level_quantities(values: List[list]) -> np.ndarray:
+        return np.array([value[1] for value in values], dtype=float)
+
+    def get_leg_books(
+            self,
+            loop_info: List[LoopInfo],
+            base_coin: str,
+            books: Optional[Dict[str, Optional[dict]]] = None
+    ) -> List[LegBook]:
+        sorted_loop = self._check_first_step(loop_info=loop_info, currency_from=base_coin)
+        if books is None:
+            books = self.fetch_books(loop_info=sorted_loop)
+        return [self.get_leg_book(loop, books) for loop in sorted_loop]
+
+    def get_leg_book(self, loop: LoopInfo, books: Dict[str, Optional[dict]]) -> LegBook:
+        book = books.get(loop.get_currencies_pairs)
+        if book and book[OrderTypes.bids]:
+            return LegBook.from_okx(book, reversed_pair=False, tax=loop.tax)
+        book = books.get(self._get_revert_currency_pair(loop).pair_names)
+        if book and book[OrderTypes.asks]:
+            return LegBook.from_okx(book, reversed_pair=True, tax=loop.tax)
+        raise errors.GetOrdersBookError(pair=loop.get_currencies_pairs)
 
     def _get_revert_currency_pair(self, currency_pair: LoopInfo) -> CurrenciesPairs:
         pair = currency_pair.get_currencies_pairs.split('-')
@@ -98,50 +359,47 @@ class OKXExchangeParser(ABC):
 
     def _convert_to_base_coin(
             self,
-            orders_book: List[BookOrder],
+            currency_from: str,
+            quantities: np.ndarray,
+            rule_id: int,
             base_coin: str,
             platform: PlatformInfo,
-            method: MethodInfo
-    ) -> List[BookOrderConverted]:
-        new_orders_book = []
-        amount = 0
-        course = self.get_curses(
-            currency_from=orders_book[0].currency_from,
-            currency_to=base_coin,
-            platform_id=platform.platform_id,
-            method_id=method.method_id
+            method: MethodInfo,
+            rates: RateMatrix
+    ) -> OrderBookLevels:
+        course = rates.get(currency_from=currency_from, currency_to=base_coin)
+        if not course and self.conversion_index is not None:
+            # No listed course, convert through other currencies
+            course = self.conversion_index.get(
+                platform=platform.platform_name,
+                method=method.method_name,
+                currency_from=currency_from,
+                base_coin=base_coin
+            )
+        if not course:
+            raise errors.GetCurseError(pair=f'{currency_from}-{base_coin}')
+        return OrderBookLevels.from_leg(
+            leg=LevelLeg(
+                currency_from=currency_from,
+                currency_to=base_coin,
+                rule_id=rule_id,
+                platform_from=platform.platform_name,
+                platform_to=method.method_name,
+                rate=course.rate,
+                tax=course.tax
+            ),
+            quantity_for_translation=quantities,
+            quantity_base_currency=quantities * course.rate
         )
-        for order in orders_book:
-            convert_coin = order.currency_from
-            if course:
-                quantity_base_currency = order.quantity * course['rate']
-                amount += quantity_base_currency
-                new_orders_book.append(
-                    BookOrderConverted(
-                        currency_from=order.currency_from,
-                        currency_to=base_coin,
-                        rate=course['rate'],
-                        quantity_for_translation=order.quantity,
-                        quantity_base_currency=quantity_base_currency,
-                        total_amount=amount,
-                        rule_id=order.rule_id,
-                        platform_from=platform.platform_name,
-                        platform_to=method.method_name,
-                        tax=course['tax']
-                    )
-                )
-            else:
-                raise errors.GetCurseError(pair=f'{convert_coin}-{base_coin}')
-        return new_orders_book
 
-    @staticmethod
     def get_curses(
+            self,
             currency_from: str,
             currency_to: str,
             platform_id: int,
             method_id: int
     ) -> Optional[float]:
-        return LoopsRepo().get_curses_by_currency_name(
+        return self.repo.get_curses_by_currency_name(
             currency_from=currency_from,
             currency_to=currency_to,
             platform_id=platform_id,
@@ -151,6 +409,8 @@ class OKXExchangeParser(ABC):
     def _check_first_step(self, loop_info: List[LoopInfo], currency_from: str) -> List[LoopInfo]:
         # Сортируем цепочку, начиная с шага с базовой валютой
         sorted_list = []
+        if all(loop.currency_from != currency_from for loop in loop_info):
+            raise errors.BaseCoinError(currency=currency_from)
         if loop_info[0].currency_from == currency_from:
             return loop_info
         else:
@@ -0,0 +1,171 @@
+"""Rate limited, prioritised gateway for every OKX REST call"""
+import heapq
+import itertools
+import logging
+import random
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+import requests
+
+from application.dataclasses.common import SchedulerStats
+from application.dataclasses.constants import RequestPriority
+from application.services.histogram import Histogram
+from connection_config import okx_params, okx_rate_limits
+
+logger = logging.getLogger(__name__)
+
+RETRY_STATUSES = frozenset({429, 500, 502, 503, 504})
+
+
+def backoff_delay(attempt: int, retry_after: Optional[str], backoff_base: float, backoff_max: float) -> float:
+    """Retry-After when OKX sends it, else a jittered exponential backoff"""
+    if retry_after:
+        try:
+            return min(float(retry_after), backoff_max)
+        except ValueError:
+            pass
+    # Full jitter keeps retrying callers from arriving together again
+    return random.uniform(0, min(backoff_max, backoff_base * 2 ** attempt))
+
+
+class TokenBucket:
+    """`rate` tokens per second, at most `capacity` of them saved up"""
+
+    def __init__(self, rate: float, capacity: float = 1.0, clock: Callable[[], float] = time.monotonic):
+        self.rate = rate
+        self.capacity = capacity
+        self.clock = clock
+        self._tokens = capacity
+        self._updated = clock()
+
+    def take(self) -> float:
+        """Takes a token and returns 0, or returns how long until one is available"""
+        now = self.clock()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+        if self._tokens >= 1:
+            self._tokens -= 1
+            return 0.0
+        return (1 - self._tokens) / self.rate
+
+
+class _Endpoint:
+    __slots__ = ('bucket', 'waiting', 'condition', 'sent', 'retried', 'wait_time')
+
+    def __init__(self, bucket: TokenBucket):
+        self.bucket = bucket
+        self.waiting: List[Tuple[int, int]] = []
+        self.condition = threading.Condition()
+        self.sent = 0
+        self.retried = 0
+        self.wait_time: Dict[RequestPriority, Histogram] = {priority: Histogram() for priority in RequestPriority}
+
+
+class OKXRequestScheduler:
+    """
+    Sends OKX GET requests within the published per-endpoint limits.
+
+    Each path has a token bucket refilled at `headroom * requests / seconds`
+    from `limits`; paths without a limit are sent right away. Callers waiting
+    for the same path are served by priority and then in arrival order, so
+    interactive requests overtake queued background scans. Answers 429 and
+    5xx are retried up to `max_retries` times after a jittered exponential
+    backoff, or the Retry-After header when OKX sends one; the last answer is
+    then returned as is. Retries take a new token.
+    """
+
+    def __init__(
+            self,
+            session: requests.Session,
+            limits: Optional[Dict[str, Tuple[int, float]]] = None,
+            burst: float = 1.0,
+            headroom: float = okx_params['rate_headroom'],
+            max_retries: int = okx_params['max_retries'],
+            backoff_base: float = okx_params['backoff_base'],
+            backoff_max: float = okx_params['backoff_max'],
+            clock: Callable[[], float] = time.monotonic,
+            sleep: Callable[[float], None] = time.sleep
+    ):
+        self.session = session
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.clock = clock
+        self.sleep = sleep
+        # A bucket holding `burst` tokens lets at most requests + burst through
+        # in any window of `seconds`. Requests paced exactly at the limit still
+        # reach OKX closer together because of network jitter, hence `headroom`.
+        self.endpoints: Dict[str, _Endpoint] = {
+            path: _Endpoint(TokenBucket(rate=count / seconds * headroom, capacity=burst, clock=clock))
+            for path, (count, seconds) in (okx_rate_limits if limits is None else limits).items()
+        }
+        self._sequence = itertools.count()
+
+    def get(
+            self,
+            url: str,
+            path: str,
+            params: Optional[dict] = None,
+            timeout: Optional[float] = None,
+            priority: RequestPriority = RequestPriority.interactive
+    ) -> requests.Response:
+        endpoint = self.endpoints.get(path)
+        attempt = 0
+        while True:
+            if endpoint is not None:
+                self._acquire(endpoint, priority)
+            response = self.session.get(url, params=params, timeout=timeout)
+            if response.status_code not in RETRY_STATUSES or attempt >= self.max_retries:
+                return response
+            delay = self._backoff(attempt, response)
+            logger.info('OKX answered %s on %s, retrying in %.2f s', response.status_code, path, delay)
+            if endpoint is not None:
+                with endpoint.condition:
+                    endpoint.retried += 1
+            attempt += 1
+            self.sleep(delay)
+
+    def _acquire(self, endpoint: _Endpoint, priority: RequestPriority) -> None:
+        started = self.clock()
+        entry = (int(priority), next(self._sequence))
+        with endpoint.condition:
+            heapq.heappush(endpoint.waiting, entry)
+            try:
+                while True:
+                    if endpoint.waiting[0] == entry:
+                        wait = endpoint.bucket.take()
+                        if not wait:
+                            break
+                        endpoint.condition.wait(wait)
+                    else:
+                        endpoint.condition.wait()
+            finally:
+                endpoint.waiting.remove(entry)
+                heapq.heapify(endpoint.waiting)
+                # The next caller in line becomes the head
+                endpoint.condition.notify_all()
+            endpoint.sent += 1
+        endpoint.wait_time[priority].observe(self.clock() - started)
+
+    def _backoff(self, attempt: int, response: requests.Response) -> float:
+        return backoff_delay(attempt, response.headers.get('Retry-After'), self.backoff_base, self.backoff_max)
+
+    def stats(self) -> Dict[str, SchedulerStats]:
+        result = {}
+        for path, endpoint in self.endpoints.items():
+            with endpoint.condition:
+                sent, retried, queued = endpoint.sent, endpoint.retried, len(endpoint.waiting)
+            result[path] = SchedulerStats(
+                sent=sent,
+                retried=retried,
+                queued=queued,
+                wait_p50={
+                    priority.name: endpoint.wait_time[priority].quantile(0.5) for priority in RequestPriority
+                },
+                wait_p99={
+                    priority.name: endpoint.wait_time[priority].quantile(0.99) for priority in RequestPriority
+                }
+            )
+        return result
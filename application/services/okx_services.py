@@ -1,32 +1,73 @@
 import datetime
-from typing import List, Optional
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
 
 from adapters.repositories.common import LoopsRepo
-from application import errors
+from application import errors, interfaces
 from application.dataclasses.common import (
     LoopInfo,
     OKXResponse,
     LoopProfit,
+    MaxFlowRecord,
     BookOrderParsed,
+    BookOrderConverted,
     MethodInfo,
     PlatformInfo,
 )
+from application.dataclasses.order_book import LoopEvaluation, OrderBookLevels
+from application.services.deadline import Deadline
+from application.services.depth_walk import depth_walk
+from application.services.max_flow import bisect_max_flow
+from application.services.metrics import metrics
 from application.services.okx_parser import OKXExchangeParser
+from application.services.rate_matrix import RateMatrix
+from connection_config import deadline_params, okx_params
+
+# Runs order book fetching while the request thread talks to the database
+io_executor = ThreadPoolExecutor(
+    max_workers=okx_params['max_workers'],
+    thread_name_prefix='okx-io'
+)
 
 
 class OKXTradeOnlineParser:
     PLATFORM_NAME = 'OKX'
     METHOD_NAME = 'Trade'
 
+    def __init__(
+            self,
+            repo: Optional[interfaces.LoopsRepo] = None,
+            exchange_parser: Optional[OKXExchangeParser] = None,
+            overlap_io: bool = True,
+            engine: str = 'numpy',
+            solver: str = 'depth',
+            save_results: bool = True,
+            max_skew: Optional[float] = deadline_params['max_skew'],
+            skew_action: str = deadline_params['skew_action']
+    ):
+        self.repo = repo or LoopsRepo()
+        self.exchange_parser = exchange_parser or OKXExchangeParser(repo=self.repo)
+        self.overlap_io = overlap_io
+        # 'numpy' evaluates all depths in one pass, 'python' walks level by level
+        self.engine = engine
+        # 'depth' stops the walk at book levels, 'bisect' finds the exact max flow in profit mode.
+        # The two answer in different units, so bisect results go to loop_max_flow, not loop_info.
+        self.solver = solver
+        # Backtests evaluate past books and must not write loop_info rows
+        self.save_results = save_results
+        # Legs whose books are more than max_skew seconds apart are flagged as stale, or rejected
+        self.max_skew = max_skew
+        self.skew_action = skew_action
+
     def get_method(self) -> Optional[MethodInfo]:
-        method = LoopsRepo().get_method_info(method_name=self.METHOD_NAME)
+        method = self.repo.get_method_info(method_name=self.METHOD_NAME)
         if method:
             return method
         else:
             raise errors.GetCurseError(method=f'{method}')
 
     def get_platform(self) -> Optional[PlatformInfo]:
-        platform = LoopsRepo().get_platform_info(platform_name=self.PLATFORM_NAME)
+        platform = self.repo.get_platform_info(platform_name=self.PLATFORM_NAME)
         if platform:
             return platform
         else:
@@ -39,75 +80,279 @@ class OKXTradeOnlineParser:
             profit: Optional[float],
             amount: Optional[float]
     ) -> OKXResponse:
-        last_profitable_rate = list()
-        data = list()
-        loop_info = self.get_loop(loop_id=loop_id)
-        book_orders = OKXExchangeParser().get_orders_book(
+        evaluation = self.evaluate(
+            loop_id=loop_id,
+            currency_name=currency_name,
+            profit=profit,
+            amount=amount
+        )
+        return evaluation.to_response() if evaluation else None
+
+    def evaluate(
+            self,
+            loop_id: int,
+            currency_name: Optional[str],
+            profit: Optional[float],
+            amount: Optional[float],
+            deadline: Optional[Deadline] = None
+    ) -> Optional[LoopEvaluation]:
+        with metrics.span('service.get_loop'):
+            loop_info = self.get_loop(loop_id=loop_id)
+        if not loop_info:
+            raise errors.GetLoopError(loop_id=f'{loop_id}')
+        if deadline is not None and deadline.expired:
+            return self.expired_evaluation()
+        books = (
+            io_executor.submit(metrics.propagate(self.exchange_parser.fetch_books), list(loop_info), deadline=deadline)
+            if self.overlap_io else None
+        )
+        with metrics.span('service.platform_method'):
+            platform = self.get_platform()
+            method = self.get_method()
+        if deadline is not None and deadline.expired:
+            return self.expired_evaluation()
+        # One query per platform for every course the depth walk below can touch
+        with metrics.span('service.rates'):
+            rates = self.exchange_parser.load_rates(
+                loop_info=loop_info, base_coin=currency_name, platform=platform, method=method
+            )
+        with metrics.span('service.books_wait'):
+            books = books.result() if books else self.exchange_parser.fetch_books(list(loop_info), deadline=deadline)
+        return self.evaluate_loop(
+            loop_id=loop_id,
             loop_info=loop_info,
-            base_coin=currency_name,
-            platform=self.get_platform(),
-            method=self.get_method()
+            currency_name=currency_name,
+            profit=profit,
+            amount=amount,
+            platform=platform,
+            method=method,
+            rates=rates,
+            books=books,
+            deadline=deadline
         )
 
-        for order in book_orders:
-            data.append(
-                BookOrderParsed(
-                    platform_from=order.platform_from,
-                    platform_to=order.platform_to,
-                    method=self.METHOD_NAME,
-                    currency_from=order.currency_from,
-                    currency_to=order.currency_to,
-                    rate=order.rate,
-                    rule_id=order.rule_id,
-                    tax=order.tax,
-                    sum_start=order.quantity_for_translation,
-                    sum_end=order.quantity_base_currency
+    def evaluate_loop(
+            self,
+            loop_id: int,
+            loop_info: List[LoopInfo],
+            currency_name: Optional[str],
+            profit: Optional[float],
+            amount: Optional[float],
+            platform: PlatformInfo,
+            method: MethodInfo,
+            rates: RateMatrix,
+            books: Dict[str, Optional[dict]],
+            deadline: Optional[Deadline] = None
+    ) -> Optional[LoopEvaluation]:
+        """
+        Evaluates a loop on books and courses that were already loaded.
+
+        Past the deadline, a loop with a step left without any book gives a
+        stale evaluation without profit instead of an error; any other is
+        flagged stale.
+        """
+        leg_ts = self.exchange_parser.leg_timestamps(self.exchange_parser.sort_loop(loop_info, currency_name), books)
+        known_ts = [ts for ts in leg_ts if ts is not None]
+        skew_ms = max(known_ts) - min(known_ts) if known_ts else None
+        skewed = self.max_skew is not None and skew_ms is not None and skew_ms > self.max_skew * 1000
+        if skewed and self.skew_action == 'reject':
+            raise errors.LegSkewError(skew_ms=skew_ms, max_skew_ms=int(self.max_skew * 1000))
+        stale = skewed or (deadline is not None and deadline.expired)
+        with metrics.span('service.order_levels'):
+            try:
+                levels = self.exchange_parser.get_order_levels(
+                    loop_info=loop_info,
+                    base_coin=currency_name,
+                    platform=platform,
+                    method=method,
+                    rates=rates,
+                    books=books
                 )
+            except errors.GetOrdersBookError:
+                if deadline is None or not deadline.expired:
+                    raise
+                return self.expired_evaluation(leg_ts=leg_ts, skew_ms=skew_ms)
+        with metrics.span('service.evaluate_levels'):
+            evaluation = self.evaluate_levels(
+                loop_id=loop_id,
+                loop_info=loop_info,
+                currency_name=currency_name,
+                profit=profit,
+                amount=amount,
+                rates=rates,
+                books=books,
+                levels=levels
+            )
+        if evaluation is not None:
+            stale = stale or (deadline is not None and deadline.expired)
+            evaluation.leg_ts, evaluation.skew_ms, evaluation.stale = leg_ts, skew_ms, stale
+        return evaluation
+
+    def expired_evaluation(
+            self,
+            leg_ts: Optional[List[Optional[int]]] = None,
+            skew_ms: Optional[int] = None
+    ) -> LoopEvaluation:
+        """Stale evaluation without profit, for a loop the deadline ran out on"""
+        return LoopEvaluation(
+            loop_profit=None,
+            levels=OrderBookLevels.merge([]),
+            method=self.METHOD_NAME,
+            leg_ts=leg_ts,
+            skew_ms=skew_ms,
+            stale=True
+        )
+
+    def evaluate_levels(
+            self,
+            loop_id: int,
+            loop_info: List[LoopInfo],
+            currency_name: Optional[str],
+            profit: Optional[float],
+            amount: Optional[float],
+            rates: RateMatrix,
+            books: Dict[str, Optional[dict]],
+            levels: OrderBookLevels
+    ) -> Optional[LoopEvaluation]:
+        """Evaluates a loop, already starting with the base coin, on its merged levels"""
+        if profit and self.solver == 'bisect':
+            return self._max_flow(loop_id, loop_info, currency_name, levels, books, profit)
+        if self.engine == 'python':
+            response = self._walk_levels(
+                loop_id, loop_info, levels.to_book_orders(), rates, profit, amount
             )
+            return response and LoopEvaluation(
+                loop_profit=LoopProfit(profit=response.profit, amount=response.amount),
+                levels=levels[:len(response.data)],
+                method=self.METHOD_NAME
+            )
+
+        result = depth_walk(
+            total_amounts=levels.total_amount,
+            loop_info=loop_info,
+            rates=rates,
+            currency_from=currency_name,
+            profit=profit,
+            amount=amount
+        )
+        if result is None:
+            return None
+        if result.loop_profit is None:
+            # No level met the profit threshold
+            return LoopEvaluation(loop_profit=None, levels=levels[:0], method=self.METHOD_NAME)
+        self._save_loop_profit(loop_id, result.loop_profit)
+        return LoopEvaluation(
+            loop_profit=result.loop_profit,
+            levels=levels[:result.data_end],
+            method=self.METHOD_NAME
+        )
+
+    def _max_flow(
+            self,
+            loop_id: int,
+            loop_info: List[LoopInfo],
+            currency_name: str,
+            levels: OrderBookLevels,
+            books: dict,
+            profit: float
+    ) -> Optional[LoopEvaluation]:
+        # Unlike the depth walk, which prices every step at its course and only
+        # takes level sizes from the books, the loop is run through the book
+        # prices: selling into the bids of a listed pair, buying from the asks of
+        # a reversed one. Start and end are both in the base coin, so no course
+        # is needed. `profit` and the answer are in percent of the input and
+        # amount is the input itself; loop_info keeps the depth walk's units.
+        flow = bisect_max_flow(
+            legs=self.exchange_parser.get_leg_books(loop_info, currency_name, books),
+            profit=profit
+        )
+        if flow is None:
+            return None
+        loop_profit = LoopProfit(profit=flow.profit, amount=flow.amount)
+        self._save_max_flow(loop_id, loop_profit)
+        return LoopEvaluation(
+            loop_profit=loop_profit,
+            levels=levels[levels.total_amount - levels.quantity_base_currency < flow.amount],
+            method=self.METHOD_NAME,
+            solver='bisect'
+        )
+
+    def _parse_order(self, order: BookOrderConverted) -> BookOrderParsed:
+        return BookOrderParsed(
+            platform_from=order.platform_from,
+            platform_to=order.platform_to,
+            method=self.METHOD_NAME,
+            currency_from=order.currency_from,
+            currency_to=order.currency_to,
+            rate=order.rate,
+            rule_id=order.rule_id,
+            tax=order.tax,
+            sum_start=order.quantity_for_translation,
+            sum_end=order.quantity_base_currency
+        )
+
+    def _save_loop_profit(self, loop_id: int, loop_profit: LoopProfit) -> None:
+        if not self.save_results:
+            return
+        self.repo.save_loop_info(
+            loop_id=loop_id,
+            spread=loop_profit.profit,
+            max_flow=loop_profit.amount,
+            loop_speed=1.0,
+            added=datetime.datetime.now()
+        )
+
+    def _save_max_flow(self, loop_id: int, loop_profit: LoopProfit) -> None:
+        if not self.save_results:
+            return
+        self.repo.save_max_flow(MaxFlowRecord(
+            loop_id=loop_id,
+            profit=loop_profit.profit,
+            amount=loop_profit.amount,
+            added=datetime.datetime.now()
+        ))
+
+    def _walk_levels(
+            self,
+            loop_id: int,
+            loop_info: List[LoopInfo],
+            book_orders: List[BookOrderConverted],
+            rates: RateMatrix,
+            profit: Optional[float],
+            amount: Optional[float]
+    ) -> OKXResponse:
+        # Reference implementation re-simulating the loop level by level
+        last_profitable_rate = list()
+        data = list()
+        for order in book_orders:
+            data.append(self._parse_order(order))
             if profit:
                 profitable_loop = self.check_profitability_loop(
                     loop_info=loop_info,
                     start_quantity=float(order.total_amount),
-                    currency_from=order.currency_to
+                    currency_from=order.currency_to,
+                    rates=rates
                 )
                 if profitable_loop.amount > order.total_amount:
                     if profitable_loop.profit > profit:
                         last_profitable_rate.clear()
                         last_profitable_rate.append(profitable_loop)
                     elif profitable_loop.profit == profit:
-                        LoopsRepo().save_loop_info(
-                            loop_id=loop_id,
-                            spread=profitable_loop.profit,
-                            max_flow=profitable_loop.amount,
-                            loop_speed=1.0,
-                            added=datetime.datetime.now()
-                        )
+                        self._save_loop_profit(loop_id, profitable_loop)
                         return OKXResponse(
                             profit=profitable_loop.profit,
                             amount=profitable_loop.amount,
                             data=data
                         )
                     else:
-                        LoopsRepo().save_loop_info(
-                            loop_id=loop_id,
-                            spread=last_profitable_rate[0].profit,
-                            max_flow=last_profitable_rate[0].amount,
-                            loop_speed=1.0,
-                            added=datetime.datetime.now()
-                        )
+                        self._save_loop_profit(loop_id, last_profitable_rate[0])
                         return OKXResponse(
                             profit=last_profitable_rate[0].profit,
                             amount=last_profitable_rate[0].amount,
                             data=data[:-1]
                         )
                 else:
-                    LoopsRepo().save_loop_info(
-                        loop_id=loop_id,
-                        spread=profitable_loop.profit,
-                        max_flow=profitable_loop.amount,
-                        loop_speed=1.0,
-                        added=datetime.datetime.now()
-                    )
+                    self._save_loop_profit(loop_id, profitable_loop)
                     return OKXResponse(
                         profit=profitable_loop.profit,
                         amount=profitable_loop.amount,
@@ -117,45 +362,42 @@ class OKXTradeOnlineParser:
                 profitable_loop = self.check_profitability_loop(
                     loop_info=loop_info,
                     start_quantity=amount,
-                    currency_from=order.currency_to
+                    currency_from=order.currency_to,
+                    rates=rates
                 )
                 last_profitable_rate.clear()
                 last_profitable_rate.append(profitable_loop)
                 if amount < order.total_amount:
-                    LoopsRepo().save_loop_info(
-                        loop_id=loop_id,
-                        spread=last_profitable_rate[0].profit,
-                        max_flow=last_profitable_rate[0].amount,
-                        loop_speed=1.0,
-                        added=datetime.datetime.now()
-                    )
+                    self._save_loop_profit(loop_id, last_profitable_rate[0])
                     return OKXResponse(
                         profit=last_profitable_rate[0].profit,
                         amount=last_profitable_rate[0].amount,
                         data=data
                     )
 
-    @staticmethod
-    def get_loop(loop_id: int) -> List[LoopInfo]:
-        return LoopsRepo().get_loop_by_id(loop_id)
+    def get_loop(self, loop_id: int) -> List[LoopInfo]:
+        return self.repo.get_loop_by_id(loop_id)
 
     def check_profitability_loop(
             self,
             loop_info: List[LoopInfo],
             start_quantity: float,
-            currency_from: str
+            currency_from: str,
+            rates: Optional[RateMatrix] = None
     ) -> LoopProfit:
+        if rates is None:
+            rates = RateMatrix.load(
+                repo=self.repo,
+                pairs=[(loop.currency_from, loop.currency_to) for loop in loop_info],
+                platform=self.get_platform(),
+                method=self.get_method()
+            )
         result_quantity_list = [start_quantity]
         for loop in loop_info:
-            rate = LoopsRepo().get_curses_by_currency_name(
-                currency_from=loop.currency_from,
-                currency_to=loop.currency_to,
-                method_id=self.get_method().method_id,
-                platform_id=self.get_platform().platform_id
-            )
+            rate = rates.get(currency_from=loop.currency_from, currency_to=loop.currency_to)
             if rate:
-                quantity = result_quantity_list[0] * rate['rate']
-                tax = quantity / 100 * rate['tax']
+                quantity = result_quantity_list[0] * rate.rate
+                tax = quantity / 100 * rate.tax
                 quantity_to_change = quantity - tax
                 result_quantity_list.clear()
                 result_quantity_list.append(quantity_to_change)
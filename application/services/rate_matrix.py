@@ -0,0 +1,66 @@
+"""In-memory snapshot of courses used while evaluating one loop"""
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from application import interfaces
+from application.dataclasses.common import (
+    CourseInfo,
+    LoopInfo,
+    MethodInfo,
+    PlatformInfo,
+)
+
+
+class RateMatrix:
+    """Courses for a fixed platform and method, keyed by currency pair"""
+
+    def __init__(self, courses: Iterable[CourseInfo]):
+        self._courses: Dict[Tuple[str, str], CourseInfo] = {}
+        for course in courses:
+            self._courses.setdefault((course.currency_from, course.currency_to), course)
+
+    @classmethod
+    def load(
+            cls,
+            repo: interfaces.LoopsRepo,
+            pairs: Iterable[Tuple[str, str]],
+            platform: PlatformInfo,
+            method: MethodInfo
+    ) -> 'RateMatrix':
+        return cls(
+            repo.get_courses_by_pairs(
+                pairs=sorted(set(pairs)),
+                platform_id=platform.platform_id,
+                method_id=method.method_id
+            )
+        )
+
+    @classmethod
+    def merge(cls, matrices: Iterable['RateMatrix']) -> 'RateMatrix':
+        """Courses of all `matrices`, a pair keeping the course of the first one listing it"""
+        return cls(course for matrix in matrices for course in matrix._courses.values())
+
+    @staticmethod
+    def required_pairs(loop_info: List[LoopInfo], base_coin: str) -> Set[Tuple[str, str]]:
+        # Loop steps plus conversions of both sides of every step to the base coin
+        pairs = set()
+        for loop in loop_info:
+            pairs.add((loop.currency_from, loop.currency_to))
+            for currency in (loop.currency_from, loop.currency_to):
+                if currency != base_coin:
+                    pairs.add((currency, base_coin))
+        return pairs
+
+    def copy(self) -> 'RateMatrix':
+        return RateMatrix(self._courses.values())
+
+    def update(self, course: CourseInfo) -> None:
+        self._courses[(course.currency_from, course.currency_to)] = course
+
+    def get(self, currency_from: str, currency_to: str) -> Optional[CourseInfo]:
+        return self._courses.get((currency_from, currency_to))
+
+    def __contains__(self, pair: Tuple[str, str]) -> bool:
+        return pair in self._courses
+
+    def __len__(self) -> int:
+        return len(self._courses)
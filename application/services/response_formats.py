@@ -0,0 +1,119 @@
+"""Encodings of a loop evaluation for /online-parser-okx"""
+import json
+import struct
+from typing import Iterator, List, Optional
+
+import numpy as np
+
+from application.dataclasses.order_book import LevelLeg, LoopEvaluation
+
+FORMATS = ('json', 'ndjson', 'columnar', 'columnar-binary')
+BINARY_MAGIC = b'OKXC'
+
+
+def summary(evaluation: Optional[LoopEvaluation]) -> dict:
+    return {
+        'profit': evaluation.profit if evaluation else None,
+        'amount': evaluation.amount if evaluation else None,
+        'stale': evaluation.stale if evaluation else False,
+        'skew_ms': evaluation.skew_ms if evaluation else None,
+    }
+
+
+def _leg(leg: LevelLeg, method: str) -> dict:
+    # Every field a BookOrderParsed row shares with the other rows of its leg
+    return {
+        'currency_from': leg.currency_from,
+        'currency_to': leg.currency_to,
+        'rule_id': leg.rule_id,
+        'platform_from': leg.platform_from,
+        'platform_to': leg.platform_to,
+        'tax': leg.tax,
+        'method': method,
+        'rate': leg.rate,
+    }
+
+
+def iter_rows(evaluation: Optional[LoopEvaluation], chunk: int = 256) -> Iterator[dict]:
+    """The `data` rows as plain dicts, built a chunk of levels at a time"""
+    if evaluation is None:
+        return
+    levels = evaluation.levels
+    legs = [_leg(leg, evaluation.method) for leg in levels.legs]
+    for start in range(0, len(levels), chunk):
+        part = levels[start:start + chunk]
+        for leg_index, sum_start, sum_end in zip(
+                part.leg_index.tolist(),
+                part.quantity_for_translation.tolist(),
+                part.quantity_base_currency.tolist()
+        ):
+            row = dict(legs[leg_index])
+            row['sum_start'] = sum_start
+            row['sum_end'] = sum_end
+            yield row
+
+
+def ndjson_lines(evaluation: Optional[LoopEvaluation]) -> Iterator[str]:
+    """Summary line first, then one line per `data` row, each ending with a newline"""
+    yield json.dumps(summary(evaluation)) + '\n'
+    for row in iter_rows(evaluation):
+        yield json.dumps(row) + '\n'
+
+
+def columnar(evaluation: Optional[LoopEvaluation]) -> dict:
+    """
+    `data` as parallel columns: row i belongs to legs[leg_index[i]] and spends
+    sum_start[i] for sum_end[i].
+    """
+    response = summary(evaluation)
+    if evaluation is None:
+        response.update(legs=[], leg_index=[], sum_start=[], sum_end=[])
+        return response
+    levels = evaluation.levels
+    response.update(
+        legs=[_leg(leg, evaluation.method) for leg in levels.legs],
+        leg_index=levels.leg_index.tolist(),
+        sum_start=levels.quantity_for_translation.tolist(),
+        sum_end=levels.quantity_base_currency.tolist()
+    )
+    return response
+
+
+def columnar_binary(evaluation: Optional[LoopEvaluation]) -> bytes:
+    """
+    Columnar format with the columns packed little-endian.
+
+    Layout: b'OKXC', uint32 header length, UTF-8 JSON header with profit,
+    amount, legs and rows, then leg_index as int32 and sum_start and sum_end
+    as float64, `rows` values each.
+    """
+    levels = evaluation.levels if evaluation is not None else None
+    rows = len(levels) if levels is not None else 0
+    header = summary(evaluation)
+    header.update(
+        legs=[_leg(leg, evaluation.method) for leg in levels.legs] if levels is not None else [],
+        rows=rows
+    )
+    encoded = json.dumps(header).encode()
+    parts: List[bytes] = [BINARY_MAGIC, struct.pack('<I', len(encoded)), encoded]
+    if rows:
+        parts.append(levels.leg_index.astype('<i4').tobytes())
+        parts.append(levels.quantity_for_translation.astype('<f8').tobytes())
+        parts.append(levels.quantity_base_currency.astype('<f8').tobytes())
+    return b''.join(parts)
+
+
+def read_columnar_binary(payload: bytes) -> dict:
+    """Decodes columnar_binary back to the columnar dict"""
+    if payload[:4] != BINARY_MAGIC:
+        raise ValueError('Not a columnar OKX payload')
+    size = struct.unpack('<I', payload[4:8])[0]
+    header = json.loads(payload[8:8 + size].decode())
+    rows, offset = header.pop('rows'), 8 + size
+    leg_index = np.frombuffer(payload, dtype='<i4', count=rows, offset=offset)
+    offset += 4 * rows
+    sum_start = np.frombuffer(payload, dtype='<f8', count=rows, offset=offset)
+    offset += 8 * rows
+    sum_end = np.frombuffer(payload, dtype='<f8', count=rows, offset=offset)
+    header.update(leg_index=leg_index.tolist(), sum_start=sum_start.tolist(), sum_end=sum_end.tolist())
+    return header
@@ -0,0 +1,233 @@
+"""Profit against loop size over a grid of amounts, profit thresholds and base coins"""
+import math
+import multiprocessing
+import os
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from adapters.repositories.common import LoopsRepo
+from application import errors, interfaces
+from application.dataclasses.common import LoopSweep, SweepPoint
+from application.services.max_flow import LegBook, bisect_max_flow, loop_profit
+from application.services.okx_parser import OKXExchangeParser
+from connection_config import sweep_params
+
+# Where each leg of each base coin lives in the shared file: offset, levels and tax
+Layout = List[Tuple[str, List[Tuple[int, int, float]]]]
+# amount, output, profit
+RawPoint = Tuple[float, Optional[float], Optional[float]]
+
+# Files there are kept in memory, not written to disk
+SHARED_DIR = '/dev/shm' if os.path.isdir('/dev/shm') else None
+
+# Legs a pool process works on and the file they are mapped from, kept until another sweep comes
+_worker_legs: Tuple[Optional[str], Dict[str, List[LegBook]]] = (None, {})
+
+
+def pack_legs(legs_by_coin: Dict[str, List[LegBook]]) -> Tuple[str, Layout]:
+    """
+    Rates and capacities of every leg in one float64 file in shared memory.
+
+    Pool processes map the file read-only, so books are never pickled per
+    task. The caller removes the file once the sweep is done.
+    """
+    size = sum(2 * len(leg.rates) for legs in legs_by_coin.values() for leg in legs)
+    descriptor, path = tempfile.mkstemp(prefix='loop-sweep-', suffix='.f64', dir=SHARED_DIR)
+    os.close(descriptor)
+    view = np.memmap(path, dtype=float, mode='w+', shape=(max(size, 1),))
+    layout, offset = [], 0
+    for base_coin, legs in legs_by_coin.items():
+        entries = []
+        for leg in legs:
+            levels = len(leg.rates)
+            view[offset:offset + levels] = leg.rates
+            view[offset + levels:offset + 2 * levels] = leg.capacities
+            entries.append((offset, levels, leg.tax))
+            offset += 2 * levels
+        layout.append((base_coin, entries))
+    view.flush()
+    return path, layout
+
+
+def unpack_legs(path: str, layout: Layout) -> Dict[str, List[LegBook]]:
+    view = np.memmap(path, dtype=float, mode='r')
+    return {
+        base_coin: [
+            LegBook(rates=view[offset:offset + levels], capacities=view[offset + levels:offset + 2 * levels], tax=tax)
+            for offset, levels, tax in entries
+        ]
+        for base_coin, entries in layout
+    }
+
+
+def parse_grid(values: Any, name: str) -> List[float]:
+    """Grid sent by a client, empty when missing; ValueError when it is not a list of numbers"""
+    if values is None:
+        return []
+    if not isinstance(values, (list, tuple)):
+        raise ValueError(f'{name} must be a list of numbers')
+    grid = []
+    for value in values:
+        if isinstance(value, bool) or not isinstance(value, (int, float)) or not math.isfinite(value):
+            raise ValueError(f'{name} value {value!r} is not a number')
+        grid.append(float(value))
+    return grid
+
+
+def check_scenarios(
+        base_coins: Sequence[str],
+        amounts: Sequence[float],
+        thresholds: Sequence[float],
+        max_scenarios: int = sweep_params['max_scenarios']
+) -> int:
+    """Number of scenarios of the grid; ValueError when there are more than `max_scenarios`"""
+    scenarios = len(set(base_coins)) * (len(amounts) + len(thresholds))
+    if scenarios > max_scenarios:
+        raise ValueError(f'{scenarios} scenarios requested, at most {max_scenarios} are swept at once')
+    return scenarios
+
+
+def pool_context() -> multiprocessing.context.BaseContext:
+    # Forked processes would inherit the threads, locks and connections of the app
+    methods = multiprocessing.get_all_start_methods()
+    return multiprocessing.get_context('forkserver' if 'forkserver' in methods else 'spawn')
+
+
+def sweep_amounts(legs: List[LegBook], amounts: Sequence[float]) -> List[RawPoint]:
+    """Loop result at every amount, all amounts simulated at once"""
+    inputs = np.asarray(amounts, dtype=float)
+    outputs = inputs
+    for leg in legs:
+        outputs = leg.output(outputs)
+    points = []
+    for amount, output in zip(inputs.tolist(), outputs.tolist()):
+        if math.isnan(output):
+            points.append((amount, None, None))
+        else:
+            points.append((amount, output, loop_profit(amount, output) if amount > 0 else None))
+    return points
+
+
+def sweep_thresholds(legs: List[LegBook], thresholds: Sequence[float]) -> List[RawPoint]:
+    """Largest input meeting each profit threshold"""
+    points = []
+    for threshold in thresholds:
+        flow = bisect_max_flow(legs, threshold)
+        if flow is None:
+            points.append((0.0, None, None))
+        else:
+            points.append((flow.amount, flow.output, flow.profit))
+    return points
+
+
+SOLVERS = {'amounts': sweep_amounts, 'thresholds': sweep_thresholds}
+
+
+def _run_task(task: Tuple[str, Layout, str, str, List[float]]) -> List[RawPoint]:
+    global _worker_legs
+    path, layout, kind, base_coin, values = task
+    if _worker_legs[0] != path:
+        _worker_legs = (path, unpack_legs(path, layout))
+    return SOLVERS[kind](_worker_legs[1][base_coin], values)
+
+
+def _chunks(values: Sequence[float], size: int) -> Iterable[List[float]]:
+    for start in range(0, len(values), size):
+        yield list(values[start:start + size])
+
+
+class LoopSweeper:
+    """
+    Profit-versus-size curve of a loop for many scenarios.
+
+    Books are fetched once and turned into LegBook legs per base coin; each
+    grid amount is simulated through the books with slippage and taxes, and
+    each profit threshold (in percent of the input) gets the largest input
+    meeting it. Large grids are split into chunks run by a process pool whose
+    processes map the legs from shared memory; grids smaller than
+    `min_parallel` scenarios run in the calling process. The pool is created
+    with the sweeper and serves every sweep until `close`.
+    """
+
+    def __init__(
+            self,
+            repo: Optional[interfaces.LoopsRepo] = None,
+            exchange_parser: Optional[OKXExchangeParser] = None,
+            processes: Optional[int] = sweep_params['processes'],
+            chunk_size: int = sweep_params['chunk_size'],
+            min_parallel: int = sweep_params['min_parallel']
+    ):
+        self.repo = repo or LoopsRepo()
+        self.exchange_parser = exchange_parser or OKXExchangeParser(repo=self.repo)
+        self.processes = processes or os.cpu_count() or 1
+        self.chunk_size = chunk_size
+        self.min_parallel = min_parallel
+        self._pool = self._new_pool()
+
+    def _new_pool(self) -> Optional[ProcessPoolExecutor]:
+        return ProcessPoolExecutor(max_workers=self.processes, mp_context=pool_context()) if self.processes > 1 else None
+
+    def close(self) -> None:
+        if self._pool is not None:
+            self._pool.shutdown()
+
+    def sweep(
+            self,
+            loop_id: int,
+            base_coins: Sequence[str],
+            amounts: Sequence[float] = (),
+            thresholds: Sequence[float] = ()
+    ) -> LoopSweep:
+        loop_info = self.repo.get_loop_by_id(loop_id)
+        if not loop_info:
+            raise errors.GetLoopError(loop_id=f'{loop_id}')
+        books = self.exchange_parser.fetch_books(list(loop_info))
+        legs: Dict[str, List[LegBook]] = {}
+        failed: Dict[str, str] = {}
+        for base_coin in dict.fromkeys(base_coins):
+            try:
+                # Steps are reordered in place per base coin
+                legs[base_coin] = self.exchange_parser.get_leg_books(list(loop_info), base_coin, books)
+            except errors.AppError as error:
+                failed[base_coin] = str(error)
+        results = self.run(legs, amounts, thresholds)
+        points = [
+            SweepPoint(base_coin=base_coin, amount=amount, output=output, profit=profit, threshold=threshold)
+            for base_coin, threshold, (amount, output, profit) in results
+        ]
+        return LoopSweep(loop_id=loop_id, points=points, errors=failed)
+
+    def run(
+            self,
+            legs: Dict[str, List[LegBook]],
+            amounts: Sequence[float],
+            thresholds: Sequence[float]
+    ) -> List[Tuple[str, Optional[float], RawPoint]]:
+        """Every scenario as (base coin, threshold or None, point), in grid order"""
+        tasks = []
+        for base_coin in legs:
+            tasks.extend(('amounts', base_coin, chunk) for chunk in _chunks(amounts, self.chunk_size))
+            tasks.extend(('thresholds', base_coin, chunk) for chunk in _chunks(thresholds, self.chunk_size))
+        scenarios = len(legs) * (len(amounts) + len(thresholds))
+        if self._pool is not None and scenarios >= self.min_parallel and len(tasks) > 1:
+            path, layout = pack_legs(legs)
+            try:
+                outputs = list(self._pool.map(_run_task, [(path, layout) + task for task in tasks]))
+            except BrokenProcessPool:
+                # A process died; later sweeps get a new pool
+                self._pool = self._new_pool()
+                raise
+            finally:
+                os.remove(path)
+        else:
+            outputs = [SOLVERS[kind](legs[base_coin], values) for kind, base_coin, values in tasks]
+
+        results = []
+        for (kind, base_coin, values), points in zip(tasks, outputs):
+            for value, point in zip(values, points):
+                results.append((base_coin, value if kind == 'thresholds' else None, point))
+        return results
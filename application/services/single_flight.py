@@ -0,0 +1,96 @@
+"""Coalescing of identical concurrent calls into one upstream call"""
+import threading
+import time
+from typing import Any, Callable, Dict, Hashable, Optional
+
+from application.dataclasses.common import CoalesceStats
+from application.services.ttl_cache import TTLCache
+
+_MISSING = object()
+
+
+class _Call:
+    __slots__ = ('done', 'value', 'error')
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.value: Any = None
+        self.error: Optional[BaseException] = None
+
+
+class SingleFlight:
+    """
+    Runs at most one call per key at a time.
+
+    Callers arriving while a call for their key is in flight wait for it and
+    get its result, or its exception raised again. With `ttl` a successful
+    result also answers calls made up to `ttl` seconds after it finished;
+    errors are never kept.
+    """
+
+    def __init__(
+            self,
+            ttl: float = 0.0,
+            maxsize: Optional[int] = None,
+            clock: Callable[[], float] = time.monotonic
+    ):
+        self.ttl = ttl
+        self._results = TTLCache(maxsize=maxsize, clock=clock)
+        self._calls: Dict[Hashable, _Call] = {}
+        self._lock = threading.Lock()
+        self._requests = 0
+        self._upstream = 0
+        self._coalesced = 0
+        self._cached = 0
+        self._errors = 0
+
+    def do(self, key: Hashable, function: Callable[[], Any]) -> Any:
+        with self._lock:
+            self._requests += 1
+            if self.ttl:
+                value = self._results.get(key, _MISSING)
+                if value is not _MISSING:
+                    self._cached += 1
+                    return value
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+                self._upstream += 1
+            else:
+                self._coalesced += 1
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.value
+
+        try:
+            call.value = function()
+        except BaseException as error:
+            call.error = error
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+                if call.error is None and self.ttl:
+                    self._results.set(key, call.value, self.ttl)
+                elif call.error is not None:
+                    self._errors += 1
+            call.done.set()
+        return call.value
+
+    def forget(self, key: Optional[Hashable] = None) -> None:
+        self._results.invalidate(key)
+
+    def stats(self) -> CoalesceStats:
+        with self._lock:
+            return CoalesceStats(
+                requests=self._requests,
+                upstream=self._upstream,
+                coalesced=self._coalesced,
+                cached=self._cached,
+                errors=self._errors,
+                in_flight=len(self._calls)
+            )
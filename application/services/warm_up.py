@@ -0,0 +1,132 @@
+"""Startup phase filling caches and opening connections before the app reports ready"""
+import logging
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, List, Optional, Tuple
+
+from adapters.repositories.pooled import PooledLoopsRepo
+from application import errors, interfaces
+from application.dataclasses.common import LoopInfo, MethodInfo, PlatformInfo, WarmUpStats
+from application.services.okx_parser import OKXExchangeParser
+from application.services.okx_services import OKXTradeOnlineParser
+from connection_config import warmup_params
+
+logger = logging.getLogger(__name__)
+
+
+class WarmUp:
+    """
+    Runs the first requests' slow work ahead of them.
+
+    Steps, in order: open and check database connections with the hot
+    statements prepared on them (when given the PooledLoopsRepo), load the
+    OKX platform and Trade method and the active loop paths through `repo`
+    so its caches are filled, fetch the books of the `top_instruments` loop
+    steps used by most loops, which also opens the OKX connections, and
+    evaluate one loop to load the rest of the code path. `ready` is set once
+    every step ran and the required ones succeeded.
+    """
+    REQUIRED = ('database', 'metadata')
+
+    def __init__(
+            self,
+            repo: interfaces.LoopsRepo,
+            exchange_parser: Optional[OKXExchangeParser] = None,
+            pool: Optional[PooledLoopsRepo] = None,
+            connections: Optional[int] = warmup_params['connections'],
+            max_loops: int = warmup_params['max_loops'],
+            top_instruments: int = warmup_params['top_instruments'],
+            workers: int = warmup_params['workers'],
+            evaluate: bool = warmup_params['evaluate']
+    ):
+        self.repo = repo
+        self.exchange_parser = exchange_parser
+        self.pool = pool
+        self.connections = connections
+        self.max_loops = max_loops
+        self.top_instruments = top_instruments
+        self.workers = workers
+        self.evaluate = evaluate
+        self.ready = threading.Event()
+        self._stats = WarmUpStats(ready=False)
+        self._thread: Optional[threading.Thread] = None
+
+    def stats(self) -> WarmUpStats:
+        return self._stats
+
+    def run(self) -> WarmUpStats:
+        started = time.monotonic()
+        self._step('database', self._open_database)
+        metadata = self._step('metadata', self._load_metadata)
+        if metadata is not None:
+            loops = self._step('loops', lambda: self._load_loops(*metadata)) or []
+            if self.exchange_parser is not None:
+                self._step('books', lambda: self._fetch_books(loops))
+                if self.evaluate and loops:
+                    self._step('evaluate', lambda: self._evaluate(loops))
+        if not any(step in self._stats.errors for step in self.REQUIRED):
+            self._stats.time_to_ready = time.monotonic() - started
+            self._stats.ready = True
+            self.ready.set()
+            logger.info('Warm-up finished in %.3f s', self._stats.time_to_ready)
+        return self._stats
+
+    def _step(self, name: str, step: Callable[[], Any]) -> Any:
+        started = time.monotonic()
+        try:
+            return step()
+        except Exception as error:
+            logger.warning('Warm-up step %s failed: %s', name, error)
+            self._stats.errors[name] = str(error) or type(error).__name__
+            return None
+        finally:
+            self._stats.steps[name] = time.monotonic() - started
+
+    def _open_database(self) -> None:
+        if self.pool is not None:
+            self._stats.connections = self.pool.warm_up(self.connections)
+
+    def _load_metadata(self) -> Tuple[PlatformInfo, MethodInfo]:
+        platform = self.repo.get_platform_info(OKXTradeOnlineParser.PLATFORM_NAME)
+        if not platform:
+            raise errors.GerPlatformError(platform=OKXTradeOnlineParser.PLATFORM_NAME)
+        method = self.repo.get_method_info(OKXTradeOnlineParser.METHOD_NAME)
+        if not method:
+            raise errors.GerMethodError(method=OKXTradeOnlineParser.METHOD_NAME)
+        return platform, method
+
+    def _load_loops(self, platform: PlatformInfo, method: MethodInfo) -> List[Tuple[int, List[LoopInfo]]]:
+        loop_ids = self.repo.get_active_loop_ids(platform.platform_id, method.method_id)[:self.max_loops]
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='warm-up') as executor:
+            loops = [
+                (loop_id, loop_info)
+                for loop_id, loop_info in zip(loop_ids, executor.map(self.repo.get_loop_by_id, loop_ids))
+                if loop_info
+            ]
+        self._stats.loops = len(loops)
+        return loops
+
+    def _fetch_books(self, loops: List[Tuple[int, List[LoopInfo]]]) -> None:
+        # Until the listed direction of a pair is known, both are asked for
+        steps = Counter(loop.get_currencies_pairs for _, loop_info in loops for loop in loop_info)
+        legs = {loop.get_currencies_pairs: loop for _, loop_info in loops for loop in loop_info}
+        inst_ids = [
+            inst_id
+            for pair, _ in steps.most_common(self.top_instruments)
+            for inst_id in self.exchange_parser.request_instruments(legs[pair])
+        ]
+        books = self.exchange_parser.get_books(inst_ids, strict=False)
+        self._stats.books = sum(1 for book in books.values() if book)
+
+    def _evaluate(self, loops: List[Tuple[int, List[LoopInfo]]]) -> None:
+        loop_id, loop_info = loops[0]
+        OKXTradeOnlineParser(
+            repo=self.repo, exchange_parser=self.exchange_parser, save_results=False
+        ).evaluate(loop_id=loop_id, currency_name=loop_info[0].currency_from, profit=None, amount=1.0)
+
+    def start(self) -> 'WarmUp':
+        self._thread = threading.Thread(target=self.run, name='warm-up', daemon=True)
+        self._thread.start()
+        return self
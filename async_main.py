@@ -0,0 +1,106 @@
+import dataclasses
+import json
+from functools import partial
+
+from aiohttp import web
+
+from adapters.repositories.async_pooled import AsyncPooledLoopsRepo
+from application import errors, interfaces
+from application.services import response_formats
+from application.services.deadline import Deadline, parse_budget
+from application.services.okx_async import AsyncOKXExchangeParser, AsyncOKXTradeOnlineParser
+from connection_config import async_params
+
+routes = web.RouteTableDef()
+
+
+def _default(value):
+    if dataclasses.is_dataclass(value):
+        return dataclasses.asdict(value)
+    raise TypeError(f'{type(value).__name__} is not JSON serializable')
+
+
+json_response = partial(web.json_response, dumps=partial(json.dumps, default=_default))
+
+
+async def check_key_status(repo: interfaces.AsyncLoopsRepo, headers: dict) -> bool:
+    key = headers.get('key')
+    return await repo.check_status(key) if key else False
+
+
+async def evaluation_response(
+        request: web.Request,
+        result,
+        response_format: str,
+        summary_only: bool
+) -> web.StreamResponse:
+    if summary_only:
+        return json_response(response_formats.summary(result))
+    if response_format == 'ndjson':
+        # Rows are encoded while they are sent
+        response = web.StreamResponse(headers={'Content-Type': 'application/x-ndjson'})
+        await response.prepare(request)
+        for line in response_formats.ndjson_lines(result):
+            await response.write(line.encode())
+        await response.write_eof()
+        return response
+    if response_format == 'columnar':
+        return json_response(response_formats.columnar(result))
+    if response_format == 'columnar-binary':
+        return web.Response(body=response_formats.columnar_binary(result), content_type='application/octet-stream')
+    response = response_formats.summary(result)
+    response['data'] = result.data if result else []
+    return json_response(response)
+
+
+@routes.get('/online-parser-okx')
+async def parser(request: web.Request) -> web.StreamResponse:
+    headers = await request.json()
+    repo = request.app['loops_repo']
+    if not await check_key_status(repo, headers):
+        return json_response({'status': 300, 'ok': False, 'message': 'wrong private key'})
+    loop_id = headers.get('loop_id')
+    response_format = headers.get('format', 'json')
+    if response_format not in response_formats.FORMATS:
+        return json_response({'status': 400, 'ok': False, 'message': f'unknown format {response_format}'})
+    try:
+        budget = parse_budget(headers.get('budget'))
+    except ValueError as error:
+        return json_response({'status': 400, 'ok': False, 'message': str(error)})
+
+    if loop_id:
+        result = await AsyncOKXTradeOnlineParser(
+            repo=repo, exchange_parser=request.app['exchange_parser']
+        ).evaluate(
+            loop_id=loop_id,
+            currency_name=headers.get('currency_name'),
+            profit=headers.get('profit'),
+            amount=headers.get('amount'),
+            deadline=Deadline(budget)
+        )
+        return await evaluation_response(request, result, response_format, headers.get('summary_only'))
+    else:
+        raise errors.GetLoopError(loop_id=f'{loop_id}')
+
+
+async def _close(app: web.Application) -> None:
+    await app['exchange_parser'].close()
+    close = getattr(app['loops_repo'], 'close', None)
+    if close is not None:
+        await close()
+
+
+def create_app(
+        loops_repo: interfaces.AsyncLoopsRepo = None,
+        exchange_parser: AsyncOKXExchangeParser = None
+) -> web.Application:
+    app = web.Application()
+    app['loops_repo'] = loops_repo or AsyncPooledLoopsRepo()
+    app['exchange_parser'] = exchange_parser or AsyncOKXExchangeParser()
+    app.add_routes(routes)
+    app.on_cleanup.append(_close)
+    return app
+
+
+if __name__ == "__main__":
+    web.run_app(create_app(), host=async_params['host'], port=async_params['port'])
@@ -0,0 +1,78 @@
+"""Loop discovery time on a synthetic course graph"""
+import argparse
+import itertools
+import math
+import random
+import time
+from typing import List
+
+from application.dataclasses.common import CourseEdge
+from application.services.arbitrage_discovery import CurrencyGraph, find_cycles
+
+
+def synthetic_edges(rnd: random.Random, currencies: int, edges: int, platforms: int) -> List[CourseEdge]:
+    names = [f'C{i}' for i in range(currencies)]
+    prices = {name: math.exp(rnd.uniform(-8, 8)) for name in names}
+    result = []
+    for rule_id in range(edges):
+        currency_from, currency_to = rnd.sample(names, 2)
+        platform = f'P{rnd.randrange(platforms)}'
+        # Fair cross rate with noise, a few of the resulting loops beat the taxes
+        rate = prices[currency_from] / prices[currency_to] * rnd.uniform(0.995, 1.003)
+        result.append(CourseEdge(
+            method='Trade',
+            platform_from=platform,
+            platform_to=platform,
+            currency_from=currency_from,
+            currency_to=currency_to,
+            rule_id=rule_id,
+            rate=rate,
+            tax=0.1
+        ))
+    return result
+
+
+def check(edges: List[CourseEdge], candidate) -> None:
+    # Loop profit recomputed step by step from the course rates
+    rates = {(edge.currency_from, edge.currency_to, edge.rule_id): edge for edge in edges}
+    quantity = 1.0
+    for step in candidate.steps:
+        edge = rates[(step.currency_from, step.currency_to, step.rule_id)]
+        quantity *= edge.rate * (1 - edge.tax / 100)
+    assert abs((quantity - 1) * 100 - candidate.profit) < 1e-6, candidate
+    assert candidate.steps[0].currency_from == candidate.steps[-1].currency_to == candidate.base_coin
+    for step, next_step in zip(candidate.steps, candidate.steps[1:]):
+        assert step.currency_to == next_step.currency_from
+    assert len({(step.platform_from, step.platform_to, step.method) for step in candidate.steps}) == 1
+
+
+def main() -> None:
+    arg_parser = argparse.ArgumentParser(description=__doc__)
+    arg_parser.add_argument('--currencies', type=int, default=300)
+    arg_parser.add_argument('--edges', type=int, default=30000)
+    arg_parser.add_argument('--platforms', type=int, default=3)
+    arg_parser.add_argument('--max-length', type=int, default=4)
+    arg_parser.add_argument('--seed', type=int, default=0)
+    args = arg_parser.parse_args()
+
+    edges = synthetic_edges(random.Random(args.seed), args.currencies, args.edges, args.platforms)
+    started = time.perf_counter()
+    graphs = CurrencyGraph.markets(edges)
+    built = time.perf_counter()
+    candidates = sorted(
+        (candidate for graph in graphs.values() for candidate in find_cycles(graph, max_length=args.max_length)),
+        key=lambda candidate: -candidate.profit
+    )
+    searched = time.perf_counter()
+    for candidate in itertools.islice(candidates, 1000):
+        check(edges, candidate)
+
+    kept = sum(len(graph) for graph in graphs.values())
+    currencies = len({currency for graph in graphs.values() for currency in graph.currencies})
+    print(f'{len(edges)} edges, {len(graphs)} markets, {kept} kept, {currencies} currencies')
+    print(f'graph: {(built - started) * 1000:.1f} ms, search: {(searched - built) * 1000:.1f} ms')
+    print(f'{len(candidates)} profitable loops, best {candidates[0].profit if candidates else 0:.4f} %')
+
+
+if __name__ == '__main__':
+    main()
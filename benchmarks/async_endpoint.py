@@ -0,0 +1,200 @@
+"""
+Sustained concurrent requests per worker: the Flask endpoint against the aiohttp one.
+
+Each worker runs in its own process, in front of an InMemoryLoopsRepo that
+sleeps `--db-latency` per query and the local OKX stand-in that sleeps
+`--okx-latency` per book. The sync worker serves `--threads` requests at a
+time like a threaded WSGI worker; the async worker serves every request on
+one event loop. A load generator keeps `concurrency` requests in flight and
+reports requests per second and p50/p99 latency.
+"""
+import argparse
+import asyncio
+import multiprocessing
+import socket
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterator, List
+
+import aiohttp
+import numpy as np
+from werkzeug.serving import BaseWSGIServer, WSGIRequestHandler
+
+from benchmarks.end_to_end import API_KEY, BASE_COIN, Seed
+from benchmarks.okx_stand_in import OKXStandIn
+
+WORKERS = ('sync', 'async')
+
+
+class QuietRequestHandler(WSGIRequestHandler):
+
+    def log_request(self, *args, **kwargs) -> None:
+        pass
+
+
+class PooledWSGIServer(BaseWSGIServer):
+    """WSGI server handing connections to a fixed pool of threads"""
+
+    def __init__(self, host: str, port: int, app, threads: int):
+        super().__init__(host, port, app, handler=QuietRequestHandler)
+        self.pool = ThreadPoolExecutor(max_workers=threads)
+
+    def process_request(self, request, client_address):
+        self.pool.submit(self._process, request, client_address)
+
+    def _process(self, request, client_address) -> None:
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def _seed(args: dict) -> Seed:
+    return Seed(length=args['length'], loops=args['loops'], reversed_share=0.5)
+
+
+def serve_sync(port: int, base_url: str, args: dict) -> None:
+    import main
+    from adapters.repositories.memory import InMemoryLoopsRepo
+    from application.services.okx_parser import OKXExchangeParser, okx_session
+    from application.services.okx_scheduler import OKXRequestScheduler
+
+    seed = _seed(args)
+    main.loops_repo = InMemoryLoopsRepo(
+        loops=seed.loops, courses=seed.courses, keys={API_KEY: 2}, latency=args['db_latency']
+    )
+    main.exchange_parser = OKXExchangeParser(
+        repo=main.loops_repo,
+        base_url=base_url,
+        scheduler=OKXRequestScheduler(okx_session, limits={})
+    )
+    PooledWSGIServer('127.0.0.1', port, main.app, threads=args['threads']).serve_forever()
+
+
+def serve_async(port: int, base_url: str, args: dict) -> None:
+    from aiohttp import web
+
+    import async_main
+    from adapters.repositories.memory import AsyncInMemoryLoopsRepo, InMemoryLoopsRepo
+    from application.services.okx_async import AsyncOKXExchangeParser, AsyncOKXRequestScheduler
+
+    seed = _seed(args)
+    app = async_main.create_app(
+        loops_repo=AsyncInMemoryLoopsRepo(
+            InMemoryLoopsRepo(loops=seed.loops, courses=seed.courses, keys={API_KEY: 2}),
+            latency=args['db_latency']
+        ),
+        exchange_parser=AsyncOKXExchangeParser(base_url=base_url, scheduler=AsyncOKXRequestScheduler(limits={}))
+    )
+    web.run_app(app, host='127.0.0.1', port=port, print=None, access_log=None)
+
+
+async def _wait_ready(url: str, timeout: float = 30.0) -> None:
+    deadline = time.monotonic() + timeout
+    async with aiohttp.ClientSession() as session:
+        while True:
+            try:
+                async with session.get(url, json={}) as response:
+                    await response.read()
+                    return
+            except aiohttp.ClientError:
+                if time.monotonic() > deadline:
+                    raise
+                await asyncio.sleep(0.1)
+
+
+async def load(url: str, loop_ids: List[int], concurrency: int, requests: int, mode: str) -> Dict[str, float]:
+    profit, amount = (1e-9, None) if mode == 'profit' else (None, 50.0)
+    latencies: List[float] = []
+    failures = 0
+
+    async def client(session: aiohttp.ClientSession, numbers: Iterator[int]) -> None:
+        nonlocal failures
+        for number in numbers:
+            started = time.perf_counter()
+            async with session.get(url, json={
+                'key': API_KEY,
+                'loop_id': loop_ids[number % len(loop_ids)],
+                'currency_name': BASE_COIN,
+                'profit': profit,
+                'amount': amount
+            }) as response:
+                await response.read()
+                if response.status != 200:
+                    failures += 1
+            latencies.append(time.perf_counter() - started)
+
+    async def run(session: aiohttp.ClientSession, count: int) -> float:
+        # Clients share one iterator, so `concurrency` requests stay in flight until `count` are sent
+        numbers = iter(range(count))
+        started = time.perf_counter()
+        await asyncio.gather(*(client(session, numbers) for _ in range(concurrency)))
+        return time.perf_counter() - started
+
+    async with aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=concurrency)) as session:
+        # Warm up connections and imports
+        await run(session, concurrency)
+        latencies.clear()
+        failures = 0
+        elapsed = await run(session, requests)
+    return {
+        'rps': requests / elapsed,
+        'p50_ms': float(np.percentile(latencies, 50)) * 1000,
+        'p99_ms': float(np.percentile(latencies, 99)) * 1000,
+        'failures': failures,
+    }
+
+
+def main() -> None:
+    arg_parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    arg_parser.add_argument('--workers', nargs='+', default=list(WORKERS), choices=WORKERS)
+    arg_parser.add_argument('--concurrency', nargs='+', type=int, default=[1, 16, 64])
+    arg_parser.add_argument('--requests', type=int, default=300)
+    arg_parser.add_argument('--threads', type=int, default=4, help='request threads of the sync worker')
+    arg_parser.add_argument('--db-latency', type=float, default=0.002, help='seconds per repository call')
+    arg_parser.add_argument('--okx-latency', type=float, default=0.02, help='seconds per OKX book')
+    arg_parser.add_argument('--length', type=int, default=3)
+    arg_parser.add_argument('--depth', type=int, default=20)
+    arg_parser.add_argument('--loops', type=int, default=20)
+    arg_parser.add_argument('--mode', default='amount', choices=('profit', 'amount'))
+    args = arg_parser.parse_args()
+    worker_args = {
+        'length': args.length,
+        'loops': args.loops,
+        'threads': args.threads,
+        'db_latency': args.db_latency,
+    }
+    seed = _seed(worker_args)
+    targets = {'sync': serve_sync, 'async': serve_async}
+    context = multiprocessing.get_context('spawn')
+
+    print(f'{"worker":<8} {"conc":>5} {"req/s":>8} {"p50 ms":>8} {"p99 ms":>8} {"failed":>7}')
+    with OKXStandIn(prices=seed.prices, depth=args.depth, latency=args.okx_latency) as stand_in:
+        for worker in args.workers:
+            port = _free_port()
+            process = context.Process(target=targets[worker], args=(port, stand_in.base_url, worker_args), daemon=True)
+            process.start()
+            url = f'http://127.0.0.1:{port}/online-parser-okx'
+            try:
+                asyncio.run(_wait_ready(url))
+                for concurrency in args.concurrency:
+                    result = asyncio.run(load(url, sorted(seed.loops), concurrency, args.requests, args.mode))
+                    print(
+                        f'{worker:<8} {concurrency:>5} {result["rps"]:>8.1f} {result["p50_ms"]:>8.2f} '
+                        f'{result["p99_ms"]:>8.2f} {result["failures"]:>7}'
+                    )
+            finally:
+                process.terminate()
+                process.join()
+
+
+if __name__ == '__main__':
+    main()
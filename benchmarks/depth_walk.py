@@ -0,0 +1,110 @@
+"""Compares the numpy depth walk with the level-by-level walk on synthetic books"""
+import argparse
+import random
+import time
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+from application.dataclasses import LoopInfo
+from application.dataclasses.common import BookOrderConverted, CourseInfo
+from application.services.depth_walk import depth_walk, loop_output
+from application.services.okx_services import OKXTradeOnlineParser
+from application.services.rate_matrix import RateMatrix
+
+STEPS = [('USDT', 'BTC', 1 / 30000), ('BTC', 'ETH', 15.0), ('ETH', 'USDT', 2000.0)]
+
+
+def synthetic_loop(rnd: random.Random) -> Tuple[List[LoopInfo], RateMatrix]:
+    edge = rnd.choice([0.95, 1.0, 1.0005, 1.002, 1.01])
+    loop_info, courses = [], []
+    for rule_id, (currency_from, currency_to, rate) in enumerate(STEPS):
+        loop_info.append(LoopInfo(
+            method='Trade', platform_from='OKX', platform_to='OKX',
+            currency_from=currency_from, currency_to=currency_to, rule_id=rule_id, tax=0.1
+        ))
+        courses.append(CourseInfo(
+            currency_from=currency_from, currency_to=currency_to,
+            rate=rate * edge if currency_to == 'USDT' else rate,
+            tax=rnd.choice([0.0, 0.1])
+        ))
+    return loop_info, RateMatrix(courses)
+
+
+def synthetic_book(rnd: random.Random, levels: int) -> List[BookOrderConverted]:
+    orders, total_amount = [], 0
+    for _ in range(levels):
+        quantity = rnd.uniform(1, 100)
+        total_amount += quantity
+        orders.append(BookOrderConverted(
+            currency_from='BTC', currency_to='USDT', rate=1,
+            quantity_for_translation=quantity, quantity_base_currency=quantity,
+            total_amount=total_amount, rule_id=0, platform_from='OKX', platform_to='Trade', tax=0
+        ))
+    return orders
+
+
+class _NoSaveParser(OKXTradeOnlineParser):
+    def __init__(self):
+        super().__init__(repo=object(), exchange_parser=object())
+
+    def _save_loop_profit(self, loop_id, loop_profit) -> None:
+        pass
+
+
+def python_walk(parser, loop_info, orders, rates, profit, amount) -> Optional[tuple]:
+    try:
+        response = parser._walk_levels(0, loop_info, orders, rates, profit, amount)
+    except IndexError:
+        # The reference walk fails when the first level is already below the threshold
+        return None, None, 0
+    return response and (response.profit, response.amount, len(response.data))
+
+
+def numpy_walk(loop_info, orders, rates, profit, amount) -> Optional[tuple]:
+    total_amounts = np.fromiter((order.total_amount for order in orders), dtype=float, count=len(orders))
+    result = depth_walk(total_amounts, loop_info, rates, 'USDT', profit, amount)
+    if result is None:
+        return None
+    if result.loop_profit is None:
+        return None, None, 0
+    return result.loop_profit.profit, result.loop_profit.amount, result.data_end
+
+
+def main() -> None:
+    arg_parser = argparse.ArgumentParser(description=__doc__)
+    arg_parser.add_argument('--cases', type=int, default=500)
+    arg_parser.add_argument('--levels', type=int, default=400)
+    arg_parser.add_argument('--seed', type=int, default=0)
+    args = arg_parser.parse_args()
+
+    rnd = random.Random(args.seed)
+    parser = _NoSaveParser()
+    python_time = numpy_time = 0.0
+    for case in range(args.cases):
+        loop_info, rates = synthetic_loop(rnd)
+        orders = synthetic_book(rnd, rnd.randint(0, args.levels))
+        # A threshold equal to some level's profit exercises the exact-match branch
+        exact = [
+            float((loop_output(loop_info, rates, np.array([order.total_amount]), 'USDT')[0]
+                   - order.total_amount) / 100)
+            for order in orders[3:4]
+        ]
+        profit = rnd.choice([None, 0.01, 0.1, 1.0] + exact)
+        amount = rnd.choice([None, 50.0, 500.0, 5000.0])
+
+        started = time.perf_counter()
+        expected = python_walk(parser, loop_info, orders, rates, profit, amount)
+        python_time += time.perf_counter() - started
+        started = time.perf_counter()
+        actual = numpy_walk(loop_info, orders, rates, profit, amount)
+        numpy_time += time.perf_counter() - started
+        assert expected == actual, f'case {case}: python {expected} != numpy {actual}'
+
+    print(f'{args.cases} cases equivalent')
+    print(f'python walk: {python_time / args.cases * 1000:.3f} ms per case')
+    print(f'numpy walk:  {numpy_time / args.cases * 1000:.3f} ms per case')
+
+
+if __name__ == '__main__':
+    main()
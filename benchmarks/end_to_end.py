@@ -0,0 +1,274 @@
+"""
+End-to-end latency and throughput of the OKX loop evaluation without live OKX or Postgres.
+
+Loops and courses are seeded into an InMemoryLoopsRepo and books are served by
+the local OKX stand-in. Every scenario reports p50/p99 latency, requests per
+second, repository and HTTP calls per request and the peak memory allocated by
+one request. `--save` writes the results as a baseline and `--baseline`
+compares a run against one, exiting with 1 on a regression.
+"""
+import argparse
+import itertools
+import json
+import os
+import random
+import sys
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Tuple
+
+import numpy as np
+
+from adapters.repositories.memory import InMemoryLoopsRepo
+from application.dataclasses import LoopInfo
+from application.dataclasses.common import CourseEdge
+from application.services.okx_parser import OKXExchangeParser, okx_session
+from application.services.okx_scheduler import OKXRequestScheduler
+from application.services.okx_services import OKXTradeOnlineParser
+from application.services.single_flight import SingleFlight
+from benchmarks.okx_stand_in import OKXStandIn
+
+BASE_COIN = 'USDT'
+API_KEY = 'benchmark'
+DEFAULT_BASELINE = os.path.join(os.path.dirname(__file__), 'baselines', 'end_to_end.json')
+# Courses are this much better than the books so loops are profitable in profit mode
+COURSE_EDGE = 1.003
+
+
+class Seed:
+    """Loops of one length over a pool of currencies, with matching courses and instruments"""
+
+    def __init__(self, length: int, loops: int, reversed_share: float, seed: int = 0):
+        rnd = random.Random(seed)
+        currencies = [f'C{i:03d}' for i in range(max(length * 2, 8))]
+        self.values = {BASE_COIN: 1.0}
+        self.values.update({currency: rnd.uniform(0.01, 1000.0) for currency in currencies})
+        self.loops: Dict[int, List[LoopInfo]] = {}
+        self.prices: Dict[str, float] = {}
+        courses = {}
+        for loop_id in range(1, loops + 1):
+            path = [BASE_COIN] + rnd.sample(currencies, length - 1) + [BASE_COIN]
+            steps = list(zip(path, path[1:]))
+            self.loops[loop_id] = [
+                LoopInfo(
+                    method='Trade',
+                    platform_from='OKX',
+                    platform_to='OKX',
+                    currency_from=currency_from,
+                    currency_to=currency_to,
+                    rule_id=rule_id,
+                    tax=0.1
+                )
+                for rule_id, (currency_from, currency_to) in enumerate(steps)
+            ]
+            for currency_from, currency_to in steps:
+                # Only one direction of each pair is listed, like on OKX
+                if (f'{currency_to}-{currency_from}' not in self.prices
+                        and f'{currency_from}-{currency_to}' not in self.prices):
+                    if rnd.random() < reversed_share:
+                        self.prices[f'{currency_to}-{currency_from}'] = self.values[currency_to] / self.values[currency_from]
+                    else:
+                        self.prices[f'{currency_from}-{currency_to}'] = self.values[currency_from] / self.values[currency_to]
+            for currency_from, currency_to in set(steps) | {(currency, BASE_COIN) for currency in path}:
+                if currency_from != currency_to:
+                    courses[(currency_from, currency_to)] = self._course(currency_from, currency_to)
+        self.courses = list(courses.values())
+
+    def _course(self, currency_from: str, currency_to: str) -> CourseEdge:
+        return CourseEdge(
+            method='Trade',
+            platform_from='OKX',
+            platform_to='OKX',
+            currency_from=currency_from,
+            currency_to=currency_to,
+            rule_id=0,
+            tax=0.1,
+            rate=self.values[currency_from] / self.values[currency_to] * COURSE_EDGE
+        )
+
+    def repo(self) -> InMemoryLoopsRepo:
+        return InMemoryLoopsRepo(loops=self.loops, courses=self.courses, keys={API_KEY: 2})
+
+
+def scenario_call(
+        target: str,
+        repo: InMemoryLoopsRepo,
+        exchange_parser: OKXExchangeParser,
+        profit: float,
+        amount: float
+) -> Callable[[int], object]:
+    loop_parser = OKXTradeOnlineParser(repo=repo, exchange_parser=exchange_parser)
+    if target == 'orders_book':
+        platform = loop_parser.get_platform()
+        method = loop_parser.get_method()
+        return lambda loop_id: exchange_parser.get_orders_book(
+            loop_info=repo.get_loop_by_id(loop_id),
+            base_coin=BASE_COIN,
+            platform=platform,
+            method=method
+        )
+    if target == 'main':
+        return lambda loop_id: loop_parser.main(
+            loop_id=loop_id, currency_name=BASE_COIN, profit=profit, amount=amount
+        )
+    if target == 'endpoint':
+        import main
+        # The endpoint reads these module globals on every request
+        main.loops_repo = repo
+        main.exchange_parser = exchange_parser
+        client = main.app.test_client()
+
+        def call(loop_id: int) -> object:
+            response = client.get('/online-parser-okx', json={
+                'key': API_KEY,
+                'loop_id': loop_id,
+                'currency_name': BASE_COIN,
+                'profit': profit,
+                'amount': amount
+            })
+            assert response.status_code == 200, response.data
+            return response.data
+
+        return call
+    raise ValueError(f'Unknown target {target}')
+
+
+def run_scenario(
+        target: str,
+        length: int,
+        depth: int,
+        mode: str,
+        concurrency: int,
+        requests: int,
+        latency: float,
+        loops: int,
+        reversed_share: float
+) -> Dict[str, float]:
+    seed = Seed(length=length, loops=loops, reversed_share=reversed_share)
+    profit, amount = (1e-9, None) if mode == 'profit' else (None, 50.0)
+    with OKXStandIn(prices=seed.prices, depth=depth, latency=latency) as stand_in:
+        repo = seed.repo()
+        exchange_parser = OKXExchangeParser(
+            repo=repo,
+            base_url=stand_in.base_url,
+            # The stand-in has no rate limits, and every scenario starts without books in flight
+            scheduler=OKXRequestScheduler(okx_session, limits={}),
+            book_flights=SingleFlight()
+        )
+        call = scenario_call(target, repo, exchange_parser, profit, amount)
+        loop_ids = itertools.cycle(sorted(seed.loops))
+        # Warm up connections and imports
+        call(next(loop_ids))
+
+        calls_before, http_before = sum(repo.calls.values()), len(stand_in.requests)
+
+        def timed(loop_id: int) -> float:
+            started = time.perf_counter()
+            call(loop_id)
+            return time.perf_counter() - started
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            latencies = np.array(list(executor.map(timed, [next(loop_ids) for _ in range(requests)])))
+        elapsed = time.perf_counter() - started
+        db_calls = (sum(repo.calls.values()) - calls_before) / requests
+        http_calls = (len(stand_in.requests) - http_before) / requests
+
+        # Allocations are measured on a separate sequential pass, tracing slows everything down
+        peaks = []
+        tracemalloc.start()
+        try:
+            for _ in range(min(requests, 10)):
+                loop_id = next(loop_ids)
+                tracemalloc.clear_traces()
+                call(loop_id)
+                peaks.append(tracemalloc.get_traced_memory()[1])
+        finally:
+            tracemalloc.stop()
+
+    return {
+        'p50_ms': float(np.percentile(latencies, 50)) * 1000,
+        'p99_ms': float(np.percentile(latencies, 99)) * 1000,
+        'rps': requests / elapsed,
+        'db_calls': db_calls,
+        'http_calls': http_calls,
+        'peak_kib': float(np.median(peaks)) / 1024,
+    }
+
+
+def compare(results: Dict[str, Dict[str, float]], baseline: Dict[str, Dict[str, float]], tolerance: float) -> List[str]:
+    """Regressions of `results` against `baseline`; call counts must not grow at all"""
+    regressions = []
+    for name, metrics in results.items():
+        before = baseline.get(name)
+        if before is None:
+            continue
+        for key in ('p50_ms', 'p99_ms', 'peak_kib'):
+            if metrics[key] > before[key] * (1 + tolerance):
+                regressions.append(f'{name}: {key} {before[key]:.2f} -> {metrics[key]:.2f}')
+        if metrics['rps'] < before['rps'] * (1 - tolerance):
+            regressions.append(f'{name}: rps {before["rps"]:.1f} -> {metrics["rps"]:.1f}')
+        for key in ('db_calls', 'http_calls'):
+            if metrics[key] > before[key] + 1e-9:
+                regressions.append(f'{name}: {key} {before[key]:.2f} -> {metrics[key]:.2f}')
+    return regressions
+
+
+def main() -> None:
+    arg_parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    arg_parser.add_argument('--targets', nargs='+', default=['orders_book', 'main', 'endpoint'])
+    arg_parser.add_argument('--lengths', nargs='+', type=int, default=[3, 5])
+    arg_parser.add_argument('--depths', nargs='+', type=int, default=[20, 400])
+    arg_parser.add_argument('--modes', nargs='+', default=['profit', 'amount'])
+    arg_parser.add_argument('--concurrency', nargs='+', type=int, default=[1, 8])
+    arg_parser.add_argument('--requests', type=int, default=50)
+    arg_parser.add_argument('--latency', type=float, default=0.0, help='seconds the stand-in sleeps per request')
+    arg_parser.add_argument('--loops', type=int, default=20)
+    arg_parser.add_argument('--reversed-share', type=float, default=0.5, help='share of pairs listed the other way')
+    arg_parser.add_argument('--save', nargs='?', const=DEFAULT_BASELINE, help='write the results as a baseline')
+    arg_parser.add_argument('--baseline', nargs='?', const=DEFAULT_BASELINE, help='compare against a baseline')
+    arg_parser.add_argument('--tolerance', type=float, default=0.2)
+    args = arg_parser.parse_args()
+
+    results: Dict[str, Dict[str, float]] = {}
+    grid: List[Tuple[str, int, int, str, int]] = list(itertools.product(
+        args.targets, args.lengths, args.depths, args.modes, args.concurrency
+    ))
+    print(f'{"scenario":<36} {"p50 ms":>8} {"p99 ms":>8} {"req/s":>8} {"db/req":>7} {"http/req":>8} {"peak KiB":>9}')
+    for target, length, depth, mode, concurrency in grid:
+        name = f'{target}/len{length}/depth{depth}/{mode}/c{concurrency}'
+        metrics = run_scenario(
+            target=target,
+            length=length,
+            depth=depth,
+            mode=mode,
+            concurrency=concurrency,
+            requests=args.requests,
+            latency=args.latency,
+            loops=args.loops,
+            reversed_share=args.reversed_share
+        )
+        results[name] = metrics
+        print(
+            f'{name:<36} {metrics["p50_ms"]:>8.2f} {metrics["p99_ms"]:>8.2f} {metrics["rps"]:>8.1f} '
+            f'{metrics["db_calls"]:>7.2f} {metrics["http_calls"]:>8.2f} {metrics["peak_kib"]:>9.1f}'
+        )
+
+    if args.save:
+        os.makedirs(os.path.dirname(os.path.abspath(args.save)), exist_ok=True)
+        with open(args.save, 'w') as file:
+            json.dump(results, file, indent=2, sort_keys=True)
+        print(f'baseline saved to {args.save}')
+    if args.baseline:
+        with open(args.baseline) as file:
+            regressions = compare(results, json.load(file), args.tolerance)
+        for regression in regressions:
+            print(f'REGRESSION {regression}')
+        if regressions:
+            sys.exit(1)
+        print('no regressions against the baseline')
+
+
+if __name__ == '__main__':
+    main()
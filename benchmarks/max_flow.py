@@ -0,0 +1,73 @@
+"""Bisection max-flow solver against the linear level scan on synthetic deep books"""
+import argparse
+import random
+import time
+from typing import List
+
+import numpy as np
+
+from application.services.max_flow import (
+    LegBook,
+    bisect_max_flow,
+    breakpoints,
+    linear_max_flow,
+    loop_profit,
+    simulate,
+)
+
+# Mid prices of a USDT -> BTC -> ETH -> USDT loop with a small edge and the
+# value of one BTC in each leg's input currency
+MID_RATES = [1 / 30000, 15.2, 2000.0]
+BTC_VALUES = [30000.0, 1.0, 15.0]
+
+
+def synthetic_legs(rnd: random.Random, levels: int) -> List[LegBook]:
+    legs = []
+    for mid, btc_value in zip(MID_RATES, BTC_VALUES):
+        slippage = np.cumsum(np.full(levels, rnd.uniform(0.00001, 0.0001)))
+        capacities = np.array([rnd.uniform(0.1, 10) for _ in range(levels)]) * btc_value
+        legs.append(LegBook(rates=mid * (1 - slippage), capacities=capacities, tax=0.01))
+    return legs
+
+
+def main() -> None:
+    arg_parser = argparse.ArgumentParser(description=__doc__)
+    arg_parser.add_argument('--levels', type=int, default=400)
+    arg_parser.add_argument('--cases', type=int, default=50)
+    arg_parser.add_argument('--seed', type=int, default=0)
+    args = arg_parser.parse_args()
+
+    rnd = random.Random(args.seed)
+    bisect_time = linear_time = 0.0
+    bisect_simulations = linear_simulations = 0
+    for case in range(args.cases):
+        legs = synthetic_legs(rnd, args.levels)
+        profit = rnd.uniform(0.0, 1.0)
+
+        started = time.perf_counter()
+        exact = bisect_max_flow(legs, profit)
+        bisect_time += time.perf_counter() - started
+        started = time.perf_counter()
+        linear = linear_max_flow(legs, profit)
+        linear_time += time.perf_counter() - started
+
+        # Without an answer bisection went left on every probe
+        bisect_simulations += exact.simulations if exact else len(breakpoints(legs)).bit_length()
+        linear_simulations += linear.simulations if linear else 1
+        assert (exact is None) == (linear is None), f'case {case}: only one solver found a flow'
+        if exact:
+            assert loop_profit(exact.amount, simulate(legs, exact.amount)) >= profit - 1e-9
+            beyond = exact.amount * (1 + 1e-6)
+            assert not loop_profit(beyond, simulate(legs, beyond)) >= profit, f'case {case} stops early'
+        if linear:
+            assert exact.amount >= linear.amount, f'case {case}: bisect below linear scan'
+
+    print(f'{args.cases} cases, {args.levels} levels per leg')
+    print(f'bisect: {bisect_time / args.cases * 1000:.3f} ms, '
+          f'{bisect_simulations / args.cases:.1f} simulations per case')
+    print(f'linear: {linear_time / args.cases * 1000:.3f} ms, '
+          f'{linear_simulations / args.cases:.1f} simulations per case')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,118 @@
+"""
+Loops whose steps alternate between two exchanges, priced through the ExchangeParserRegistry.
+
+Each platform is a local OKX stand-in with its own latency and request
+limits, serving the same instruments, and each has its own parser, so its
+own connections and limits. Fetch time of a loop's books through the
+registry, which asks both exchanges at once, is set against asking one
+exchange after the other. Every cross-platform loop is then evaluated and
+its profit checked against the same loop priced on OKX alone, which sees
+the same books and courses.
+"""
+import argparse
+import time
+from typing import Dict, List
+
+import numpy as np
+
+from adapters.repositories.memory import InMemoryLoopsRepo
+from application.dataclasses.common import CourseEdge, LoopInfo
+from application.services.exchange_registry import ExchangeParserRegistry, platform_parser
+from application.services.okx_services import OKXTradeOnlineParser
+from benchmarks.end_to_end import API_KEY, BASE_COIN, Seed
+from benchmarks.okx_stand_in import OKXStandIn
+
+PLATFORMS = ('OKX', 'FAKEX')
+
+
+def _on_platform(step: LoopInfo, platform: str) -> LoopInfo:
+    fields = dict(
+        method=step.method,
+        platform_from=platform,
+        platform_to=platform,
+        currency_from=step.currency_from,
+        currency_to=step.currency_to,
+        rule_id=step.rule_id,
+        tax=step.tax
+    )
+    if isinstance(step, CourseEdge):
+        return CourseEdge(rate=step.rate, **fields)
+    return LoopInfo(**fields)
+
+
+def cross_platform(seed: Seed) -> InMemoryLoopsRepo:
+    """The seed's loops with step i on PLATFORMS[i % 2], and their courses listed on both platforms"""
+    loops = {
+        loop_id: [_on_platform(step, PLATFORMS[number % len(PLATFORMS)]) for number, step in enumerate(loop_info)]
+        for loop_id, loop_info in seed.loops.items()
+    }
+    courses = [_on_platform(course, platform) for course in seed.courses for platform in PLATFORMS]
+    return InMemoryLoopsRepo(
+        loops=loops,
+        courses=courses,
+        platforms={platform: number for number, platform in enumerate(PLATFORMS, 1)},
+        keys={API_KEY: 2}
+    )
+
+
+def main() -> None:
+    arg_parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    arg_parser.add_argument('--latency', nargs=2, type=float, default=[0.02, 0.05], help='seconds per book of each platform')
+    arg_parser.add_argument('--length', type=int, default=4)
+    arg_parser.add_argument('--depth', type=int, default=20)
+    arg_parser.add_argument('--loops', type=int, default=20)
+    args = arg_parser.parse_args()
+    seed = Seed(length=args.length, loops=args.loops, reversed_share=0.5)
+    repo = cross_platform(seed)
+
+    stand_ins = {
+        platform: OKXStandIn(prices=seed.prices, depth=args.depth, latency=latency).start()
+        for platform, latency in zip(PLATFORMS, args.latency)
+    }
+    try:
+        parsers = {
+            platform: platform_parser(repo=repo, base_url=stand_in.base_url, rate_limits={})
+            for platform, stand_in in stand_ins.items()
+        }
+        registry = ExchangeParserRegistry(default=parsers['OKX'], parsers=parsers)
+
+        timings: Dict[str, List[float]] = {'sequential': [], 'registry': []}
+        for loop_id in sorted(repo.loops):
+            loop_info = repo.get_loop_by_id(loop_id)
+            started = time.perf_counter()
+            for platform in PLATFORMS:
+                parsers[platform].fetch_books([loop for loop in loop_info if loop.platform_from == platform])
+            timings['sequential'].append(time.perf_counter() - started)
+            started = time.perf_counter()
+            registry.fetch_books(loop_info)
+            timings['registry'].append(time.perf_counter() - started)
+
+        print(f'{"fetch":<11} {"p50 ms":>8} {"p99 ms":>8}')
+        for name, values in timings.items():
+            print(f'{name:<11} {np.percentile(values, 50) * 1000:>8.2f} {np.percentile(values, 99) * 1000:>8.2f}')
+
+        requests_before = {platform: len(stand_in.requests) for platform, stand_in in stand_ins.items()}
+        crossed = OKXTradeOnlineParser(repo=repo, exchange_parser=registry, save_results=False)
+        single = OKXTradeOnlineParser(repo=seed.repo(), exchange_parser=parsers['OKX'], save_results=False)
+        got = {
+            loop_id: crossed.evaluate(loop_id=loop_id, currency_name=BASE_COIN, profit=None, amount=50.0)
+            for loop_id in sorted(repo.loops)
+        }
+        requests = {platform: len(stand_in.requests) - requests_before[platform] for platform, stand_in in stand_ins.items()}
+        mismatches = sum(
+            not np.isclose(
+                evaluation.profit,
+                single.evaluate(loop_id=loop_id, currency_name=BASE_COIN, profit=None, amount=50.0).profit,
+                equal_nan=True
+            )
+            for loop_id, evaluation in got.items()
+        )
+        print(f'books requested per platform while evaluating: {requests}')
+        print(f'profit mismatches against OKX alone: {mismatches} of {len(repo.loops)}')
+    finally:
+        for stand_in in stand_ins.values():
+            stand_in.stop()
+
+
+if __name__ == '__main__':
+    main()
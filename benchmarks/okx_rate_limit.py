@@ -0,0 +1,78 @@
+"""Throughput and token waits of the OKX scheduler against a rate limited stand-in"""
+import argparse
+import itertools
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from application.dataclasses.constants import RequestPriority
+from application.services.okx_parser import OKXExchangeParser, okx_session
+from application.services.okx_scheduler import OKXRequestScheduler
+from benchmarks.okx_stand_in import OKXStandIn
+
+BOOKS_PATH = OKXExchangeParser.BOOKS_PATH
+
+
+def run(stand_in: OKXStandIn, limits: dict, seconds: float, background: int, interactive: int) -> None:
+    scheduler = OKXRequestScheduler(okx_session, limits=limits, max_retries=3, backoff_base=0.05)
+    parsers = {
+        priority: OKXExchangeParser(
+            repo=object(),
+            base_url=stand_in.base_url,
+            scheduler=scheduler,
+            priority=priority
+        )
+        for priority in RequestPriority
+    }
+    done = {priority: 0 for priority in RequestPriority}
+    failed = {priority: 0 for priority in RequestPriority}
+    lock = threading.Lock()
+    sequence = itertools.count()
+    deadline = time.monotonic() + seconds
+    requests_before, rejected_before = len(stand_in.requests), stand_in.rejected
+
+    def client(priority: RequestPriority) -> None:
+        while time.monotonic() < deadline:
+            try:
+                # Unique instruments, so no request is coalesced with another
+                parsers[priority].get_book(f'X{next(sequence)}-USDT')
+                outcome = done
+            except Exception:
+                outcome = failed
+            with lock:
+                outcome[priority] += 1
+
+    clients = [RequestPriority.background] * background + [RequestPriority.interactive] * interactive
+    started = time.monotonic()
+    with ThreadPoolExecutor(max_workers=len(clients)) as executor:
+        list(executor.map(client, clients))
+    elapsed = time.monotonic() - started
+
+    answered = len(stand_in.requests) - requests_before
+    print(f'limits {limits or "off"}: {answered / elapsed:.1f} accepted requests/s, '
+          f'{stand_in.rejected - rejected_before} answered 429')
+    for priority in RequestPriority:
+        print(f'  {priority.name}: {done[priority]} books, {failed[priority]} failed')
+    for path, stats in scheduler.stats().items():
+        print(f'  {path}: sent {stats.sent}, retried {stats.retried}, '
+              f'wait p50 {stats.wait_p50}, p99 {stats.wait_p99}')
+
+
+def main() -> None:
+    arg_parser = argparse.ArgumentParser(description=__doc__)
+    arg_parser.add_argument('--limit', type=int, default=6)
+    arg_parser.add_argument('--per', type=float, default=1.0)
+    arg_parser.add_argument('--seconds', type=float, default=5.0)
+    arg_parser.add_argument('--background', type=int, default=8)
+    arg_parser.add_argument('--interactive', type=int, default=2)
+    args = arg_parser.parse_args()
+
+    limits = {BOOKS_PATH: (args.limit, args.per)}
+    with OKXStandIn(rate_limits=limits) as stand_in:
+        run(stand_in, {}, args.seconds, args.background, args.interactive)
+        time.sleep(args.per)
+        run(stand_in, limits, args.seconds, args.background, args.interactive)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,154 @@
+"""Local stand-in for the OKX market data REST API"""
+import argparse
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from collections import defaultdict, deque
+from typing import Deque, Dict, List, Optional, Tuple
+from urllib.parse import parse_qs, urlparse
+
+DEFAULT_PRICES = {
+    'BTC-USDT': 30000.0,
+    'ETH-USDT': 2000.0,
+    'ETH-BTC': 0.0667,
+}
+
+
+def synthetic_book(price: float, depth: int, seed: int = 0, step: float = 0.0005) -> dict:
+    rnd = random.Random(seed)
+    asks = [
+        [f'{price * (1 + step * i):.8f}', f'{rnd.uniform(0.05, 5):.8f}', '0', str(rnd.randint(1, 9))]
+        for i in range(depth)
+    ]
+    bids = [
+        [f'{price * (1 - step * (i + 1)):.8f}', f'{rnd.uniform(0.05, 5):.8f}', '0', str(rnd.randint(1, 9))]
+        for i in range(depth)
+    ]
+    return {'asks': asks, 'bids': bids, 'ts': str(int(time.time() * 1000))}
+
+
+class OKXStandIn:
+    """
+    Serves synthetic books-lite payloads on a local port.
+
+    Only instruments listed in `prices` exist, so legs written the other way
+    round are answered with empty data and have to be reversed by the parser.
+    `latency` seconds are slept before every answer. With `rate_limits`
+    (path -> (requests, seconds)) a request beyond the limit in any sliding
+    window is answered 429 like OKX does.
+    """
+
+    def __init__(
+            self,
+            prices: Optional[Dict[str, float]] = None,
+            depth: int = 50,
+            latency: float = 0.0,
+            host: str = '127.0.0.1',
+            port: int = 0,
+            rate_limits: Optional[Dict[str, Tuple[int, float]]] = None
+    ):
+        self.prices = prices or dict(DEFAULT_PRICES)
+        self.depth = depth
+        self.latency = latency
+        self.books = {
+            inst_id: synthetic_book(price, depth, seed=seed)
+            for seed, (inst_id, price) in enumerate(sorted(self.prices.items()))
+        }
+        self.requests: List[str] = []
+        self.rate_limits = rate_limits or {}
+        self.rejected = 0
+        self._arrivals: Dict[str, Deque[float]] = defaultdict(deque)
+        self._lock = threading.Lock()
+        self.server = ThreadingHTTPServer((host, port), self._handler())
+        self.server.daemon_threads = True
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.server.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def _over_limit(self, path: str) -> bool:
+        if path not in self.rate_limits:
+            return False
+        count, seconds = self.rate_limits[path]
+        now = time.monotonic()
+        with self._lock:
+            arrivals = self._arrivals[path]
+            while arrivals and arrivals[0] <= now - seconds:
+                arrivals.popleft()
+            if len(arrivals) >= count:
+                self.rejected += 1
+                return True
+            arrivals.append(now)
+            return False
+
+    def respond(self, path: str, query: Dict[str, List[str]]) -> Tuple[int, dict]:
+        if self._over_limit(path):
+            return 429, {'code': '50011', 'msg': 'Too Many Requests', 'data': []}
+        if path != '/api/v5/market/books-lite':
+            return 404, {'code': '404', 'msg': 'Not found', 'data': []}
+        inst_id = query.get('instId', [''])[0]
+        with self._lock:
+            self.requests.append(inst_id)
+        book = self.books.get(inst_id)
+        if book is None:
+            return 200, {'code': '51001', 'msg': "Instrument ID doesn't exist", 'data': []}
+        return 200, {'code': '0', 'msg': '', 'data': [book]}
+
+    def _handler(self):
+        stand_in = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+            # Headers and body are written separately; with Nagle the body waits for a delayed ACK
+            disable_nagle_algorithm = True
+
+            def do_GET(self):
+                if stand_in.latency:
+                    time.sleep(stand_in.latency)
+                url = urlparse(self.path)
+                status, payload = stand_in.respond(url.path, parse_qs(url.query))
+                body = json.dumps(payload).encode()
+                try:
+                    self.send_response(status)
+                    self.send_header('Content-Type', 'application/json')
+                    self.send_header('Content-Length', str(len(body)))
+                    self.end_headers()
+                    self.wfile.write(body)
+                except ConnectionError:
+                    # The client timed out while `latency` was slept
+                    self.close_connection = True
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+    def start(self) -> 'OKXStandIn':
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self) -> 'OKXStandIn':
+        return self.start()
+
+    def __exit__(self, *exc) -> None:
+        self.stop()
+
+
+if __name__ == '__main__':
+    arg_parser = argparse.ArgumentParser(description=__doc__)
+    arg_parser.add_argument('--port', type=int, default=8081)
+    arg_parser.add_argument('--depth', type=int, default=50)
+    arg_parser.add_argument('--latency', type=float, default=0.0)
+    args = arg_parser.parse_args()
+    stand_in = OKXStandIn(depth=args.depth, latency=args.latency, port=args.port)
+    print(f'OKX stand-in listening on {stand_in.base_url}')
+    stand_in.server.serve_forever()
@@ -0,0 +1,153 @@
+"""Local stand-in for the OKX public WebSocket replaying recorded books messages"""
+import asyncio
+import json
+import random
+import threading
+from typing import Dict, Iterable, List, Optional
+
+import websockets
+
+from application.services.okx_book_stream import LocalOrderBook
+from benchmarks.okx_stand_in import DEFAULT_PRICES, synthetic_book
+
+
+def generate_messages(inst_id: str, price: float, updates: int = 20, depth: int = 50, seed: int = 0) -> List[dict]:
+    """Snapshot followed by `updates` deltas with valid seqId chain and checksums"""
+    rnd = random.Random(seed)
+    book = LocalOrderBook(inst_id)
+    snapshot = synthetic_book(price, depth, seed=seed)
+    book.apply_snapshot(snapshot)
+    seq_id = 1
+    messages = [{
+        'arg': {'channel': 'books', 'instId': inst_id},
+        'action': 'snapshot',
+        'data': [dict(snapshot, checksum=book.checksum(), seqId=seq_id, prevSeqId=-1)],
+    }]
+    for _ in range(updates):
+        side = rnd.choice(['asks', 'bids'])
+        levels = book.as_dict()[side]
+        level = rnd.choice(levels[:10])
+        size = '0' if rnd.random() < 0.2 else f'{rnd.uniform(0.05, 5):.8f}'
+        delta = {'asks': [], 'bids': [], 'ts': snapshot['ts']}
+        delta[side].append([level[0], size, '0', '1'])
+        book.apply_update(delta)
+        delta.update(checksum=book.checksum(), seqId=seq_id + 1, prevSeqId=seq_id)
+        seq_id += 1
+        messages.append({
+            'arg': {'channel': 'books', 'instId': inst_id},
+            'action': 'update',
+            'data': [delta],
+        })
+    return messages
+
+
+def load_messages(path: str) -> Dict[str, List[dict]]:
+    """Recorded raw messages, one JSON object per line"""
+    messages: Dict[str, List[dict]] = {}
+    with open(path) as file:
+        for line in file:
+            if line.strip():
+                message = json.loads(line)
+                messages.setdefault(message['arg']['instId'], []).append(message)
+    return messages
+
+
+class OKXWebSocketStandIn:
+    """
+    Answers subscribe requests by replaying the messages recorded for the
+    instrument, `interval` seconds apart. Unknown instruments get the same
+    error event as the real API.
+    """
+
+    def __init__(
+            self,
+            messages: Optional[Dict[str, List[dict]]] = None,
+            interval: float = 0.0,
+            host: str = '127.0.0.1',
+            port: int = 0
+    ):
+        self.messages = messages if messages is not None else {
+            inst_id: generate_messages(inst_id, price, seed=seed)
+            for seed, (inst_id, price) in enumerate(sorted(DEFAULT_PRICES.items()))
+        }
+        self.interval = interval
+        self.host = host
+        self.port = port
+        self.subscriptions: List[str] = []
+        self._loop = asyncio.new_event_loop()
+        self._server = None
+        self._started = threading.Event()
+
+    @property
+    def url(self) -> str:
+        return f'ws://{self.host}:{self.port}'
+
+    async def _replay(self, websocket, inst_id: str) -> None:
+        for message in self.messages[inst_id]:
+            await websocket.send(json.dumps(message))
+            if self.interval:
+                await asyncio.sleep(self.interval)
+
+    async def _handler(self, websocket, path: str = None) -> None:
+        async for raw in websocket:
+            if raw == 'ping':
+                await websocket.send('pong')
+                continue
+            request = json.loads(raw)
+            if request.get('op') != 'subscribe':
+                continue
+            for arg in request.get('args', []):
+                inst_id = arg['instId']
+                self.subscriptions.append(inst_id)
+                if inst_id not in self.messages:
+                    await websocket.send(json.dumps({
+                        'event': 'error', 'code': '60018',
+                        'msg': f"Wrong URL or channel:books,instId:{inst_id} doesn't exist."
+                    }))
+                    continue
+                await websocket.send(json.dumps({'event': 'subscribe', 'arg': arg}))
+                await self._replay(websocket, inst_id)
+
+    async def _serve(self):
+        return await websockets.serve(self._handler, self.host, self.port)
+
+    def _run(self) -> None:
+        asyncio.set_event_loop(self._loop)
+        self._server = self._loop.run_until_complete(self._serve())
+        self.port = self._server.sockets[0].getsockname()[1]
+        self._started.set()
+        self._loop.run_forever()
+
+    def start(self) -> 'OKXWebSocketStandIn':
+        threading.Thread(target=self._run, daemon=True).start()
+        self._started.wait()
+        return self
+
+    def stop(self) -> None:
+        async def close():
+            self._server.close()
+            await self._server.wait_closed()
+
+        asyncio.run_coroutine_threadsafe(close(), self._loop).result()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+
+    def __enter__(self) -> 'OKXWebSocketStandIn':
+        return self.start()
+
+    def __exit__(self, *exc) -> None:
+        self.stop()
+
+
+def replayed_books(inst_ids: Iterable[str], messages: Dict[str, List[dict]]) -> Dict[str, dict]:
+    """Books a client should hold after consuming every recorded message"""
+    books = {}
+    for inst_id in inst_ids:
+        book = LocalOrderBook(inst_id)
+        for message in messages[inst_id]:
+            for data in message['data']:
+                if message['action'] == 'snapshot':
+                    book.apply_snapshot(data)
+                else:
+                    book.apply_update(data)
+        books[inst_id] = book.as_dict()
+    return books
@@ -0,0 +1,73 @@
+"""Time and memory per 1k levels: pydantic book orders against OrderBookLevels"""
+import argparse
+import time
+import tracemalloc
+from typing import Tuple
+
+import numpy as np
+
+from application.dataclasses.common import BookOrder, BookOrderConverted
+from application.dataclasses.order_book import LevelLeg, OrderBookLevels
+from benchmarks.okx_stand_in import synthetic_book
+
+LEVELS = 1000
+
+
+def pydantic_levels(values: list) -> list:
+    # What the parser built per level before OrderBookLevels
+    orders = [
+        BookOrder(currency_from='BTC', currency_to='USDT', rate=float(value[0]), quantity=float(value[1]), rule_id=1)
+        for value in values
+    ]
+    converted, amount = [], 0
+    for order in orders:
+        quantity_base_currency = order.quantity * 30000.0
+        amount += quantity_base_currency
+        converted.append(BookOrderConverted(
+            currency_from=order.currency_from, currency_to='USDT', rate=30000.0,
+            quantity_for_translation=order.quantity, quantity_base_currency=quantity_base_currency,
+            total_amount=amount, rule_id=order.rule_id, platform_from='OKX', platform_to='Trade', tax=0.1
+        ))
+    return converted
+
+
+def compact_levels(values: list) -> OrderBookLevels:
+    quantities = np.array([value[1] for value in values], dtype=float)
+    leg = LevelLeg(
+        currency_from='BTC', currency_to='USDT', rule_id=1,
+        platform_from='OKX', platform_to='Trade', rate=30000.0, tax=0.1
+    )
+    return OrderBookLevels.from_leg(leg, quantities, quantities * 30000.0)
+
+
+def measure(build, values: list, rounds: int) -> Tuple[float, int]:
+    started = time.perf_counter()
+    for _ in range(rounds):
+        build(values)
+    elapsed = (time.perf_counter() - started) / rounds
+    tracemalloc.start()
+    result = build(values)
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del result
+    return elapsed, current
+
+
+def main() -> None:
+    arg_parser = argparse.ArgumentParser(description=__doc__)
+    arg_parser.add_argument('--rounds', type=int, default=20)
+    args = arg_parser.parse_args()
+
+    values = synthetic_book(30000.0, LEVELS)['asks']
+    for name, build in (('pydantic', pydantic_levels), ('compact', compact_levels)):
+        elapsed, memory = measure(build, values, args.rounds)
+        print(f'{name:>8}: {elapsed * 1000:8.3f} ms, {memory / 1024:8.1f} KiB per {LEVELS} levels')
+    levels = compact_levels(values)
+    started = time.perf_counter()
+    levels.to_parsed('Trade')
+    print(f'materializing {LEVELS} BookOrderParsed rows at the boundary: '
+          f'{(time.perf_counter() - started) * 1000:.3f} ms')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,52 @@
+"""Wall time of OKXExchangeParser.fetch_books against a slow local OKX stand-in"""
+import argparse
+import time
+
+from application.dataclasses import LoopInfo
+from application.services.okx_parser import OKXExchangeParser, okx_session
+from application.services.okx_scheduler import OKXRequestScheduler
+from benchmarks.okx_stand_in import OKXStandIn
+
+
+def loop_steps() -> list:
+    steps = [('USDT', 'BTC'), ('BTC', 'ETH'), ('ETH', 'USDT')]
+    return [
+        LoopInfo(
+            method='Trade',
+            platform_from='OKX',
+            platform_to='OKX',
+            currency_from=currency_from,
+            currency_to=currency_to,
+            rule_id=rule_id,
+            tax=0.1
+        )
+        for rule_id, (currency_from, currency_to) in enumerate(steps)
+    ]
+
+
+def main() -> None:
+    arg_parser = argparse.ArgumentParser(description=__doc__)
+    arg_parser.add_argument('--latency', type=float, default=0.05)
+    arg_parser.add_argument('--rounds', type=int, default=10)
+    args = arg_parser.parse_args()
+
+    with OKXStandIn(latency=args.latency) as stand_in:
+        # The stand-in has no rate limits, so neither has the scheduler
+        parser = OKXExchangeParser(
+            repo=object(),
+            base_url=stand_in.base_url,
+            scheduler=OKXRequestScheduler(okx_session, limits={})
+        )
+        loop_info = loop_steps()
+        started = time.perf_counter()
+        for _ in range(args.rounds):
+            parser.fetch_books(loop_info)
+        elapsed = (time.perf_counter() - started) / args.rounds
+        probes = len(stand_in.requests) // args.rounds
+        print(f'{probes} probes per loop, latency {args.latency * 1000:.0f} ms each')
+        print(f'concurrent fetch: {elapsed * 1000:.1f} ms per loop')
+        print(f'sequential lower bound: {probes * args.latency * 1000:.1f} ms per loop')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,77 @@
+"""Payload size and encoding time of the /online-parser-okx response formats"""
+import argparse
+import dataclasses
+import json
+import time
+from typing import Callable, Union
+
+import numpy as np
+from flask import Flask, jsonify
+
+from application.dataclasses.common import LoopProfit
+from application.dataclasses.order_book import LevelLeg, LoopEvaluation, OrderBookLevels
+from application.services import response_formats
+
+
+def synthetic_evaluation(levels: int) -> LoopEvaluation:
+    rnd = np.random.default_rng(0)
+    parts = []
+    for rule_id, (currency_from, rate) in enumerate([('USDT', 1.0), ('BTC', 30000.0), ('ETH', 2000.0)]):
+        quantities = rnd.uniform(0.05, 5, levels)
+        parts.append(OrderBookLevels.from_leg(
+            leg=LevelLeg(
+                currency_from=currency_from,
+                currency_to='USDT',
+                rule_id=rule_id,
+                platform_from='OKX',
+                platform_to='Trade',
+                rate=rate,
+                tax=0.1
+            ),
+            quantity_for_translation=quantities,
+            quantity_base_currency=quantities * rate
+        ))
+    return LoopEvaluation(
+        loop_profit=LoopProfit(profit=0.12, amount=1000.0),
+        levels=OrderBookLevels.merge(parts),
+        method='Trade'
+    )
+
+
+def measure(name: str, encode: Callable[[], Union[bytes, str]], rounds: int) -> None:
+    started = time.perf_counter()
+    for _ in range(rounds):
+        payload = encode()
+    elapsed = (time.perf_counter() - started) / rounds
+    size = len(payload.encode() if isinstance(payload, str) else payload)
+    print(f'{name:16} {size / 1024:9.1f} KiB {elapsed * 1000:9.2f} ms')
+
+
+def main() -> None:
+    arg_parser = argparse.ArgumentParser(description=__doc__)
+    arg_parser.add_argument('--levels', type=int, default=400, help='levels per leg')
+    arg_parser.add_argument('--rounds', type=int, default=20)
+    args = arg_parser.parse_args()
+
+    evaluation = synthetic_evaluation(args.levels)
+    # Every format carries the same rows
+    rows = [dataclasses.asdict(row) for row in evaluation.data]
+    assert list(response_formats.iter_rows(evaluation)) == rows
+    columnar = response_formats.columnar(evaluation)
+    assert response_formats.read_columnar_binary(response_formats.columnar_binary(evaluation)) == columnar
+
+    app = Flask(__name__)
+    print(f'{len(evaluation.levels)} rows')
+    with app.app_context():
+        # What the endpoint did before: pydantic rows, then jsonify
+        measure('json', lambda: jsonify({
+            'profit': evaluation.profit, 'amount': evaluation.amount, 'data': evaluation.data
+        }).get_data(), args.rounds)
+        measure('ndjson', lambda: ''.join(response_formats.ndjson_lines(evaluation)), args.rounds)
+        measure('columnar', lambda: jsonify(response_formats.columnar(evaluation)).get_data(), args.rounds)
+        measure('columnar-binary', lambda: response_formats.columnar_binary(evaluation), args.rounds)
+        measure('summary_only', lambda: jsonify(response_formats.summary(evaluation)).get_data(), args.rounds)
+
+
+if __name__ == '__main__':
+    main()
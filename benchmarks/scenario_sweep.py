@@ -0,0 +1,46 @@
+"""Scenario sweep in the calling process against the process pool on synthetic deep books"""
+import argparse
+import os
+import random
+import time
+
+import numpy as np
+
+from application.services.scenario_sweep import LoopSweeper
+from benchmarks.max_flow import synthetic_legs
+
+
+def main() -> None:
+    arg_parser = argparse.ArgumentParser(description=__doc__)
+    arg_parser.add_argument('--levels', type=int, default=400)
+    arg_parser.add_argument('--base-coins', type=int, default=3)
+    arg_parser.add_argument('--amounts', type=int, default=2000)
+    arg_parser.add_argument('--thresholds', type=int, default=2000)
+    arg_parser.add_argument('--processes', type=int, default=os.cpu_count())
+    arg_parser.add_argument('--seed', type=int, default=0)
+    args = arg_parser.parse_args()
+
+    rnd = random.Random(args.seed)
+    legs = {f'COIN{i}': synthetic_legs(rnd, args.levels) for i in range(args.base_coins)}
+    amounts = np.linspace(1.0, 200000.0, args.amounts).tolist()
+    thresholds = np.linspace(0.0, 1.0, args.thresholds).tolist()
+    scenarios = args.base_coins * (args.amounts + args.thresholds)
+
+    timings = {}
+    results = {}
+    for processes in sorted({1, args.processes}):
+        sweeper = LoopSweeper(processes=processes, min_parallel=0)
+        # The pool is shared by every sweep, so its start is not timed
+        sweeper.run(legs, amounts, thresholds)
+        started = time.perf_counter()
+        results[processes] = sweeper.run(legs, amounts, thresholds)
+        timings[processes] = time.perf_counter() - started
+        sweeper.close()
+        print(f'{processes:>3} processes: {timings[processes]:.3f} s, {scenarios / timings[processes]:,.0f} scenarios/s')
+    assert all(result == results[1] for result in results.values()), 'pool results differ from the calling process'
+    if args.processes > 1:
+        print(f'speedup x{timings[1] / timings[args.processes]:.2f} on {args.processes} processes')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,111 @@
+"""
+Time-to-ready and first-request latency of a freshly started app, with and without the warm-up.
+
+Every trial runs in a new process, so imports, caches and connections start
+cold. The app is given a CachedLoopsRepo over an InMemoryLoopsRepo sleeping
+`--db-latency` per query, and the local OKX stand-in sleeping `--okx-latency`
+per book. Time to ready is measured from the start of the process until
+/ready answers 200, polled every 10 ms like a readiness probe.
+"""
+import argparse
+import multiprocessing
+import time
+from typing import Dict, List
+
+import numpy as np
+
+from benchmarks.end_to_end import API_KEY, BASE_COIN, Seed
+from benchmarks.okx_stand_in import OKXStandIn
+
+MODES = ('cold', 'warm')
+
+
+def _seed(args: dict) -> Seed:
+    return Seed(length=args['length'], loops=args['loops'], reversed_share=0.5)
+
+
+def trial(mode: str, base_url: str, args: dict, results) -> None:
+    started = time.perf_counter()
+    import main
+    from adapters.repositories.cached import CachedLoopsRepo
+    from adapters.repositories.memory import InMemoryLoopsRepo
+    from application.services.okx_parser import OKXExchangeParser, okx_session
+    from application.services.okx_scheduler import OKXRequestScheduler
+    from application.services.warm_up import WarmUp
+    imported = time.perf_counter()
+
+    seed = _seed(args)
+    main.loops_repo = CachedLoopsRepo(InMemoryLoopsRepo(
+        loops=seed.loops, courses=seed.courses, keys={API_KEY: 2}, latency=args['db_latency']
+    ))
+    main.exchange_parser = OKXExchangeParser(
+        repo=main.loops_repo,
+        base_url=base_url,
+        scheduler=OKXRequestScheduler(okx_session, limits={})
+    )
+    if mode == 'warm':
+        main.warm_up = WarmUp(
+            repo=main.loops_repo, exchange_parser=main.exchange_parser, top_instruments=args['top_instruments']
+        ).start()
+    client = main.app.test_client()
+    while client.get('/ready').status_code != 200:
+        time.sleep(0.01)
+    ready = time.perf_counter()
+
+    latencies = []
+    for loop_id in sorted(seed.loops)[:args['requests']]:
+        request_started = time.perf_counter()
+        response = client.get('/online-parser-okx', json={
+            'key': API_KEY, 'loop_id': loop_id, 'currency_name': BASE_COIN, 'amount': 50.0
+        })
+        assert response.status_code == 200, response.data
+        latencies.append(time.perf_counter() - request_started)
+    results.put({
+        'import_s': imported - started,
+        'ready_s': ready - started,
+        'first_ms': latencies[0] * 1000,
+        'next_ms': float(np.median(latencies[1:])) * 1000 if len(latencies) > 1 else float('nan'),
+    })
+
+
+def main() -> None:
+    arg_parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    arg_parser.add_argument('--modes', nargs='+', default=list(MODES), choices=MODES)
+    arg_parser.add_argument('--trials', type=int, default=3)
+    arg_parser.add_argument('--requests', type=int, default=10, help='requests per trial, the first one is reported')
+    arg_parser.add_argument('--db-latency', type=float, default=0.002, help='seconds per repository call')
+    arg_parser.add_argument('--okx-latency', type=float, default=0.02, help='seconds per OKX book')
+    arg_parser.add_argument('--length', type=int, default=3)
+    arg_parser.add_argument('--depth', type=int, default=20)
+    arg_parser.add_argument('--loops', type=int, default=50)
+    arg_parser.add_argument('--top-instruments', type=int, default=20)
+    args = arg_parser.parse_args()
+    trial_args = {
+        'length': args.length,
+        'loops': args.loops,
+        'db_latency': args.db_latency,
+        'requests': args.requests,
+        'top_instruments': args.top_instruments,
+    }
+    seed = _seed(trial_args)
+    context = multiprocessing.get_context('spawn')
+
+    print(f'{"mode":<6} {"import s":>9} {"ready s":>8} {"first ms":>9} {"next ms":>8}')
+    with OKXStandIn(prices=seed.prices, depth=args.depth, latency=args.okx_latency) as stand_in:
+        for mode in args.modes:
+            runs: List[Dict[str, float]] = []
+            for _ in range(args.trials):
+                results = context.Queue()
+                process = context.Process(target=trial, args=(mode, stand_in.base_url, trial_args, results))
+                process.start()
+                runs.append(results.get())
+                process.join()
+            median = {key: float(np.median([run[key] for run in runs])) for key in runs[0]}
+            print(
+                f'{mode:<6} {median["import_s"]:>9.3f} {median["ready_s"]:>8.3f} '
+                f'{median["first_ms"]:>9.2f} {median["next_ms"]:>8.2f}'
+            )
+
+
+if __name__ == '__main__':
+    main()
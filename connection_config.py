@@ -5,3 +5,135 @@ connection_params = {
     'host': 'host',
     'port': 5432
 }
+
+pool_params = {
+    'minconn': 1,
+    'maxconn': 10,
+    'timeout': 5.0
+}
+
+cache_params = {
+    'method_ttl': 300.0,
+    'platform_ttl': 300.0,
+    'loop_ttl': 600.0,
+    'client_ttl': 60.0,
+    'negative_ttl': 10.0,
+    'loop_maxsize': 1024,
+    'client_maxsize': 4096,
+    # With listen entries are also dropped on notifications sent to notify_channel
+    'listen': False,
+    'notify_channel': 'loops_repo_invalidate'
+}
+
+okx_params = {
+    'base_url': 'https://www.okx.com',
+    'timeout': 5.0,
+    'max_workers': 16,
+    'pool_maxsize': 32,
+    'max_retries': 3,
+    'backoff_base': 0.2,
+    'backoff_max': 5.0,
+    'rate_headroom': 0.9
+}
+
+# Published OKX REST limits per IP: path -> (requests, seconds)
+okx_rate_limits = {
+    '/api/v5/market/books-lite': (6, 1.0),
+    '/api/v5/market/books': (40, 2.0),
+    '/api/v5/market/ticker': (20, 2.0),
+    '/api/v5/market/tickers': (20, 2.0),
+}
+
+stream_params = {
+    'enabled': False,
+    'url': 'wss://ws.okx.com:8443/ws/v5/public',
+    'channel': 'books',
+    'ping_interval': 25.0,
+    'reconnect_delay': 1.0,
+    'max_age': 5.0
+}
+
+writer_params = {
+    'max_batch': 500,
+    'flush_interval': 1.0,
+    'max_queue': 10000,
+    'put_timeout': 5.0,
+    'retries': 3
+}
+
+scanner_params = {
+    'enabled': False,
+    'workers': 8,
+    'cycle_budget': 1.0,
+    'min_interval': 1.0,
+    'max_interval': 60.0,
+    'refresh_interval': 300.0,
+    'profit': 1e-9,
+    # Change of profit between two evaluations, in percent points, that brings a losing loop back sooner
+    'volatility': 0.05,
+    # With a book stream, loops are also re-evaluated as soon as a book they read changes
+    'incremental': True
+}
+
+capture_params = {
+    'enabled': False,
+    'directory': 'captures',
+    'segment_bytes': 64 * 1024 * 1024,
+    'flush_every': 100
+}
+
+metrics_params = {
+    'enabled': False
+}
+
+sweep_params = {
+    'processes': None,
+    'chunk_size': 64,
+    'min_parallel': 256,
+    # Base coins times amounts and thresholds of one request
+    'max_scenarios': 100000
+}
+
+conversion_params = {
+    'enabled': False,
+    'base_coins': ('USDT', 'USDC', 'BTC', 'ETH'),
+    'max_hops': 3,
+    'refresh_interval': 60.0
+}
+
+coalesce_params = {
+    'book_ttl': 0.0,
+    'rate_ttl': 0.0,
+    'maxsize': 4096
+}
+
+async_params = {
+    'host': '0.0.0.0',
+    'port': 8080,
+    'min_size': 1,
+    'max_size': 20,
+    'timeout': 5.0
+}
+
+# Request budget and largest time between leg books, in seconds; skew_action is 'flag' or 'reject'.
+# Budgets sent by clients are clamped to [min_budget, max_budget].
+deadline_params = {
+    'budget': 3.0,
+    'min_budget': 0.05,
+    'max_budget': 30.0,
+    'max_skew': 2.0,
+    'skew_action': 'flag'
+}
+
+warmup_params = {
+    'enabled': False,
+    'connections': None,
+    'max_loops': 1024,
+    'top_instruments': 20,
+    'workers': 4,
+    'evaluate': True
+}
+
+# Other exchanges serving the OKX books API, by platform name:
+# {'base_url': ..., 'rate_limits': {path: (requests, seconds)}, 'pool_maxsize': ..., 'max_workers': ...}
+platform_params = {}
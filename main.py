@@ -1,15 +1,123 @@
-from flask import Flask, jsonify, request
+from flask import Flask, Response, jsonify, request
 
-from adapters.repositories.common import LoopsRepo
+from adapters.repositories.cached import CachedLoopsRepo, PgInvalidationListener
+from adapters.repositories.coalescing import CoalescingLoopsRepo
+from adapters.repositories.instrumented import InstrumentedLoopsRepo
+from adapters.repositories.pooled import PooledLoopsRepo
+from adapters.repositories.write_behind import WriteBehindLoopsRepo
 from application import errors
+from application.dataclasses.common import LoopJob
+from application.dataclasses.constants import RequestPriority
+from application.services import response_formats
+from application.services.book_capture import BookRecorder
+from application.services.okx_batch import OKXBatchParser
+from application.services.conversion_index import ConversionIndex
+from application.services.deadline import Deadline, parse_budget
+from application.services.exchange_registry import ExchangeParserRegistry, platform_parser
+from application.services.loop_scanner import LoopScanner
+from application.services.metrics import metrics, stats_samples
+from application.services.okx_book_stream import OKXBookStream
+from application.services.okx_parser import OKXExchangeParser, okx_book_flights, okx_scheduler
 from application.services.okx_services import OKXTradeOnlineParser
+from application.services.scenario_sweep import LoopSweeper, check_scenarios, parse_grid
+from application.services.warm_up import WarmUp
+from connection_config import (
+    cache_params,
+    capture_params,
+    conversion_params,
+    platform_params,
+    scanner_params,
+    stream_params,
+    warmup_params,
+)
 
 app = Flask(__name__)
+pooled_repo = PooledLoopsRepo()
+write_behind_repo = WriteBehindLoopsRepo(InstrumentedLoopsRepo(pooled_repo))
+coalescing_repo = CoalescingLoopsRepo(write_behind_repo)
+loops_repo = CachedLoopsRepo(coalescing_repo)
+cache_listener = PgInvalidationListener(loops_repo) if cache_params['listen'] else None
+if cache_listener is not None:
+    cache_listener.start()
+book_stream = OKXBookStream().start() if stream_params['enabled'] else None
+book_recorder = BookRecorder() if capture_params['enabled'] else None
+if book_recorder is not None and book_stream is not None:
+    book_stream.add_listener(book_recorder.record)
+conversion_index = ConversionIndex(repo=loops_repo).start() if conversion_params['enabled'] else None
+exchange_parser = OKXExchangeParser(
+    repo=loops_repo,
+    book_source=book_stream,
+    conversion_index=conversion_index,
+    recorder=book_recorder
+)
+if platform_params:
+    # Steps on other platforms are read from their own exchanges
+    exchange_parser = ExchangeParserRegistry(
+        default=exchange_parser,
+        parsers={
+            platform: platform_parser(repo=loops_repo, conversion_index=conversion_index, **params)
+            for platform, params in platform_params.items()
+        }
+    )
+loop_scanner = (
+    LoopScanner(
+        repo=loops_repo,
+        exchange_parser=OKXExchangeParser(
+            repo=loops_repo,
+            book_source=book_stream,
+            priority=RequestPriority.background,
+            conversion_index=conversion_index
+        ),
+        book_stream=book_stream
+    ).start()
+    if scanner_params['enabled'] else None
+)
+# One process pool for every sweep, its processes start on the first large one
+loop_sweeper = LoopSweeper(repo=loops_repo, exchange_parser=exchange_parser)
+warm_up = (
+    WarmUp(repo=loops_repo, exchange_parser=exchange_parser, pool=pooled_repo).start()
+    if warmup_params['enabled'] else None
+)
+
+
+def collect_stats() -> list:
+    samples = stats_samples('okx_pool', pooled_repo.stats())
+    for cache, stats in loops_repo.stats().items():
+        samples += stats_samples('okx_cache', stats, {'cache': cache})
+    samples += stats_samples('okx_writer', write_behind_repo.stats())
+    samples += stats_samples('okx_coalesce', coalescing_repo.stats(), {'calls': 'repo'})
+    samples += stats_samples('okx_coalesce', okx_book_flights.stats(), {'calls': 'books'})
+    for path, stats in okx_scheduler.stats().items():
+        samples += stats_samples('okx_scheduler', stats, {'path': path}, key_label='priority')
+    if loop_scanner is not None:
+        samples += stats_samples('okx_scanner', loop_scanner.stats())
+        if loop_scanner.evaluator is not None:
+            samples += stats_samples('okx_incremental', loop_scanner.evaluator.stats())
+    return samples
+
+
+metrics.add_collector(collect_stats)
 
 
 def check_key_status(headers: dict) -> bool:
     key = headers.get('key')
-    return LoopsRepo().check_status(key) if key else False
+    return loops_repo.check_status(key) if key else False
+
+
+def evaluation_response(result, response_format: str, summary_only: bool):
+    """Dict to be sent as JSON, or a ready Response for the streamed and binary formats"""
+    if summary_only:
+        return response_formats.summary(result)
+    if response_format == 'ndjson':
+        # Rows are encoded while they are sent
+        return Response(response_formats.ndjson_lines(result), mimetype='application/x-ndjson')
+    if response_format == 'columnar':
+        return response_formats.columnar(result)
+    if response_format == 'columnar-binary':
+        return Response(response_formats.columnar_binary(result), mimetype='application/octet-stream')
+    response = response_formats.summary(result)
+    response['data'] = result.data if result else []
+    return response
 
 
 @app.route('/online-parser-okx', methods=['GET', ])
@@ -21,22 +129,86 @@ def parser():
     currency_name = headers.get('currency_name')
     profit = headers.get('profit')
     amount = headers.get('amount')
+    response_format = headers.get('format', 'json')
+    if response_format not in response_formats.FORMATS:
+        return jsonify({'status': 400, 'ok': False, 'message': f'unknown format {response_format}'})
+    try:
+        budget = parse_budget(headers.get('budget'))
+    except ValueError as error:
+        return jsonify({'status': 400, 'ok': False, 'message': str(error)})
 
     if loop_id:
-        result = OKXTradeOnlineParser().main(
-            loop_id=loop_id,
-            currency_name=currency_name,
-            profit=profit,
-            amount=amount
-        )
-        return jsonify({
-            'profit': result.profit,
-            'amount': result.amount,
-            'data': result.data
-        })
+        debug = bool(headers.get('debug'))
+        with metrics.request('/online-parser-okx', debug=debug) as trace:
+            result = OKXTradeOnlineParser(repo=loops_repo, exchange_parser=exchange_parser).evaluate(
+                loop_id=loop_id,
+                currency_name=currency_name,
+                profit=profit,
+                amount=amount,
+                deadline=Deadline(budget)
+            )
+            with metrics.span('response.build'):
+                response = evaluation_response(result, response_format, headers.get('summary_only'))
+        if isinstance(response, Response):
+            return response
+        if debug:
+            response['debug'] = trace.breakdown()
+        return jsonify(response)
     else:
         raise errors.GetLoopError(loop_id=f'{loop_id}')
 
 
+@app.route('/online-parser-okx/batch', methods=['GET', 'POST'])
+def batch_parser():
+    headers = request.json
+    if not check_key_status(headers):
+        return jsonify({'status': 300, 'ok': False, 'message': 'wrong private key'})
+    jobs = [
+        LoopJob(
+            loop_id=job.get('loop_id'),
+            currency_name=job.get('currency_name'),
+            profit=job.get('profit'),
+            amount=job.get('amount')
+        )
+        for job in headers.get('jobs', [])
+    ]
+    results = OKXBatchParser(repo=loops_repo, exchange_parser=exchange_parser).main(jobs)
+    return jsonify({'results': results})
+
+
+@app.route('/online-parser-okx/sweep', methods=['GET', 'POST'])
+def sweep_parser():
+    headers = request.json
+    if not check_key_status(headers):
+        return jsonify({'status': 300, 'ok': False, 'message': 'wrong private key'})
+    loop_id = headers.get('loop_id')
+    if not loop_id:
+        raise errors.GetLoopError(loop_id=f'{loop_id}')
+    base_coins = headers.get('currency_names') or [headers.get('currency_name')]
+    try:
+        if not isinstance(base_coins, list):
+            raise ValueError('currency_names must be a list')
+        amounts = parse_grid(headers.get('amounts'), 'amounts')
+        thresholds = parse_grid(headers.get('profits'), 'profits')
+        check_scenarios(base_coins, amounts, thresholds)
+    except ValueError as error:
+        return jsonify({'status': 400, 'ok': False, 'message': str(error)})
+    result = loop_sweeper.sweep(loop_id=loop_id, base_coins=base_coins, amounts=amounts, thresholds=thresholds)
+    return jsonify(result)
+
+
+@app.route('/ready', methods=['GET', ])
+def ready():
+    if warm_up is None:
+        return jsonify({'ready': True})
+    stats = warm_up.stats()
+    return jsonify(stats), 200 if stats.ready else 503
+
+
+@app.route('/metrics', methods=['GET', ])
+def metrics_endpoint():
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+
 if __name__ == "__main__":
     app.run(debug=True)
@@ -0,0 +1,14 @@
+-- Largest input of a loop still meeting the requested profit, found by the
+-- bisect solver at book prices. Kept apart from loop_info, whose spread and
+-- max_flow come from the depth walk at course rates; see MaxFlowRecord.
+create table if not exists loop_max_flow (
+    id serial primary key,
+    loop_id integer not null,
+    -- Loop profit at the book prices, in percent of the input
+    profit double precision not null,
+    -- Input in the base coin
+    amount double precision not null,
+    added timestamp not null
+);
+
+create index if not exists loop_max_flow_loop_id_added_idx on loop_max_flow (loop_id, added desc);
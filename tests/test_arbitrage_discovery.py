@@ -0,0 +1,79 @@
+import random
+import time
+
+import pytest
+
+from adapters.repositories.memory import InMemoryLoopsRepo
+from application.dataclasses.common import CourseEdge
+from application.services.arbitrage_discovery import ArbitrageDiscovery, CurrencyGraph, find_cycles
+from benchmarks.arbitrage_discovery import check, synthetic_edges
+
+
+def _edge(currency_from: str, currency_to: str, rate: float, platform: str = 'OKX', platform_to: str = None,
+          method: str = 'Trade', rule_id: int = 0) -> CourseEdge:
+    return CourseEdge(
+        method=method,
+        platform_from=platform,
+        platform_to=platform_to or platform,
+        currency_from=currency_from,
+        currency_to=currency_to,
+        rule_id=rule_id,
+        tax=0.1,
+        rate=rate
+    )
+
+
+def test_profitable_triangle_is_found_from_its_base_coin():
+    edges = [_edge('USDT', 'BTC', 1 / 30000), _edge('BTC', 'ETH', 15.0), _edge('ETH', 'USDT', 2020.0),
+             _edge('USDT', 'ETH', 1 / 2030)]
+    candidates = find_cycles(CurrencyGraph.from_edges(edges), base_coins=['USDT'])
+
+    assert len(candidates) == 1
+    assert [(step.currency_from, step.currency_to) for step in candidates[0].steps] == [
+        ('USDT', 'BTC'), ('BTC', 'ETH'), ('ETH', 'USDT')
+    ]
+    assert candidates[0].profit == pytest.approx((1 / 30000 * 15.0 * 2020.0 * 0.999 ** 3 - 1) * 100)
+
+
+def test_loops_do_not_mix_platforms_or_methods():
+    edges = [
+        _edge('USDT', 'BTC', 1 / 30000, platform='OKX'),
+        _edge('BTC', 'USDT', 30300.0, platform='Binance'),
+        _edge('BTC', 'USDT', 30300.0, platform='OKX', method='Transfer'),
+        _edge('BTC', 'USDT', 30300.0, platform='OKX', platform_to='Binance'),
+        _edge('USDT', 'ETH', 1 / 2000, platform='Binance'),
+        _edge('ETH', 'USDT', 2020.0, platform='Binance'),
+    ]
+    discovery = ArbitrageDiscovery(repo=InMemoryLoopsRepo(courses=edges, platforms={'OKX': 1, 'Binance': 2}))
+    candidates = discovery.find_loops()
+
+    assert len(candidates) == 1
+    assert {(step.platform_from, step.platform_to, step.method) for step in candidates[0].steps} == {
+        ('Binance', 'Binance', 'Trade')
+    }
+    assert discovery.find_loops(platform='OKX') == []
+
+
+def test_graph_of_mixed_markets_is_refused():
+    with pytest.raises(ValueError):
+        CurrencyGraph.from_edges([_edge('USDT', 'BTC', 1.0), _edge('BTC', 'USDT', 1.0, platform='Binance')])
+
+
+def test_every_loop_is_found_once_and_priced_right():
+    edges = synthetic_edges(random.Random(1), currencies=60, edges=1500, platforms=2)
+    candidates = [
+        candidate for graph in CurrencyGraph.markets(edges).values() for candidate in find_cycles(graph)
+    ]
+    assert candidates
+    loops = [frozenset((step.currency_from, step.rule_id) for step in candidate.steps) for candidate in candidates]
+    assert len(set(loops)) == len(loops)
+    for candidate in candidates:
+        check(edges, candidate)
+
+
+def test_tens_of_thousands_of_edges_are_searched_well_under_a_second():
+    graphs = CurrencyGraph.markets(synthetic_edges(random.Random(0), currencies=3000, edges=30000, platforms=1))
+    started = time.perf_counter()
+    for graph in graphs.values():
+        find_cycles(graph)
+    assert time.perf_counter() - started < 1.0
@@ -0,0 +1,50 @@
+import dataclasses
+
+import pytest
+
+from application.services.backtest import LoopBacktest
+from application.services.book_capture import BookRecorder, BookReplay
+from application.services.rate_matrix import RateMatrix
+from benchmarks.end_to_end import BASE_COIN, Seed
+from benchmarks.okx_stand_in import synthetic_book
+
+
+@pytest.fixture(scope='module')
+def seed():
+    return Seed(length=3, loops=1, reversed_share=0.5)
+
+
+@pytest.fixture
+def replay(seed, tmp_path):
+    recorder = BookRecorder(directory=str(tmp_path))
+    for ts in (1000, 2000, 3000):
+        for inst_id, price in seed.prices.items():
+            recorder.record(inst_id, synthetic_book(price, depth=10, seed=ts), ts=ts)
+    recorder.close()
+    replay = BookReplay(directory=str(tmp_path))
+    yield replay
+    replay.close()
+
+
+def _profits(backtest: LoopBacktest, **kwargs) -> list:
+    return [point.profit for point in backtest.run(loop_id=1, currency_name=BASE_COIN, profit=None, amount=1.0, **kwargs)]
+
+
+def test_courses_are_read_once_from_the_repository(seed, replay):
+    repo = seed.repo()
+    profits = _profits(LoopBacktest(replay, repo=repo))
+
+    assert len(profits) == 3 and None not in profits
+    assert repo.calls['get_courses_by_pairs'] == 1
+    assert repo.loop_infos == []
+
+
+def test_courses_of_the_captured_period_replace_the_current_ones(seed, replay):
+    repo = seed.repo()
+    current = _profits(LoopBacktest(replay, repo=repo))
+    # Courses are not part of the capture, so the past ones have to be passed in
+    past = RateMatrix([dataclasses.replace(course, rate=course.rate * 1.01) for course in seed.courses])
+    replayed = _profits(LoopBacktest(replay, repo=repo), rates=past)
+
+    assert repo.calls['get_courses_by_pairs'] == 1
+    assert replayed != current
@@ -0,0 +1,40 @@
+import glob
+import os
+
+import pytest
+
+from application.services.book_capture import BookRecorder, BookReplay
+from benchmarks.okx_stand_in import synthetic_book
+
+
+@pytest.fixture
+def capture(tmp_path):
+    recorder = BookRecorder(directory=str(tmp_path), flush_every=1)
+    for ts in (1000, 2000, 3000):
+        recorder.record('BTC-USDT', synthetic_book(30000.0, depth=5, seed=ts), ts=ts)
+    recorder.close()
+    return str(tmp_path)
+
+
+def _truncate(directory: str, size: int) -> None:
+    data_path, = glob.glob(os.path.join(directory, '*.okxb'))
+    with open(data_path, 'r+b') as data:
+        data.truncate(os.path.getsize(data_path) - size)
+
+
+def test_every_complete_record_is_replayed(capture):
+    replay = BookReplay(directory=capture)
+    assert replay.timestamps().tolist() == [1000, 2000, 3000]
+    assert replay.get_book('BTC-USDT')['asks'][0][0] == repr(30000.0)
+    replay.close()
+
+
+@pytest.mark.parametrize('missing', [1, 20, 200])
+def test_record_cut_short_on_disk_is_left_out(capture, missing):
+    # 20 bytes leave the header of the last record but not all its levels
+    _truncate(capture, missing)
+    replay = BookReplay(directory=capture)
+    assert replay.timestamps().tolist() == [1000, 2000]
+    replay.seek(3000)
+    assert replay.get_book('BTC-USDT')['ts'] == '2000'
+    replay.close()
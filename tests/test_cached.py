@@ -0,0 +1,150 @@
+import pytest
+
+from adapters.repositories.cached import CachedLoopsRepo, PgInvalidationListener
+from adapters.repositories.memory import InMemoryLoopsRepo
+from application.dataclasses.common import LoopInfo
+
+
+class Clock:
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def _step(currency_from: str, currency_to: str) -> LoopInfo:
+    return LoopInfo(
+        method='Trade',
+        platform_from='OKX',
+        platform_to='OKX',
+        currency_from=currency_from,
+        currency_to=currency_to,
+        rule_id=0,
+        tax=0.1
+    )
+
+
+@pytest.fixture
+def clock():
+    return Clock()
+
+
+@pytest.fixture
+def repo():
+    loops = {loop_id: [_step('USDT', 'BTC'), _step('BTC', 'USDT')] for loop_id in range(1, 5)}
+    return InMemoryLoopsRepo(loops=loops, keys={'active': 2, 'blocked': 1})
+
+
+@pytest.fixture
+def cached(repo, clock):
+    return CachedLoopsRepo(
+        repo,
+        method_ttl=300.0,
+        platform_ttl=300.0,
+        loop_ttl=600.0,
+        client_ttl=60.0,
+        negative_ttl=10.0,
+        loop_maxsize=2,
+        client_maxsize=10,
+        clock=clock
+    )
+
+
+def test_entries_are_served_from_the_cache_until_their_ttl(cached, repo, clock):
+    for _ in range(3):
+        assert cached.get_method_info('Trade').method_id == 1
+        assert cached.check_status('active')
+    assert repo.calls['get_method_info'] == 1
+    assert repo.calls['check_status'] == 1
+
+    clock.now = 61.0
+    assert cached.check_status('active')
+    assert cached.get_method_info('Trade').method_id == 1
+    assert repo.calls['check_status'] == 2
+    assert repo.calls['get_method_info'] == 1
+
+    stats = cached.stats()
+    assert (stats['methods'].hits, stats['methods'].misses) == (3, 1)
+    assert (stats['clients'].hits, stats['clients'].misses) == (2, 2)
+
+
+def test_unknown_values_are_cached_for_the_negative_ttl(cached, repo, clock):
+    assert cached.get_platform_info('NOPE') is None
+    assert not cached.check_status('unknown')
+    assert cached.get_platform_info('NOPE') is None
+    assert not cached.check_status('unknown')
+    assert repo.calls['get_platform_info'] == 1
+    assert repo.calls['check_status'] == 1
+
+    clock.now = 10.5
+    repo.platforms['NOPE'] = 7
+    assert cached.get_platform_info('NOPE').platform_id == 7
+    assert repo.calls['get_platform_info'] == 2
+
+
+def test_loop_paths_are_bounded_least_recently_used_first(cached, repo):
+    cached.get_loop_by_id(1)
+    cached.get_loop_by_id(2)
+    cached.get_loop_by_id(1)
+    cached.get_loop_by_id(3)
+    assert repo.calls['get_loop_by_id'] == 3
+
+    cached.get_loop_by_id(1)
+    assert repo.calls['get_loop_by_id'] == 3
+    cached.get_loop_by_id(2)
+    assert repo.calls['get_loop_by_id'] == 4
+    assert cached.stats()['loops'].size == 2
+
+
+def test_callers_reordering_steps_do_not_change_the_cached_loop(cached):
+    loop_info = cached.get_loop_by_id(1)
+    loop_info.insert(0, loop_info.pop())
+    assert cached.get_loop_by_id(1)[0].currency_from == 'USDT'
+
+
+def test_invalidation_hooks_drop_entries(cached, repo):
+    cached.get_loop_by_id(1)
+    cached.check_status('active')
+    cached.get_method_info('Trade')
+
+    cached.invalidate_loop(1)
+    cached.get_loop_by_id(1)
+    assert repo.calls['get_loop_by_id'] == 2
+
+    repo.keys['active'] = 1
+    cached.invalidate_client('active')
+    assert not cached.check_status('active')
+
+    cached.invalidate_all()
+    cached.get_method_info('Trade')
+    cached.get_loop_by_id(1)
+    assert repo.calls['get_method_info'] == 2
+    assert repo.calls['get_loop_by_id'] == 3
+
+
+@pytest.mark.parametrize('payload, reloaded', [
+    ('loop:1', {'get_loop_by_id'}),
+    ('loop:*', {'get_loop_by_id'}),
+    ('client:active', {'check_status'}),
+    ('method:Trade', {'get_method_info'}),
+    ('platform:OKX', {'get_platform_info'}),
+    ('all', {'get_loop_by_id', 'check_status', 'get_method_info', 'get_platform_info'}),
+    ('loop:2', set()),
+    # Malformed payloads are logged and skipped, the listener keeps running
+    ('loop:abc', set()),
+    ('loops:1', set()),
+])
+def test_notifications_invalidate_the_named_entries(cached, repo, payload, reloaded):
+    def load() -> None:
+        cached.get_loop_by_id(1)
+        cached.check_status('active')
+        cached.get_method_info('Trade')
+        cached.get_platform_info('OKX')
+
+    load()
+    before = dict(repo.calls)
+    PgInvalidationListener(cached).handle(payload)
+    load()
+    assert {name for name, count in repo.calls.items() if count > before.get(name, 0)} == reloaded
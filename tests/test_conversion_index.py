@@ -0,0 +1,49 @@
+import pytest
+
+from application.dataclasses.common import CourseEdge
+from application.services.conversion_index import build_conversions
+
+
+def _edge(currency_from: str, currency_to: str, rate: float, platform: str = 'OKX', platform_to: str = None,
+          method: str = 'Trade') -> CourseEdge:
+    return CourseEdge(
+        method=method,
+        platform_from=platform,
+        platform_to=platform_to or platform,
+        currency_from=currency_from,
+        currency_to=currency_to,
+        rule_id=0,
+        tax=0.0,
+        rate=rate
+    )
+
+
+def test_listed_course_wins_over_any_route():
+    table = build_conversions(
+        [_edge('ETH', 'USDT', 2000.0), _edge('ETH', 'BTC', 0.07), _edge('BTC', 'USDT', 30000.0)],
+        base_coins=['USDT'], max_hops=3
+    )
+    assert table[('OKX', 'Trade', 'ETH', 'USDT')].rate == 2000.0
+
+
+def test_route_around_a_profitable_cycle_visits_every_currency_once():
+    # The best walk from X turns once around Y -> Z -> Y; the best route goes on from Z
+    edges = [
+        _edge('X', 'Y', 1.0), _edge('Y', 'Z', 10.0), _edge('Z', 'Y', 10.0),
+        _edge('Y', 'USDT', 1.0), _edge('Z', 'USDT', 0.5),
+    ]
+    table = build_conversions(edges, base_coins=['USDT'], max_hops=4)
+    assert table[('OKX', 'Trade', 'X', 'USDT')].rate == pytest.approx(5.0)
+
+
+def test_routes_stay_on_one_platform_and_method():
+    edges = [
+        _edge('ETH', 'BTC', 0.07, platform='OKX'),
+        _edge('BTC', 'USDT', 30000.0, platform='OKX', platform_to='Binance'),
+        _edge('BTC', 'USDT', 30000.0, platform='Binance'),
+        _edge('ETH', 'USDT', 2000.0, method='Transfer'),
+    ]
+    table = build_conversions(edges, base_coins=['USDT'], max_hops=3)
+    assert ('OKX', 'Trade', 'ETH', 'USDT') not in table
+    assert ('OKX', 'Trade', 'BTC', 'USDT') not in table
+    assert set(table) == {('Binance', 'Trade', 'BTC', 'USDT'), ('OKX', 'Transfer', 'ETH', 'USDT')}
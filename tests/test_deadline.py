@@ -0,0 +1,52 @@
+import pytest
+
+from application.services.deadline import Deadline, parse_budget
+
+
+class Clock:
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.mark.parametrize('value, budget', [
+    (None, 3.0),
+    (1.5, 1.5),
+    ('0.25', 0.25),
+    (2, 2.0),
+    (0, 0.05),
+    (-1, 0.05),
+    (1e9, 30.0),
+    ('inf', 30.0),
+])
+def test_budget_is_clamped(value, budget):
+    assert parse_budget(value, default=3.0, min_budget=0.05, max_budget=30.0) == budget
+
+
+@pytest.mark.parametrize('value', ['fast', 'nan', [], {}, True])
+def test_budget_that_is_no_number_is_rejected(value):
+    with pytest.raises(ValueError, match='budget'):
+        parse_budget(value)
+
+
+def test_deadline_stays_missed_once_expired():
+    clock = Clock()
+    deadline = Deadline(1.0, clock=clock)
+    assert deadline.remaining() == 1.0 and not deadline.expired
+    clock.now = 1.5
+    assert deadline.remaining() == 0.0 and deadline.expired
+    clock.now = 0.5
+    assert deadline.missed
+
+
+def test_timeout_is_cut_to_the_time_left():
+    clock = Clock()
+    deadline = Deadline(1.0, clock=clock)
+    assert deadline.timeout(5.0) == 1.0
+    assert deadline.timeout(0.5) == 0.5
+    clock.now = 2.0
+    assert deadline.timeout(5.0) == Deadline.MIN_TIMEOUT
+    assert Deadline(None).timeout(5.0) == 5.0
@@ -0,0 +1,39 @@
+import random
+
+import numpy as np
+import pytest
+
+from application.services.depth_walk import loop_output
+from benchmarks.depth_walk import _NoSaveParser, numpy_walk, python_walk, synthetic_book, synthetic_loop
+
+
+@pytest.fixture(scope='module')
+def parser():
+    return _NoSaveParser()
+
+
+@pytest.mark.parametrize('seed', range(20))
+def test_numpy_walk_matches_the_level_walk(parser, seed):
+    rnd = random.Random(seed)
+    for _ in range(25):
+        loop_info, rates = synthetic_loop(rnd)
+        orders = synthetic_book(rnd, rnd.randint(0, 200))
+        # A threshold equal to some level's profit exercises the exact-match branch
+        exact = [
+            float((loop_output(loop_info, rates, np.array([order.total_amount]), 'USDT')[0]
+                   - order.total_amount) / 100)
+            for order in orders[3:4]
+        ]
+        profit = rnd.choice([None, 0.01, 0.1, 1.0] + exact)
+        amount = rnd.choice([None, 50.0, 500.0, 5000.0])
+
+        expected = python_walk(parser, loop_info, orders, rates, profit, amount)
+        assert numpy_walk(loop_info, orders, rates, profit, amount) == expected
+
+
+@pytest.mark.parametrize('profit, amount', [(0.01, None), (None, 500.0)])
+def test_empty_book_gives_no_result_in_both_walks(parser, profit, amount):
+    loop_info, rates = synthetic_loop(random.Random(0))
+    assert numpy_walk(loop_info, [], rates, profit, amount) == python_walk(
+        parser, loop_info, [], rates, profit, amount
+    )
@@ -0,0 +1,173 @@
+import json
+import threading
+from concurrent.futures import Future
+from types import SimpleNamespace
+
+from adapters.repositories.memory import InMemoryLoopsRepo
+from application.dataclasses.common import LoopInfo
+from application.services.loop_scanner import LoopScanner, ScheduledLoop
+from application.services.okx_book_stream import OKXBookStream
+from application.services.okx_parser import OKXExchangeParser, create_session
+from application.services.okx_scheduler import OKXRequestScheduler
+from benchmarks.end_to_end import Seed
+from benchmarks.okx_stand_in import OKXStandIn, synthetic_book
+
+
+class Clock:
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def _done(profit) -> Future:
+    future = Future()
+    future.set_result(SimpleNamespace(profit=profit) if profit is not None else None)
+    return future
+
+
+def _scanner() -> LoopScanner:
+    return LoopScanner(repo=InMemoryLoopsRepo(), min_interval=1.0, max_interval=8.0, profit=1e-9, clock=Clock())
+
+
+def test_losing_loop_backs_off():
+    scanner = _scanner()
+    loop = ScheduledLoop(loop_id=1, due=0.0, interval=1.0)
+    scanner._schedule(loop)
+    for interval in (2.0, 4.0, 8.0, 8.0):
+        scanner._reschedule(loop, _done(-0.0528))
+        assert loop.interval == interval
+    assert loop.last_profit == -0.0528
+    assert scanner.stats().profitable == 0
+
+
+def test_profitable_loop_stays_hot_until_one_evaluation_after_it_stops():
+    scanner = _scanner()
+    loop = ScheduledLoop(loop_id=1, due=0.0, interval=4.0)
+    scanner._schedule(loop)
+    scanner._reschedule(loop, _done(0.3))
+    assert loop.interval == 1.0
+    assert scanner.stats().profitable == 1
+
+    scanner._reschedule(loop, _done(-0.1))
+    assert loop.interval == 1.0
+    assert scanner.stats().profitable == 0
+    scanner._reschedule(loop, _done(None))
+    assert loop.interval == 2.0
+
+
+def test_losing_loop_moving_fast_comes_back_sooner():
+    scanner = _scanner()
+    scanner.volatility = 0.05
+    loop = ScheduledLoop(loop_id=1, due=0.0, interval=1.0)
+    scanner._schedule(loop)
+    for profit in (-0.5, -0.5, -0.5):
+        scanner._reschedule(loop, _done(profit))
+    assert loop.interval == 8.0
+
+    for profit, interval in ((-0.3, 4.0), (-0.2, 2.0), (-0.19, 4.0), (-0.05, 2.0), (0.2, 1.0)):
+        scanner._reschedule(loop, _done(profit))
+        assert loop.interval == interval
+        assert scanner.clock.now + interval == loop.due
+
+
+def test_failed_evaluation_counts_and_backs_off():
+    scanner = _scanner()
+    loop = ScheduledLoop(loop_id=1, due=0.0, interval=1.0)
+    future = Future()
+    future.set_exception(ConnectionError('connection reset'))
+    scanner._reschedule(loop, future)
+    assert loop.interval == 2.0
+    assert scanner.stats().failed == 1
+
+
+def test_cycle_error_does_not_stop_the_thread():
+    scanner = _scanner()
+    cycles = []
+    finished = threading.Event()
+
+    def run_cycle() -> int:
+        cycles.append(len(cycles))
+        if len(cycles) == 1:
+            raise OSError('server closed the connection unexpectedly')
+        scanner._stopped.set()
+        finished.set()
+        return 0
+
+    scanner.run_cycle = run_cycle
+    scanner.min_interval = 0.0
+    scanner.start()
+    assert finished.wait(5.0)
+    scanner.stop()
+    assert len(cycles) == 2
+
+
+def test_new_loops_are_subscribed_on_the_book_stream():
+    steps = [('USDT', 'BTC'), ('BTC', 'ETH'), ('ETH', 'USDT')]
+    loop_info = [
+        LoopInfo(method='Trade', platform_from='OKX', platform_to='OKX', currency_from=currency_from,
+                 currency_to=currency_to, rule_id=rule_id, tax=0.1)
+        for rule_id, (currency_from, currency_to) in enumerate(steps)
+    ]
+    stream = OKXBookStream()
+    scanner = LoopScanner(repo=InMemoryLoopsRepo(loops={1: loop_info}), book_stream=stream, clock=Clock())
+    scanner.refresh()
+    assert stream.instruments == {
+        'USDT-BTC', 'BTC-USDT', 'BTC-ETH', 'ETH-BTC', 'ETH-USDT', 'USDT-ETH'
+    }
+
+    scanner.refresh()
+    assert scanner.repo.calls['get_loop_by_id'] == 1
+
+
+def test_only_loops_reading_a_changed_book_are_re_evaluated():
+    seed = Seed(length=3, loops=6, reversed_share=0.5)
+    repo = seed.repo()
+    stream = OKXBookStream()
+    with OKXStandIn(prices=seed.prices, depth=10) as stand_in:
+        session = create_session()
+        exchange_parser = OKXExchangeParser(
+            repo=repo,
+            base_url=stand_in.base_url,
+            session=session,
+            scheduler=OKXRequestScheduler(session, limits={}),
+            listed={}
+        )
+        clock = Clock()
+        scanner = LoopScanner(
+            repo=repo, exchange_parser=exchange_parser, book_stream=stream, workers=2, cycle_budget=60.0, clock=clock
+        )
+        # Loops evaluated from the tracked books are not evaluated over REST in the same cycle
+        assert scanner.run_cycle() == len(seed.loops)
+        assert scanner.evaluator.stats().loops_evaluated == len(seed.loops)
+
+        inst_id = min(
+            seed.prices,
+            key=lambda inst: sum(
+                1 for loop_info in seed.loops.values()
+                if any({loop.currency_from, loop.currency_to} == set(inst.split('-')) for loop in loop_info)
+            )
+        )
+        marked = {
+            loop_id for loop_id, loop_info in seed.loops.items()
+            if any({loop.currency_from, loop.currency_to} == set(inst_id.split('-')) for loop in loop_info)
+        }
+        assert 0 < len(marked) < len(seed.loops)
+        stream.handle_message(json.dumps({
+            'arg': {'channel': 'books', 'instId': inst_id},
+            'action': 'snapshot',
+            'data': [synthetic_book(seed.prices[inst_id] * 1.01, depth=10)]
+        }))
+        requests = len(stand_in.requests)
+        saved = len(repo.loop_infos)
+        due = {loop_id: loop.due for loop_id, loop in scanner._loops.items()}
+        clock.now = 0.5
+
+        # Nothing is due yet, so only the marked loops are evaluated, from the streamed book
+        assert scanner.run_cycle() == len(marked)
+        assert scanner.evaluator.stats().loops_evaluated == len(seed.loops) + len(marked)
+        assert len(stand_in.requests) == requests
+        assert len(repo.loop_infos) - saved <= len(marked)
+        assert {loop_id for loop_id, loop in scanner._loops.items() if loop.due != due[loop_id]} == marked
@@ -0,0 +1,32 @@
+import asyncio
+
+from adapters.repositories.memory import AsyncInMemoryLoopsRepo, InMemoryLoopsRepo
+from application.dataclasses.common import CourseEdge
+
+
+def _repo() -> InMemoryLoopsRepo:
+    course = CourseEdge(
+        method='Trade',
+        platform_from='OKX',
+        platform_to='OKX',
+        currency_from='BTC',
+        currency_to='USDT',
+        rule_id=0,
+        tax=0.1,
+        rate=30000.0
+    )
+    return InMemoryLoopsRepo(courses=[course])
+
+
+def test_course_is_keyed_like_a_database_row():
+    repo = _repo()
+    course = repo.get_curses_by_currency_name('BTC', 'USDT', platform_id=1, method_id=1)
+    assert (course['rate'], course['tax']) == (30000.0, 0.1)
+    assert repo.get_curses_by_currency_name('USDT', 'BTC', platform_id=1, method_id=1) is None
+
+
+def test_async_course_is_keyed_like_a_database_row():
+    course = asyncio.run(
+        AsyncInMemoryLoopsRepo(_repo()).get_curses_by_currency_name('BTC', 'USDT', platform_id=1, method_id=1)
+    )
+    assert course == {'rate': 30000.0, 'tax': 0.1}
@@ -0,0 +1,35 @@
+from adapters.repositories.memory import InMemoryLoopsRepo
+from adapters.repositories.write_behind import LoopInfoWriter
+from application.dataclasses.common import CacheStats, SchedulerStats
+from application.services.metrics import Metrics, stats_samples
+
+
+def test_collected_stats_are_rendered_as_gauges():
+    writer = LoopInfoWriter(InMemoryLoopsRepo(), flush_interval=60.0)
+    metrics = Metrics(enabled=False)
+    metrics.add_collector(lambda: stats_samples('okx_writer', writer.stats()))
+    metrics.add_collector(lambda: stats_samples('okx_cache', CacheStats(hits=3, misses=1, size=2), {'cache': 'loops'}))
+    metrics.add_collector(lambda: stats_samples(
+        'okx_scheduler',
+        SchedulerStats(sent=4, retried=0, queued=1, wait_p50={'interactive': 0.005}, wait_p99={'background': float('inf')}),
+        {'path': '/books'},
+        key_label='priority'
+    ))
+    lines = metrics.render().splitlines()
+    writer.close()
+
+    assert '# TYPE okx_cache_hits gauge' in lines
+    assert 'okx_cache_hits{cache="loops"} 3' in lines
+    assert 'okx_writer_pending 0' in lines
+    assert 'okx_scheduler_queued{path="/books"} 1' in lines
+    assert 'okx_scheduler_wait_p50{path="/books",priority="interactive"} 0.005' in lines
+    assert 'okx_scheduler_wait_p99{path="/books",priority="background"} +Inf' in lines
+
+
+def test_collectors_are_read_on_every_render():
+    stats = CacheStats(hits=0, misses=0, size=0)
+    metrics = Metrics(enabled=False)
+    metrics.add_collector(lambda: stats_samples('okx_cache', stats))
+    assert 'okx_cache_hits 0' in metrics.render().splitlines()
+    stats.hits = 5
+    assert 'okx_cache_hits 5' in metrics.render().splitlines()
@@ -0,0 +1,96 @@
+import copy
+import json
+import threading
+
+import pytest
+
+from application.services.okx_book_stream import OKXBookStream
+from benchmarks.okx_ws_stand_in import generate_messages
+
+
+def test_concurrent_subscriptions_keep_every_instrument():
+    stream = OKXBookStream()
+    threads = [
+        threading.Thread(target=stream.subscribe, args=([f'C{number:03d}-USDT' for number in range(first, 400, 4)],))
+        for first in range(4)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(stream.instruments) == 400
+
+
+def test_rejected_instruments_are_not_subscribed_again():
+    stream = OKXBookStream()
+    stream.subscribe(['BTC-USDT', 'USDT-BTC'])
+    # Like OKX, the error event names the instrument only in its message
+    stream.handle_message(json.dumps({
+        'event': 'error', 'code': '60018', 'msg': "Wrong URL or channel:books,instId:USDT-BTC doesn't exist."
+    }))
+    stream.subscribe(['BTC-USDT', 'USDT-BTC'])
+    assert stream.get_book('USDT-BTC') is None
+    assert stream.instruments == {'BTC-USDT'}
+    assert stream.unknown_instruments == {'USDT-BTC'}
+
+
+class FakeSocket:
+
+    def __init__(self):
+        self.sent = []
+
+    def send(self, raw: str) -> None:
+        request = json.loads(raw)
+        self.sent.append((request['op'], [arg['instId'] for arg in request['args']]))
+
+
+@pytest.fixture
+def stream():
+    stream = OKXBookStream(max_age=None)
+    stream._ws = FakeSocket()
+    stream._connected.set()
+    return stream
+
+
+@pytest.fixture(scope='module')
+def messages():
+    return generate_messages('BTC-USDT', 30000.0, updates=3, depth=30)
+
+
+def test_snapshot_and_updates_build_the_book(stream, messages):
+    snapshot, update = messages[:2]
+    stream.handle_message(json.dumps(snapshot))
+    assert stream.get_book('BTC-USDT')['asks'][0] == snapshot['data'][0]['asks'][0]
+
+    stream.handle_message(json.dumps(update))
+    book = stream.books['BTC-USDT']
+    assert book.seq_id == update['data'][0]['seqId']
+    assert book.checksum() == update['data'][0]['checksum']
+    assert stream.resyncs == 0 and stream._ws.sent == []
+
+
+def test_update_out_of_sequence_resubscribes(stream, messages):
+    snapshot, update = messages[0], copy.deepcopy(messages[1])
+    update['data'][0]['prevSeqId'] += 5
+    stream.handle_message(json.dumps(snapshot))
+    stream.handle_message(json.dumps(update))
+
+    assert 'BTC-USDT' not in stream.books
+    assert stream.resyncs == 1
+    assert stream._ws.sent == [('unsubscribe', ['BTC-USDT']), ('subscribe', ['BTC-USDT'])]
+
+
+def test_update_with_wrong_checksum_resubscribes(stream, messages):
+    snapshot, update = messages[0], copy.deepcopy(messages[1])
+    update['data'][0]['checksum'] += 1
+    stream.handle_message(json.dumps(snapshot))
+    stream.handle_message(json.dumps(update))
+
+    assert 'BTC-USDT' not in stream.books
+    assert stream.resyncs == 1
+    assert stream._ws.sent == [('unsubscribe', ['BTC-USDT']), ('subscribe', ['BTC-USDT'])]
+    # Updates before the new snapshot are ignored, the snapshot starts over
+    stream.handle_message(json.dumps(messages[2]))
+    assert 'BTC-USDT' not in stream.books
+    stream.handle_message(json.dumps(snapshot))
+    assert stream.books['BTC-USDT'].checksum() == snapshot['data'][0]['checksum']
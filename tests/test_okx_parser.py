@@ -0,0 +1,97 @@
+import time
+
+import pytest
+
+from application import errors
+from application.dataclasses.common import LoopInfo
+from application.services.okx_parser import OKXExchangeParser, create_session
+from application.services.okx_scheduler import OKXRequestScheduler
+from benchmarks.okx_stand_in import OKXStandIn
+
+PRICES = {'BTC-USDT': 30000.0, 'ETH-USDT': 2000.0, 'ETH-BTC': 0.0667}
+
+
+def _step(currency_from: str, currency_to: str) -> LoopInfo:
+    return LoopInfo(
+        method='Trade',
+        platform_from='OKX',
+        platform_to='OKX',
+        currency_from=currency_from,
+        currency_to=currency_to,
+        rule_id=0,
+        tax=0.1
+    )
+
+
+LOOP = [_step('USDT', 'BTC'), _step('BTC', 'ETH'), _step('ETH', 'USDT')]
+
+
+@pytest.fixture
+def stand_in():
+    with OKXStandIn(prices=PRICES, depth=5) as stand_in:
+        yield stand_in
+
+
+def _parser(stand_in: OKXStandIn) -> OKXExchangeParser:
+    session = create_session()
+    return OKXExchangeParser(
+        base_url=stand_in.base_url,
+        session=session,
+        scheduler=OKXRequestScheduler(session, limits={}),
+        listed={}
+    )
+
+
+def test_unlisted_direction_is_requested_only_once(stand_in):
+    parser = _parser(stand_in)
+    first = parser.fetch_books(LOOP)
+    assert len(stand_in.requests) == 6
+    assert sorted(inst_id for inst_id, book in first.items() if book) == sorted(PRICES)
+
+    stand_in.requests.clear()
+    second = parser.fetch_books(LOOP)
+    assert sorted(stand_in.requests) == sorted(PRICES)
+    assert sorted(second) == sorted(PRICES)
+    assert len(parser.get_leg_books(list(LOOP), 'USDT', second)) == len(LOOP)
+
+
+def test_delisted_instrument_is_probed_both_ways_again(stand_in):
+    parser = _parser(stand_in)
+    parser.fetch_books(LOOP)
+    stand_in.books.pop('ETH-BTC')
+    with pytest.raises(errors.GetOrdersBookError):
+        parser.get_leg_books(list(LOOP), 'USDT', parser.fetch_books(LOOP))
+
+    stand_in.requests.clear()
+    parser.fetch_books(LOOP)
+    assert sorted(stand_in.requests) == sorted(['BTC-USDT', 'ETH-USDT', 'BTC-ETH', 'ETH-BTC'])
+
+
+def test_legs_are_fetched_concurrently():
+    latency = 0.2
+    with OKXStandIn(prices=PRICES, depth=5, latency=latency) as stand_in:
+        parser = _parser(stand_in)
+        started = time.perf_counter()
+        books = parser.fetch_books(LOOP)
+        elapsed = time.perf_counter() - started
+
+    # Six probes each sleeping `latency`, answered in about one round trip
+    assert len(stand_in.requests) == 6
+    assert sorted(inst_id for inst_id, book in books.items() if book) == sorted(PRICES)
+    assert elapsed < 3 * latency
+
+
+def test_slow_book_fails_on_the_call_timeout():
+    with OKXStandIn(prices=PRICES, depth=5, latency=0.5) as stand_in:
+        session = create_session()
+        parser = OKXExchangeParser(
+            base_url=stand_in.base_url,
+            session=session,
+            scheduler=OKXRequestScheduler(session, limits={}),
+            timeout=0.05,
+            listed={}
+        )
+        started = time.perf_counter()
+        with pytest.raises(errors.GetOrdersBookError):
+            parser.fetch_books(LOOP)
+        assert time.perf_counter() - started < 0.5
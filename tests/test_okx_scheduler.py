@@ -0,0 +1,85 @@
+import threading
+import time
+from typing import List, Tuple
+
+from application.dataclasses.constants import RequestPriority
+from application.services.okx_scheduler import OKXRequestScheduler
+
+PATH = '/api/v5/market/books-lite'
+
+
+class FakeResponse:
+    status_code = 200
+    headers: dict = {}
+
+
+class FakeSession:
+    """Records when each request is sent and with which params"""
+
+    def __init__(self):
+        self.sent: List[Tuple[float, dict]] = []
+        self._lock = threading.Lock()
+
+    def get(self, url, params=None, timeout=None):
+        with self._lock:
+            self.sent.append((time.monotonic(), params))
+        return FakeResponse()
+
+
+def _get(scheduler: OKXRequestScheduler, name: str, priority: RequestPriority) -> threading.Thread:
+    thread = threading.Thread(
+        target=scheduler.get, args=(f'http://okx{PATH}', PATH), kwargs={'params': {'name': name}, 'priority': priority}
+    )
+    thread.start()
+    return thread
+
+
+def _wait_queued(scheduler: OKXRequestScheduler, count: int) -> None:
+    endpoint = scheduler.endpoints[PATH]
+    deadline = time.monotonic() + 5.0
+    while True:
+        with endpoint.condition:
+            if len(endpoint.waiting) >= count:
+                return
+        assert time.monotonic() < deadline
+        time.sleep(0.001)
+
+
+def test_requests_stay_within_the_limit():
+    session = FakeSession()
+    count, seconds = 10, 0.5
+    scheduler = OKXRequestScheduler(session, limits={PATH: (count, seconds)}, headroom=1.0)
+    threads = [_get(scheduler, str(number), RequestPriority.interactive) for number in range(30)]
+    for thread in threads:
+        thread.join()
+
+    sent = sorted(at for at, _ in session.sent)
+    assert len(sent) == 30
+    # A bucket holding one token lets at most count + 1 requests through in any window
+    for number, started in enumerate(sent):
+        in_window = sum(1 for at in sent[number:] if at - started < seconds)
+        assert in_window <= count + 1
+    assert scheduler.stats()[PATH].sent == 30
+
+
+def test_interactive_requests_overtake_queued_background_ones():
+    session = FakeSession()
+    scheduler = OKXRequestScheduler(session, limits={PATH: (10, 1.0)}, headroom=1.0)
+    # Takes the only token, so the next requests queue
+    scheduler.get(f'http://okx{PATH}', PATH, params={'name': 'first'})
+    threads = []
+    for number in range(3):
+        threads.append(_get(scheduler, f'background-{number}', RequestPriority.background))
+        _wait_queued(scheduler, number + 1)
+    threads.append(_get(scheduler, 'interactive', RequestPriority.interactive))
+    for thread in threads:
+        thread.join()
+
+    order = [params['name'] for _, params in session.sent]
+    assert order[0] == 'first'
+    # The head of the queue may already hold the next token
+    assert order.index('interactive') <= 2
+    assert order.index('interactive') < order.index('background-2')
+    assert [name for name in order if name.startswith('background')] == [
+        'background-0', 'background-1', 'background-2'
+    ]
@@ -0,0 +1,108 @@
+import time
+
+import pytest
+
+from application.services.deadline import Deadline
+from application.services.okx_parser import OKXExchangeParser, create_session
+from application.services.okx_scheduler import OKXRequestScheduler
+from application.services.okx_services import OKXTradeOnlineParser
+from benchmarks.end_to_end import BASE_COIN, Seed
+from benchmarks.okx_stand_in import OKXStandIn
+
+
+@pytest.fixture(scope='module')
+def seed():
+    return Seed(length=3, loops=5, reversed_share=0.5)
+
+
+@pytest.fixture(scope='module')
+def stand_in(seed):
+    with OKXStandIn(prices=seed.prices, depth=20) as stand_in:
+        yield stand_in
+
+
+def _service(repo, stand_in: OKXStandIn, solver: str) -> OKXTradeOnlineParser:
+    session = create_session()
+    return OKXTradeOnlineParser(
+        repo=repo,
+        exchange_parser=OKXExchangeParser(
+            repo=repo,
+            base_url=stand_in.base_url,
+            session=session,
+            scheduler=OKXRequestScheduler(session, limits={})
+        ),
+        solver=solver
+    )
+
+
+def test_depth_walk_results_go_to_loop_info(seed, stand_in):
+    repo = seed.repo()
+    service = _service(repo, stand_in, 'depth')
+    evaluation = service.evaluate(loop_id=1, currency_name=BASE_COIN, profit=None, amount=50.0)
+
+    assert evaluation.solver == 'depth'
+    assert [(record.spread, record.max_flow) for record in repo.loop_infos] == [(evaluation.profit, evaluation.amount)]
+    assert repo.max_flows == []
+
+
+def test_bisect_results_are_kept_apart_from_loop_info(seed, stand_in):
+    repo = seed.repo()
+    service = _service(repo, stand_in, 'bisect')
+    evaluation = service.evaluate(loop_id=1, currency_name=BASE_COIN, profit=-100.0, amount=None)
+
+    assert evaluation.solver == 'bisect'
+    assert repo.loop_infos == []
+    assert [(record.loop_id, record.profit, record.amount) for record in repo.max_flows] == [
+        (1, evaluation.profit, evaluation.amount)
+    ]
+
+
+@pytest.mark.parametrize('engine', ['numpy', 'python'])
+def test_courses_are_loaded_once_per_evaluation(seed, stand_in, engine):
+    repo = seed.repo()
+    service = _service(repo, stand_in, 'depth')
+    service.engine = engine
+    for loop_id in (1, 2):
+        service.evaluate(loop_id=loop_id, currency_name=BASE_COIN, profit=None, amount=50.0)
+
+    # The walk reads every level's rates from one snapshot, not from the repo
+    assert repo.calls['get_courses_by_pairs'] == 2
+    assert repo.calls['get_curses_by_currency_name'] == 0
+
+
+def test_expired_deadline_gives_stale_evaluation_without_lookups(seed, stand_in):
+    repo = seed.repo()
+    service = _service(repo, stand_in, 'depth')
+    requests = len(stand_in.requests)
+    evaluation = service.evaluate(
+        loop_id=1, currency_name=BASE_COIN, profit=None, amount=50.0, deadline=Deadline(0.0)
+    )
+
+    assert evaluation.stale and evaluation.loop_profit is None
+    assert len(stand_in.requests) == requests
+    assert repo.calls['get_courses_by_pairs'] == 0
+    assert repo.loop_infos == []
+
+
+def test_slow_books_give_stale_evaluation_within_budget(seed):
+    repo = seed.repo()
+    with OKXStandIn(prices=seed.prices, depth=20, latency=1.0) as slow:
+        service = _service(repo, slow, 'depth')
+        started = time.monotonic()
+        evaluation = service.evaluate(
+            loop_id=1, currency_name=BASE_COIN, profit=None, amount=50.0, deadline=Deadline(0.2)
+        )
+        assert time.monotonic() - started < 0.8
+        assert evaluation.stale and evaluation.loop_profit is None
+        # Requests cut short by that budget are not what a longer one waits for
+        evaluation = service.evaluate(
+            loop_id=1, currency_name=BASE_COIN, profit=None, amount=50.0, deadline=Deadline(5.0)
+        )
+    assert not evaluation.stale and evaluation.loop_profit is not None
+
+
+def test_bisect_without_any_input_meeting_the_profit_saves_nothing(seed, stand_in):
+    repo = seed.repo()
+    service = _service(repo, stand_in, 'bisect')
+    assert service.evaluate(loop_id=1, currency_name=BASE_COIN, profit=1000.0, amount=None) is None
+    assert repo.max_flows == [] and repo.loop_infos == []
@@ -0,0 +1,113 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import psycopg2
+import pytest
+
+from adapters.repositories import pooled
+from adapters.repositories.pooled import PREPARED_STATEMENTS, PooledLoopsRepo
+
+
+class FakeCursor:
+
+    def __init__(self, conn):
+        self.conn = conn
+
+    def execute(self, statement, params=None):
+        if statement.startswith('prepare') and self.conn.fail_prepare == len(self.conn.prepared):
+            raise psycopg2.ProgrammingError('relation "loop_path" does not exist')
+        if statement.startswith('prepare'):
+            self.conn.prepared.add(statement.split()[1])
+        elif statement.startswith('execute'):
+            name = statement.split()[1]
+            if name not in self.conn.prepared:
+                raise psycopg2.ProgrammingError(f'prepared statement "{name}" does not exist')
+
+    def fetchall(self):
+        return [(2,)]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        pass
+
+
+class FakeConnection:
+
+    def __init__(self):
+        self.autocommit = False
+        self.closed = 0
+        self.prepared = set()
+        # Index of the prepare statement that fails, if any
+        self.fail_prepare = None
+
+    def cursor(self, cursor_factory=None):
+        return FakeCursor(self)
+
+    def close(self):
+        self.closed = 1
+
+
+@pytest.fixture
+def opened(monkeypatch):
+    connections = []
+
+    def connect(**kwargs):
+        connections.append(FakeConnection())
+        return connections[-1]
+
+    monkeypatch.setattr(pooled.psycopg2, 'connect', connect)
+    return connections
+
+
+def test_returned_connections_stay_open_up_to_maxconn(opened):
+    repo = PooledLoopsRepo(minconn=1, maxconn=4)
+    repo.warm_up(4)
+    assert repo.stats().idle == 4
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        assert all(executor.map(lambda _: repo.check_status('key'), range(64)))
+
+    assert len(opened) == 4
+    assert not any(conn.closed for conn in opened)
+    assert repo.stats().idle == 4
+    assert repo.stats().checked_out == 0
+
+
+def test_new_connection_is_prepared_after_one_was_closed(opened):
+    repo = PooledLoopsRepo(minconn=1, maxconn=1)
+    assert repo.check_status('key')
+    opened[0].close()
+    assert repo.check_status('key')
+
+    assert len(opened) == 2
+    assert opened[1].prepared == {statement.split()[1] for statement in PREPARED_STATEMENTS.values()}
+
+
+def test_broken_connection_is_closed_and_not_reused(opened):
+    repo = PooledLoopsRepo(minconn=1, maxconn=2)
+    with pytest.raises(psycopg2.OperationalError):
+        with repo.connection():
+            raise psycopg2.OperationalError('server closed the connection')
+
+    assert opened[0].closed
+    assert repo.check_status('key')
+    assert len(opened) == 2
+
+
+def test_connection_failing_to_prepare_is_not_reused(opened, monkeypatch):
+    repo = PooledLoopsRepo(minconn=1, maxconn=1)
+
+    def connect(**kwargs):
+        conn = FakeConnection()
+        conn.fail_prepare = 1 if not opened else None
+        opened.append(conn)
+        return conn
+
+    monkeypatch.setattr(pooled.psycopg2, 'connect', connect)
+    with pytest.raises(psycopg2.ProgrammingError):
+        repo.check_status('key')
+    assert opened[0].closed and repo.stats().idle == 0
+
+    assert repo.check_status('key')
+    assert len(opened) == 2
+    assert opened[1].prepared == {statement.split()[1] for statement in PREPARED_STATEMENTS.values()}
@@ -0,0 +1,37 @@
+import random
+
+import pytest
+
+from application.services.scenario_sweep import LoopSweeper, check_scenarios, parse_grid
+from benchmarks.max_flow import synthetic_legs
+
+
+@pytest.mark.parametrize('values, grid', [(None, []), ([1, 2.5], [1.0, 2.5]), ((0,), [0.0])])
+def test_grid_is_read_as_floats(values, grid):
+    assert parse_grid(values, 'amounts') == grid
+
+
+@pytest.mark.parametrize('values', ['1,2', 3, [1, 'two'], [True], [float('nan')], [float('inf')]])
+def test_grid_that_is_no_list_of_numbers_is_rejected(values):
+    with pytest.raises(ValueError, match='amounts'):
+        parse_grid(values, 'amounts')
+
+
+def test_scenarios_are_capped():
+    assert check_scenarios(['USDT', 'USDT', 'BTC'], [1.0] * 3, [0.1] * 2, max_scenarios=10) == 10
+    with pytest.raises(ValueError, match='12 scenarios'):
+        check_scenarios(['USDT', 'BTC'], [1.0] * 3, [0.1] * 3, max_scenarios=10)
+
+
+def test_pool_answers_like_the_calling_process():
+    rnd = random.Random(0)
+    legs = {'USDT': synthetic_legs(rnd, 50), 'BTC': synthetic_legs(rnd, 50)}
+    amounts = [1000.0 * i for i in range(40)]
+    thresholds = [0.01 * i for i in range(40)]
+    sweeper = LoopSweeper(processes=2, chunk_size=16, min_parallel=0)
+    try:
+        # Twice, the second sweep on processes that already mapped the first one's legs
+        for _ in range(2):
+            assert sweeper.run(legs, amounts, thresholds) == LoopSweeper(processes=1).run(legs, amounts, thresholds)
+    finally:
+        sweeper.close()
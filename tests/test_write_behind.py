@@ -0,0 +1,105 @@
+import threading
+from datetime import datetime
+from typing import List
+
+from adapters.repositories.memory import InMemoryLoopsRepo
+from adapters.repositories.write_behind import LoopInfoWriter, WriteBehindLoopsRepo
+from application.dataclasses.common import LoopInfoRecord
+
+
+def _record(loop_id: int) -> LoopInfoRecord:
+    return LoopInfoRecord(loop_id=loop_id, spread=0.1, max_flow=1.0, loop_speed=1.0, added=datetime(2023, 1, 1))
+
+
+class GatedRepo(InMemoryLoopsRepo):
+    """Holds every bulk insert until `gate` is set"""
+
+    def __init__(self):
+        super().__init__()
+        self.gate = threading.Event()
+        self.batches: List[int] = []
+
+    def save_loop_infos(self, records: List[LoopInfoRecord]) -> None:
+        self.gate.wait()
+        self.batches.append(len(records))
+        super().save_loop_infos(records)
+
+
+class FailingRepo(InMemoryLoopsRepo):
+    """Raises on the first `failures` bulk inserts"""
+
+    def __init__(self, failures: int):
+        super().__init__()
+        self.failures = failures
+        self.attempts = 0
+
+    def save_loop_infos(self, records: List[LoopInfoRecord]) -> None:
+        self.attempts += 1
+        if self.attempts <= self.failures:
+            raise ConnectionError('server closed the connection unexpectedly')
+        super().save_loop_infos(records)
+
+
+def test_close_writes_every_pending_row_in_order():
+    repo = GatedRepo()
+    writer = LoopInfoWriter(repo, max_batch=10, flush_interval=60.0, max_queue=1000)
+    for loop_id in range(95):
+        writer.put(_record(loop_id))
+    assert writer.stats().pending > 0
+
+    repo.gate.set()
+    writer.close()
+
+    assert [record.loop_id for record in repo.loop_infos] == list(range(95))
+    assert all(size <= 10 for size in repo.batches)
+    stats = writer.stats()
+    assert (stats.queued, stats.flushed, stats.failed, stats.pending) == (95, 95, 0, 0)
+
+
+def test_decorator_close_flushes_rows_queued_from_many_threads():
+    repo = InMemoryLoopsRepo()
+    write_behind = WriteBehindLoopsRepo(repo, LoopInfoWriter(repo, max_batch=7, flush_interval=60.0))
+
+    def save(first: int) -> None:
+        for loop_id in range(first, first + 50):
+            write_behind.save_loop_info(loop_id, 0.1, 1.0, 1.0, datetime(2023, 1, 1))
+
+    threads = [threading.Thread(target=save, args=(first,)) for first in range(0, 200, 50)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    write_behind.close()
+
+    saved = [record.loop_id for record in repo.loop_infos]
+    assert sorted(saved) == list(range(200))
+    # Each thread's rows keep the order they were saved in
+    for first in range(0, 200, 50):
+        assert [loop_id for loop_id in saved if first <= loop_id < first + 50] == list(range(first, first + 50))
+
+
+def test_failed_insert_is_retried():
+    repo = FailingRepo(failures=2)
+    writer = LoopInfoWriter(repo, max_batch=10, flush_interval=0.01, retries=3)
+    for loop_id in range(5):
+        writer.put(_record(loop_id))
+    writer.close()
+
+    assert [record.loop_id for record in repo.loop_infos] == list(range(5))
+    assert repo.attempts == 3
+    assert (writer.stats().flushed, writer.stats().failed) == (5, 0)
+
+
+def test_batch_is_dropped_after_the_last_retry_and_the_writer_goes_on():
+    repo = FailingRepo(failures=2)
+    writer = LoopInfoWriter(repo, max_batch=10, flush_interval=0.01, retries=1)
+    for loop_id in range(5):
+        writer.put(_record(loop_id))
+    writer.flush()
+    assert repo.loop_infos == []
+    assert writer.stats().failed == 5
+
+    writer.put(_record(5))
+    writer.close()
+    assert [record.loop_id for record in repo.loop_infos] == [5]
+    assert (writer.stats().flushed, writer.stats().failed) == (1, 5)